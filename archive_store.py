@@ -0,0 +1,101 @@
+"""Indexed SQLite store for the scraped news archive
+
+Each article URL is stored once with the time it was first and last seen on
+a listing page. Dedup is an indexed primary-key lookup, each run only
+upserts the links it scraped, and retention pruning is a range delete on
+last_seen, so the cost of a run does not grow with the retention window.
+"""
+import json
+import os
+import sqlite3
+
+from sqlite_params import parameter_chunks
+
+ARCHIVE_DB = "news_archive.db"
+LEGACY_ARCHIVE_JSON = "news_archive.json"
+
+
+def open_archive(path=ARCHIVE_DB, legacy_path=LEGACY_ARCHIVE_JSON):
+    """Open (and create if needed) the archive database, importing the legacy JSON archive once"""
+    is_new = not os.path.exists(path)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS articles (
+            url TEXT PRIMARY KEY,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_first_seen ON articles (first_seen)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_last_seen ON articles (last_seen)")
+    conn.commit()
+    if is_new and legacy_path and os.path.exists(legacy_path):
+        imported = migrate_json_archive(conn, legacy_path)
+        print(f"Migrated {imported} links from {legacy_path} to {path}")
+    return conn
+
+
+def migrate_json_archive(conn, json_path=LEGACY_ARCHIVE_JSON):
+    """Import the entries of a news_archive.json file and return the number of unique links"""
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f).get("entries", [])
+    except Exception as e:
+        print(f"Error reading legacy archive {json_path}: {e}")
+        return 0
+
+    seen = {}
+    for entry in entries:
+        timestamp = entry["timestamp"]
+        for link in entry["news_links"]:
+            first_seen, last_seen = seen.get(link, (timestamp, timestamp))
+            seen[link] = (min(first_seen, timestamp), max(last_seen, timestamp))
+
+    with conn:
+        conn.executemany("""
+            INSERT INTO articles (url, first_seen, last_seen) VALUES (?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen)
+        """, [(link, first_seen, last_seen) for link, (first_seen, last_seen) in seen.items()])
+    return len(seen)
+
+
+def find_known_links(conn, links):
+    """Return the subset of links that are already in the archive"""
+    known = set()
+    for chunk, placeholders in parameter_chunks(links):
+        rows = conn.execute(f"SELECT url FROM articles WHERE url IN ({placeholders})", chunk)
+        known.update(row[0] for row in rows)
+    return known
+
+
+def record_links(conn, links, timestamp):
+    """Add this run's links to the archive, refreshing last_seen for links already known"""
+    with conn:
+        conn.executemany("""
+            INSERT INTO articles (url, first_seen, last_seen) VALUES (?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET last_seen = excluded.last_seen
+        """, [(link, timestamp, timestamp) for link in links])
+
+
+def prune_archive(conn, cutoff):
+    """Delete links not seen since the cutoff ISO timestamp and return how many were removed"""
+    with conn:
+        return conn.execute("DELETE FROM articles WHERE last_seen <= ?", (cutoff,)).rowcount
+
+
+def iter_links(conn):
+    """Yield (url, first_seen, last_seen) for every link in the archive"""
+    return conn.execute("SELECT url, first_seen, last_seen FROM articles")
+
+
+def count_links(conn):
+    """Return the number of links in the archive"""
+    return conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+
+if __name__ == "__main__":
+    conn = open_archive()
+    print(f"{ARCHIVE_DB} holds {count_links(conn)} links")
+    conn.close()
@@ -0,0 +1,94 @@
+"""Token-budget-aware packing of (stock, article) pairs into LLM prompts
+
+A prompt costs a fixed overhead plus one line per stock and one entry per
+article URL. The planner packs the pending pairs two ways and keeps the
+cheaper plan:
+
+- stock-major: group stocks, each batch carries every pending article of its stocks
+- article-major: group articles, each batch carries every stock pending for its articles
+
+Stock-major wins when few stocks have candidates; article-major wins when
+a few articles mention many stocks. Groups whose pairs do not fit one
+prompt (a large run without the prefilter) are split across batches.
+"""
+
+
+def _pack(primaries, secondaries_of, primary_cost, secondary_cost, overhead, budget, max_primary, max_secondary):
+    """Group primaries that share secondaries, then tile each group's secondaries into prompts
+
+    Returns a list of (primaries, secondaries, estimated tokens) batches.
+    """
+    # Group primaries; one whose secondaries are already covered only adds its own line
+    groups = []
+    group, covered, primary_tokens, tokens = [], [], 0, overhead
+    for primary in primaries:
+        seen = set(covered)
+        new = [s for s in secondaries_of[primary] if s not in seen]
+        new_tokens = primary_cost[primary] + sum(secondary_cost[s] for s in new)
+        if new:
+            fits = len(covered) + len(new) <= max_secondary and tokens + new_tokens <= budget
+        else:
+            # Leave at least half of the budget for the secondaries of an oversized group
+            fits = overhead + primary_tokens + primary_cost[primary] <= budget // 2
+        if group and (len(group) >= max_primary or not fits):
+            groups.append((group, covered, primary_tokens))
+            group, covered, primary_tokens, tokens = [], [], 0, overhead
+            new = list(secondaries_of[primary])
+            new_tokens = primary_cost[primary] + sum(secondary_cost[s] for s in new)
+        group.append(primary)
+        covered.extend(new)
+        primary_tokens += primary_cost[primary]
+        tokens += new_tokens
+    if group:
+        groups.append((group, covered, primary_tokens))
+
+    # Split each group's secondaries into chunks that fit the budget (one chunk unless oversized)
+    batches = []
+    for group, covered, primary_tokens in groups:
+        chunk, chunk_tokens = [], overhead + primary_tokens
+        for secondary in covered:
+            if chunk and (chunk_tokens + secondary_cost[secondary] > budget or len(chunk) >= max_secondary):
+                batches.append((group, chunk, chunk_tokens))
+                chunk, chunk_tokens = [], overhead + primary_tokens
+            chunk.append(secondary)
+            chunk_tokens += secondary_cost[secondary]
+        if chunk:
+            batches.append((group, chunk, chunk_tokens))
+    return batches
+
+
+def plan_batches(pending, stocks, count_tokens, overhead_tokens, budget, max_stocks, max_articles):
+    """Pack pending {stock code: [article URLs]} pairs into prompts under a token budget
+
+    Returns (strategy, batches) where each batch is a dict with "stocks" (stock
+    dicts), "articles" (URLs) and "estimated_tokens" for the prompt.
+    """
+    stocks_by_code = {stock["kod"]: stock for stock in stocks}
+    codes = [stock["kod"] for stock in stocks if pending.get(stock["kod"])]
+    articles_of = {code: pending[code] for code in codes}
+    stocks_of = {}
+    for code in codes:
+        for url in pending[code]:
+            stocks_of.setdefault(url, []).append(code)
+
+    stock_cost = {code: count_tokens(f'{code} - {stocks_by_code[code]["adi"]}, ') for code in codes}
+    article_cost = {url: count_tokens(repr(url) + ", ") for url in stocks_of}
+
+    plans = {
+        "stock-major": _pack(codes, articles_of, stock_cost, article_cost, overhead_tokens, budget, max_stocks, max_articles),
+        "article-major": [
+            (batch_codes, urls, tokens) for urls, batch_codes, tokens in
+            _pack(list(stocks_of), stocks_of, article_cost, stock_cost, overhead_tokens, budget, max_articles, max_stocks)
+        ],
+    }
+    strategy = min(plans, key=lambda name: (sum(tokens for _, _, tokens in plans[name]), len(plans[name])))
+
+    order = {code: i for i, code in enumerate(codes)}
+    batches = []
+    for batch_codes, urls, tokens in plans[strategy]:
+        batches.append({
+            "stocks": [stocks_by_code[code] for code in sorted(batch_codes, key=order.get)],
+            "articles": sorted(urls),
+            "estimated_tokens": tokens
+        })
+    return strategy, batches
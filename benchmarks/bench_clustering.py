@@ -0,0 +1,70 @@
+"""Near-duplicate story clustering over the runs recorded in news_archive.json
+
+Replays the archived runs in order (30 minutes apart) through the cluster
+store, as the scraper would, and reports how many new articles were
+duplicates of a story from another outlet, how many (article, stock)
+candidate pairs and LLM-bound articles that removes (stories are prefiltered
+on the slugs of all their articles, and analyzed through an article that
+names a stock), the clustering time, and the clusters found, for eyeballing
+false merges.
+
+Usage: python -m benchmarks.bench_clustering [--threshold 0.5] [--window-hours 6] [--quiet]
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import news_scraper
+import story_clusters
+from stock_matcher import archived_runs
+from stock_universe import load_stock_universe
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threshold", type=float, default=story_clusters.CLUSTER_SIMILARITY)
+    parser.add_argument("--window-hours", type=float, default=story_clusters.CLUSTER_WINDOW_HOURS)
+    parser.add_argument("--quiet", action="store_true", help="do not list the clusters")
+    args = parser.parse_args()
+
+    runs = archived_runs()
+    matcher = load_stock_universe().get_matcher()
+    conn = story_clusters.open_clusters(":memory:")
+    clusters = {}
+    articles = analyzed = pairs_before = pairs_after = switched = 0
+    elapsed = 0.0
+    for i, run in enumerate(runs):
+        start = time.perf_counter()
+        representatives, siblings, absorbed = story_clusters.assign_clusters(
+            conn, run, now=i * 1800.0, threshold=args.threshold, window_hours=args.window_hours)
+        representatives, siblings, moved = news_scraper.prefer_matched_representatives(
+            matcher, representatives, siblings)
+        story_clusters.move_representatives(conn, moved)
+        elapsed += time.perf_counter() - start
+        articles += len(run)
+        analyzed += len(representatives)
+        switched += len(moved)
+        pairs_before += sum(map(len, matcher.candidates(run).values()))
+        pairs_after += sum(map(len, news_scraper.story_candidates(matcher, representatives, siblings).values()))
+        for representative, urls in siblings.items():
+            clusters.setdefault(representative, []).extend(urls)
+        for url, representative in absorbed.items():
+            clusters.setdefault(representative, []).append(url)
+
+    duplicates = articles - analyzed
+    print(f"{len(runs)} runs, {articles} new articles: {duplicates} duplicates in {len(clusters)} clusters "
+          f"({duplicates / max(articles, 1):.1%}), clustered in {elapsed * 1000:.0f} ms")
+    print(f"articles sent to analysis: {articles} -> {analyzed}; "
+          f"candidate (article, stock) pairs: {pairs_before} -> {pairs_after}; "
+          f"{switched} stories analyzed through a sibling that names a stock")
+    if not args.quiet:
+        for representative, urls in clusters.items():
+            print(representative)
+            for url in urls:
+                print(f"    {url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Listing pages vs. RSS feeds vs. news sitemaps as discovery sources, against local stand-ins
+
+Every source serves its listing-page fixture, an RSS feed and a Google News
+sitemap with the same article links (published ten minutes apart, newest
+first). Each adapter is polled twice without HTTP validators: a cold poll,
+and a poll after --new-items fresh articles were published, where the feed
+adapters stop reading at the first stale items. Reports bytes read, time per
+poll and the links found, and checks that every adapter finds all the
+archived articles on a cold poll.
+
+Usage: python -m benchmarks.bench_discovery [--repeat 5] [--new-items 3]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import news_scraper
+from benchmarks.fixtures import SOURCE_HOSTS, archived_links, load_fixture, synthetic_feed
+from benchmarks.stubs import serve_pages
+from discovery import ADAPTERS, discover_links
+
+
+def serve_source_documents(new_items):
+    """Serve each source's listing page, feed and sitemap, before and after new_items new articles"""
+    links = archived_links()
+    newest = datetime(2025, 3, 4, 10, 0)
+    pages = {}
+    for source in SOURCE_HOSTS:
+        pages[f"/{source}/html"] = pages[f"/{source}/html-later"] = load_fixture(source)
+        fresh = [f"https://{SOURCE_HOSTS[source]}/ekonomi/yeni-haber-{source}-{i}-{9000 + i}" for i in range(new_items)]
+        for kind in ("feed", "sitemap"):
+            pages[f"/{source}/{kind}"] = synthetic_feed(source, links[source], kind, newest)
+            pages[f"/{source}/{kind}-later"] = synthetic_feed(
+                source, fresh + links[source], kind, newest + timedelta(minutes=10 * new_items))
+    return serve_pages(pages)
+
+
+def poll_sources(kind, base_url, later):
+    """Poll every source with one adapter kind; returns (bytes read, seconds, links per source)
+
+    With later, each source is polled once and then polled again, with the
+    same cache entry minus its validators, after the new articles came out.
+    """
+    total_bytes, elapsed, links = 0, 0.0, {}
+    for source in SOURCE_HOSTS:
+        adapter = ADAPTERS[kind](source, f"{base_url}/{source}/{kind}")
+        entry = {}
+        if later:
+            discover_links([adapter], {adapter.url: entry}, news_scraper.get_website_response)
+            entry.pop("etag", None)
+            entry.pop("last_modified", None)
+            adapter.url += "-later"
+        start = time.perf_counter()
+        result = discover_links([adapter], {adapter.url: entry}, news_scraper.get_website_response)
+        elapsed += time.perf_counter() - start
+        total_bytes += result["bytes_downloaded"]
+        links[source] = set(result["links"])
+    return total_bytes, elapsed, links
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="polls per measurement; medians are reported")
+    parser.add_argument("--new-items", type=int, default=3, help="articles published between the two polls")
+    args = parser.parse_args()
+
+    server, base_url = serve_source_documents(args.new_items)
+    articles = archived_links()
+    try:
+        print(f"{'adapter':>8} {'poll':>6} {'KB read':>8} {'ms/poll':>8} {'links':>6} {'missed':>6}")
+        for kind in ("html", "feed", "sitemap"):
+            for label, later in (("cold", False), ("next", True)):
+                runs = [poll_sources(kind, base_url, later) for _ in range(args.repeat)]
+                total_bytes, _, links = runs[-1]
+                median = sorted(elapsed for _, elapsed, _ in runs)[len(runs) // 2]
+                missed = "-" if later else sum(len(set(articles[source]) - links[source]) for source in SOURCE_HOSTS)
+                print(f"{kind:>8} {label:>6} {total_bytes / 1024:>8.1f} {median / len(SOURCE_HOSTS) * 1000:>8.2f} "
+                      f"{sum(map(len, links.values())):>6} {missed:>6}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
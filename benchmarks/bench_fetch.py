@@ -0,0 +1,54 @@
+"""Compare sequential and pooled concurrent listing-page fetching against local stand-ins
+
+Exits non-zero if the two fetch different pages or miss any.
+
+Usage: python -m benchmarks.bench_fetch [--latency 0.5]
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import news_scraper
+from benchmarks.stubs import serve_pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.5, help="base per-page latency in seconds")
+    args = parser.parse_args()
+
+    # One stand-in host per source, each slower than the previous one
+    servers = []
+    urls = []
+    slowest = 0.0
+    for i, name in enumerate(news_scraper.NEWS_SOURCES):
+        delay = args.latency * (1 + i * 0.25)
+        page = f"<html><body><a href='/{name}-1'>{name}</a></body></html>"
+        server, base_url = serve_pages({f"/{name}/": page}, default_latency=delay)
+        servers.append(server)
+        urls.append(f"{base_url}/{name}/")
+        slowest = max(slowest, delay)
+
+    try:
+        pages = {}
+        for label, workers in (("sequential", 1), ("concurrent", news_scraper.SCRAPER_MAX_WORKERS)):
+            start = time.perf_counter()
+            pages[label] = news_scraper.fetch_pages(urls, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            fetched = sum(1 for html in pages[label].values() if html)
+            print(f"{label:>10}: {elapsed:.2f}s for {fetched}/{len(urls)} pages")
+        print(f"slowest single source: {slowest:.2f}s")
+        if pages["sequential"] != pages["concurrent"]:
+            raise SystemExit("the concurrent fetch returned different pages than the sequential one")
+        if not all(pages["concurrent"].get(url) for url in urls):
+            raise SystemExit("some pages were not fetched")
+        print("Both fetched the same pages")
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Parity check and micro-benchmark of link_extractor against the BeautifulSoup selectors
+
+Usage: python -m benchmarks.bench_link_extraction [--repeat 20]
+"""
+import argparse
+import re
+import time
+import tracemalloc
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from benchmarks.fixtures import load_fixtures
+from link_extractor import extract_links
+
+
+def soup_links(source, html):
+    """The original BeautifulSoup selectors from scrape_economy_news"""
+    soup = BeautifulSoup(html, 'html.parser')
+    links = set()
+    if source == "haberturk":
+        for link in soup.find_all('a', {'data-newscategory': 'Ekonomi'}, class_="block gtm-tracker", href=True):
+            links.add(urljoin("https://www.haberturk.com", link['href']))
+    elif source == "trthaber":
+        for link in soup.find_all('a', class_="site-url", href=True):
+            if link['href'].startswith("https://www.trthaber.com/haber/ekonomi/") and link['href'].endswith(".html"):
+                links.add(link['href'])
+    elif source == "cnnhaber":
+        for link in soup.find_all('a', class_="navigate", href=True):
+            if link['href'].startswith("/ekonomi/"):
+                links.add(urljoin("https://www.cnnturk.com", link['href']))
+    elif source == "bloomberght":
+        for link in soup.find_all('a', href=True):
+            if re.search(r'\d$', link['href']):
+                links.add(urljoin("https://www.bloomberght.com", link['href']))
+    elif source == "bigpara":
+        for link in soup.find_all('a', {'data-query-param': "bpc", 'href': True}):
+            if link['href'].startswith("/haberler/ekonomi-haberleri/"):
+                links.add(urljoin("https://bigpara.hurriyet.com.tr", link['href']))
+    return links
+
+
+def measure(func, source, html, repeat):
+    """Return (best seconds per call, peak traced bytes) for one extractor on one page"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(source, html)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(source, html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'source':<12}{'links':>6}{'kB':>7}{'soup ms':>10}{'fast ms':>10}{'soup peak kB':>14}{'fast peak kB':>14}")
+    for source, html in load_fixtures().items():
+        expected = soup_links(source, html)
+        actual = extract_links(source, html)
+        if expected != actual:
+            mismatches += 1
+            print(f"PARITY MISMATCH for {source}: only soup {sorted(expected - actual)}, only fast {sorted(actual - expected)}")
+        soup_time, soup_peak = measure(soup_links, source, html, args.repeat)
+        fast_time, fast_peak = measure(extract_links, source, html, args.repeat)
+        print(f"{source:<12}{len(actual):>6}{len(html) / 1024:>7.0f}{soup_time * 1000:>10.2f}{fast_time * 1000:>10.2f}"
+              f"{soup_peak / 1024:>14.0f}{fast_peak / 1024:>14.0f}")
+    if mismatches:
+        raise SystemExit(f"{mismatches} source(s) differ from the BeautifulSoup selectors")
+    print("All sources match the BeautifulSoup selectors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Sequential vs concurrent LLM batch dispatch against a local fake OpenAI server
+
+Exits non-zero if a batch fails or the two dispatches confirm different hits.
+
+Usage: python -m benchmarks.bench_llm_dispatch [--batches 13] [--latency 0.5] [--rps 4] [--garbage 0.1]
+"""
+import argparse
+import os
+import time
+
+from benchmarks.stubs import serve_fake_openai
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=13)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--rps", type=int, default=4, help="requests per second before the server answers 429")
+    parser.add_argument("--garbage", type=float, default=0.1, help="fraction of non-JSON answers")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    server, base_url = serve_fake_openai(args.latency, args.rps, args.garbage)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    import news_scraper
+    from llm_dispatch import TokenRateLimiter, dispatch_batches
+
+    stocks = [{"kod": f"STK{i:02d}", "adi": f"STOCK {i}"} for i in range(args.batches * 10)]
+    articles = [f"https://example.com/ekonomi/stk{i:02d}-haberi-{1000000 + i}" for i in range(0, len(stocks), 7)]
+    jobs = [{"stocks": batch, "prompt": news_scraper.build_llm_prompt(batch, articles)}
+            for batch in news_scraper.create_stock_batches(stocks, n=10)]
+    send = lambda job: news_scraper.parse_llm_result(news_scraper.call_llm(job["prompt"]))
+
+    try:
+        results = {}
+        for label, concurrency in (("sequential", 1), ("concurrent", args.concurrency)):
+            requests_before, limited_before = server.request_count, server.rate_limited
+            start = time.perf_counter()
+            outcomes = dispatch_batches(jobs, send, max_concurrency=concurrency,
+                                        limiter=TokenRateLimiter(news_scraper.LLM_TOKENS_PER_MINUTE),
+                                        backoff_base=0.25)
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for outcome in outcomes if outcome["error"])
+            hits = sorted((item["hisse_kodu"], item["haber_url"]) for outcome in outcomes if outcome["result"]
+                          for item in news_scraper.confirmed_hits(outcome["result"]))
+            results[label] = (failed, hits)
+            print(f"{label:>10}: {elapsed:.2f}s, {len(jobs) - failed}/{len(jobs)} batches ok, {len(hits)} hits, "
+                  f"{server.request_count - requests_before} requests ({server.rate_limited - limited_before} rate-limited)")
+        if any(failed for failed, _ in results.values()):
+            raise SystemExit("some batches failed after all their retries")
+        if results["sequential"] != results["concurrent"]:
+            raise SystemExit("the concurrent dispatch confirmed different hits than the sequential one")
+        print("Both dispatches confirmed the same hits")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Per-delivery vs bulk Supabase access and single vs digest messages in the notification service
+
+Runs against a local PostgREST stand-in and a mock Graph API. Exits
+non-zero if the bulk or digest path records or delivers a different set of
+alerts than the per-delivery path.
+
+Usage: python -m benchmarks.bench_notifications [--users 300] [--stocks 20] [--news 3] [--rate 100] [--digest-items 5]
+"""
+import argparse
+import copy
+import os
+import random
+import re
+import tempfile
+import time
+
+from benchmarks.stubs import serve_fake_graph_api, serve_fake_postgrest
+
+URL = re.compile(r"https?://[^\s|]+")
+
+
+def build_tables(users, stocks, news_per_stock, subscriptions_per_user, sent_fraction, seed=1):
+    """Return (tables, stock_news) with random subscriptions and part of the deliveries already sent"""
+    rng = random.Random(seed)
+    codes = [f"STK{i:02d}" for i in range(stocks)]
+    stock_news = {
+        code: {"sirket_adi": f"STOCK {i}", "haberler": [f"https://example.com/ekonomi/{code.lower()}-haber-{n}"
+                                                         for n in range(news_per_stock)]}
+        for i, code in enumerate(codes)
+    }
+    tables = {
+        "users": [{"id": i + 1, "phone_number": f"90555{i:07d}"} for i in range(users)],
+        "user_stock_subscriptions": [],
+        "sent_notifications": []
+    }
+    for user in tables["users"]:
+        for code in rng.sample(codes, subscriptions_per_user):
+            tables["user_stock_subscriptions"].append({"user_id": user["id"], "stock_kod": code})
+            for url in stock_news[code]["haberler"]:
+                if rng.random() < sent_fraction:
+                    tables["sent_notifications"].append({
+                        "id": len(tables["sent_notifications"]) + 1, "user_id": user["id"], "stock_kod": code,
+                        "news_url": url, "status": "sent", "whatsapp_message_id": "wamid.seed"
+                    })
+    return tables, stock_news
+
+
+def per_delivery_process(ns, stock_news):
+    """The previous flow: one subscription query per stock, one check and one insert per delivery"""
+    supabase = ns.get_supabase()
+    for stock_kod, stock_data in stock_news.items():
+        response = supabase.table("user_stock_subscriptions").select("users(id, phone_number)")\
+            .eq("stock_kod", stock_kod).execute()
+        users = [item["users"] for item in response.data if item.get("users")]
+        for news_url in stock_data["haberler"]:
+            for user in users:
+                sent = supabase.table("sent_notifications").select("id").eq("user_id", user["id"])\
+                    .eq("stock_kod", stock_kod).eq("news_url", news_url).execute()
+                if sent.data:
+                    continue
+                message_id = ns.post_whatsapp_payload(
+                    ns.build_whatsapp_payload(user["phone_number"], stock_kod, stock_data["sirket_adi"], news_url)
+                )
+                supabase.table("sent_notifications").insert({
+                    "user_id": user["id"], "stock_kod": stock_kod, "news_url": news_url,
+                    "status": "sent", "whatsapp_message_id": message_id
+                }).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--stocks", type=int, default=20)
+    parser.add_argument("--news", type=int, default=3, help="news articles per stock")
+    parser.add_argument("--subscriptions", type=int, default=4, help="stocks followed per user")
+    parser.add_argument("--sent", type=float, default=0.3, help="fraction of deliveries already sent")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per PostgREST request")
+    parser.add_argument("--rate", type=int, default=100, help="WhatsApp messages per second for the outbox runs")
+    parser.add_argument("--digest-items", type=int, default=5, help="maximum alerts per digest message")
+    args = parser.parse_args()
+
+    graph, graph_url = serve_fake_graph_api(latency=0.0)
+    os.environ["WHATSAPP_API_URL"] = graph_url
+    os.environ["WHATSAPP_MESSAGES_PER_SECOND"] = str(args.rate)
+    os.environ["WHATSAPP_BURST"] = str(args.rate)
+    os.environ.setdefault("WHATSAPP_PHONE_NUMBER_ID", "1000000000")
+    os.environ.setdefault("SUPABASE_KEY", "offline-benchmark")
+    workdir = tempfile.mkdtemp(prefix="notifications-bench-")
+    tables, stock_news = build_tables(args.users, args.stocks, args.news, args.subscriptions, args.sent)
+    seeded = len(tables["sent_notifications"])
+    servers = [graph]
+    try:
+        results, delivered = {}, {}
+        for label in ("per-delivery", "bulk", "digest"):
+            server, base_url = serve_fake_postgrest(copy.deepcopy(tables), latency=args.latency)
+            servers.append(server)
+            os.environ["SUPABASE_URL"] = base_url
+            import notification_service as ns
+            ns.SUPABASE_URL, ns._supabase = base_url, None  # a fresh client for this run's stand-in
+            ns.load_stock_news_mapping = lambda: {"timestamp": "2025-03-04T10:00:00", "updated": True, "delta": stock_news,
+                                                      "stock_news": stock_news}
+            ns.OUTBOX_DB = os.path.join(workdir, f"{label}.db")
+            ns.DIGEST_MAX_ITEMS = args.digest_items if label == "digest" else 1
+
+            graph.delivered = []
+            start = time.perf_counter()
+            if label == "per-delivery":
+                per_delivery_process(ns, stock_news)
+            else:
+                ns.process_notifications()
+            elapsed = time.perf_counter() - start
+            records = server.RequestHandlerClass.tables["sent_notifications"][seeded:]
+            results[label] = sorted((str(row["user_id"]), row["stock_kod"], row["news_url"]) for row in records)
+            delivered[label] = sorted((to, url) for to, texts in graph.delivered for url in URL.findall(" ".join(texts)))
+            breakdown = ", ".join(f"{key}: {count}" for key, count in sorted(server.requests.items()))
+            print(f"{label:>12}: {elapsed:.2f}s, {len(records)} alerts in {len(graph.delivered)} WhatsApp calls, "
+                  f"{server.request_count} Supabase requests ({breakdown})")
+        same_records = results["per-delivery"] == results["bulk"] == results["digest"]
+        same_delivered = delivered["per-delivery"] == delivered["bulk"] == delivered["digest"]
+        print(f"Same sent records: {same_records}, same delivered alerts: {same_delivered}")
+        if not same_records or not same_delivered:
+            raise SystemExit("the bulk and digest paths differ from the per-delivery path")
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Parallel, restartable outbox draining: kill the workers mid-run, restart them, check every alert went out once
+
+Exits non-zero if an alert was delivered twice or out of order for its
+recipient, if the restarted workers left deliveries unfinished or failed any
+that were not interrupted in flight, or if the sent rows do not match what
+the mock API delivered.
+
+Usage: python -m benchmarks.bench_outbox [--messages 600] [--recipients 60] [--workers 3] [--kill-after 3.5]
+"""
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stubs import serve_fake_graph_api, serve_fake_postgrest
+
+URL = re.compile(r"https?://[^\s|]+")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_workers(count, env):
+    """Start drain-only notification service processes"""
+    return [subprocess.Popen([sys.executable, "notification_service.py", "--drain-only"], cwd=ROOT, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=600)
+    parser.add_argument("--recipients", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--kill-after", type=float, default=3.5, help="seconds before the first workers are killed")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per mock API call")
+    parser.add_argument("--rate", type=int, default=30, help="messages per second per worker")
+    parser.add_argument("--digest-items", type=int, default=2, help="maximum alerts per digest message")
+    args = parser.parse_args()
+
+    graph, graph_url = serve_fake_graph_api(latency=args.latency)
+    postgrest, postgrest_url = serve_fake_postgrest({"sent_notifications": []})
+    workdir = tempfile.mkdtemp(prefix="outbox-bench-")
+    env = dict(os.environ, OUTBOX_DB=os.path.join(workdir, "outbox.db"), WHATSAPP_API_URL=graph_url,
+               WHATSAPP_PHONE_NUMBER_ID="1000000000", WHATSAPP_API_TOKEN="offline-benchmark",
+               SUPABASE_URL=postgrest_url, SUPABASE_KEY="offline-benchmark",
+               WHATSAPP_MESSAGES_PER_SECOND=str(args.rate), WHATSAPP_BURST=str(args.rate),
+               DIGEST_MAX_ITEMS=str(args.digest_items))
+    os.environ.update(env)
+    import notification_outbox as outbox
+    import notification_service as ns
+
+    conn = outbox.open_outbox(env["OUTBOX_DB"])
+    planned = {}
+    entries = []
+    for i in range(args.messages):
+        phone = f"90555{i % args.recipients:07d}"
+        url = f"https://example.com/haber-{i}"
+        planned.setdefault(phone, []).append(url)
+        entries.append({"user_id": i % args.recipients, "stock_kod": "THYAO", "news_url": url, "phone_number": phone,
+                        "payload": ns.build_whatsapp_payload(phone, "THYAO", "TURK HAVA YOLLARI", url)})
+    added = outbox.enqueue(conn, entries)
+    print(f"Queued {added} alerts; queueing them again added {outbox.enqueue(conn, entries)}")
+
+    try:
+        start = time.perf_counter()
+        workers = start_workers(args.workers, env)
+        time.sleep(args.kill_after)
+        for worker in workers:
+            worker.send_signal(signal.SIGKILL)
+            worker.wait()
+        killed_counts = outbox.state_counts(conn)
+        print(f"Killed {args.workers} workers after {args.kill_after:.1f}s: {killed_counts}")
+
+        # Restart after the lease expired, as the next scheduled run would; the
+        # lease covers claimed deliveries and the sent_notifications writes in progress
+        with conn:
+            conn.execute("""
+                UPDATE outbox SET claimed_at = claimed_at - ?, updated_at = updated_at - ?
+                WHERE state = ? OR recorded < 0
+            """, (ns.OUTBOX_LEASE_SECONDS, ns.OUTBOX_LEASE_SECONDS, outbox.IN_FLIGHT))
+        for worker in start_workers(args.workers, env):
+            worker.wait()
+        elapsed = time.perf_counter() - start
+        counts = outbox.state_counts(conn)
+
+        delivered = [(to, url) for to, texts in graph.delivered for url in URL.findall(" ".join(texts))]
+        received = {}
+        for to, url in delivered:
+            received.setdefault(to, []).append(url)
+        in_order = all(received.get(to, []) == [url for url in urls if url in received.get(to, [])]
+                       for to, urls in planned.items())
+        recorded = conn.execute("SELECT COUNT(*) FROM outbox WHERE recorded = 1").fetchone()[0]
+        print(f"Drained in {elapsed:.2f}s: {counts}")
+        print(f"Delivered {len(set(delivered))} unique alerts in {len(graph.delivered)} messages, {len(delivered) - len(set(delivered))} duplicates, "
+              f"per-recipient order kept: {in_order}")
+        print(f"sent_notifications rows: {len(postgrest.RequestHandlerClass.tables['sent_notifications'])}, "
+              f"outbox rows recorded: {recorded}")
+
+        sent_rows = set(conn.execute("SELECT phone_number, news_url FROM outbox WHERE state = ?", (outbox.SENT,)))
+        # A delivery interrupted in flight may or may not have gone out; it is failed, never resent
+        interrupted = set(conn.execute("""
+            SELECT phone_number, news_url FROM outbox WHERE state = ? AND error = 'Interrupted while in flight'
+        """, (outbox.FAILED,)))
+        other_failures = counts.get(outbox.FAILED, 0) - len(interrupted)
+        problems = []
+        if len(delivered) != len(set(delivered)):
+            problems.append(f"{len(delivered) - len(set(delivered))} alerts delivered more than once")
+        if not in_order:
+            problems.append("a recipient received its alerts out of order")
+        if killed_counts.get(outbox.PENDING) and counts.get(outbox.SENT, 0) <= killed_counts.get(outbox.SENT, 0):
+            problems.append("the restarted workers did not resume the pending deliveries")
+        if set(counts) - {outbox.SENT, outbox.FAILED}:
+            problems.append(f"the restarted workers left deliveries unfinished: {counts}")
+        if other_failures:
+            problems.append(f"{other_failures} deliveries failed without being interrupted")
+        if sent_rows - set(delivered):
+            problems.append(f"{len(sent_rows - set(delivered))} alerts marked sent were never delivered")
+        if set(delivered) - sent_rows - interrupted:
+            problems.append(f"{len(set(delivered) - sent_rows - interrupted)} delivered alerts are not marked sent")
+        if recorded != added:
+            problems.append(f"{added - recorded} finished deliveries were not recorded")
+        if problems:
+            raise SystemExit("; ".join(problems))
+        print("Every alert was delivered at most once, in order, and the restart resumed the rest")
+    finally:
+        conn.close()
+        graph.shutdown()
+        postgrest.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""End-to-end pipeline benchmark at synthetic scales, writing machine-readable results
+
+Runs news_scraper.main() against listing pages served locally and a fake
+OpenAI server, and process_notifications against a PostgREST stand-in and a
+mock Graph API, all offline. Each scenario runs in a fresh interpreter in a
+scratch directory and reports exclusive per-stage timings, throughput and
+peak RSS:
+
+- pipeline: BASE_ARTICLES new articles per run times each --scales factor,
+  over an archive pre-filled with --archive-hours of links at the base rate
+- notifications: --subscribers users following SUBSCRIPTIONS_PER_USER stocks
+  each, alerted about the stocks and news of a mapping delta
+
+Results go to --output (JSON, with the commit and Python version); pass an
+earlier file as --compare to print the change per scenario.
+
+Usage: python -m benchmarks.bench_pipeline [--scales 1 10 100] [--archive-hours 24 720]
+           [--subscribers 1000 10000 100000] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import SOURCE_HOSTS, archived_links, synthetic_page
+from benchmarks.stubs import serve_fake_graph_api, serve_fake_openai, serve_fake_postgrest, serve_pages
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+BASE_ARTICLES = 50  # new articles per run over all sources, about a 10-minute cron run
+RUNS_PER_HOUR = 6
+PAGE_SIZE = 40  # links on a listing page, filled up with already archived ones
+STOCK_HIT_RATE = 0.2  # share of article slugs that name a stock
+SUBSCRIPTIONS_PER_USER = 3
+DELTA_STOCKS = 20
+DELTA_NEWS_PER_STOCK = 2
+
+URL_TEMPLATES = {
+    "haberturk": "https://www.haberturk.com/{slug}-{id}-ekonomi",
+    "trthaber": "https://www.trthaber.com/haber/ekonomi/{slug}-{id}.html",
+    "cnnhaber": "https://www.cnnturk.com/ekonomi/{slug}-{id}",
+    "bloomberght": "https://www.bloomberght.com/{slug}-{id}",
+    "bigpara": "https://bigpara.hurriyet.com.tr/haberler/ekonomi-haberleri/{slug}_ID{id}/",
+}
+FALLBACK_WORDS = ["piyasa", "borsa", "dolar", "faiz", "enflasyon", "ihracat", "yatirim", "kredi", "banka",
+                  "rekor", "artis", "dusus", "karar", "merkez", "butce", "vergi", "petrol", "altin"]
+
+PIPELINE_STAGES = {
+    "scrape": ["scrape_economy_news"],
+    "dedup": ["identify_new_articles"],
+    "archive": ["record_links", "clean_old_entries"],
+    "seen_set": ["load_seen_articles", "update_seen_articles"],
+    "analysis": ["analyze_news_for_stocks"],
+    "mapping": ["load_stock_news_history", "merge_stock_news", "prune_stock_news_history", "save_stock_news_mapping"],
+}
+NOTIFICATION_STAGES = {
+    "subscribers": ["get_subscribers"],
+    "sent_history": ["get_sent_keys"],
+    "plan": ["plan_deliveries"],
+    "enqueue": ["outbox.enqueue"],
+    "claim": ["outbox.claim_batch"],
+    "coalesce": ["coalesce_deliveries"],
+    "send": ["dispatch_messages"],
+    "sync": ["sync_sent_records"],
+}
+
+
+class StageTimer:
+    """Wraps functions to accumulate exclusive wall time per stage (nested stages are not double counted)"""
+
+    def __init__(self):
+        self.totals = {}
+        self.stack = []
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self.stack.pop()
+                self.totals[stage] = self.totals.get(stage, 0.0) + elapsed - nested
+                if self.stack:
+                    self.stack[-1] += elapsed
+        return timed
+
+    def install(self, module, stages):
+        """Replace module attributes ("name" or "submodule.name") with timed wrappers"""
+        for stage, names in stages.items():
+            for name in names:
+                owner = module
+                *path, attribute = name.split(".")
+                for part in path:
+                    owner = getattr(owner, part)
+                setattr(owner, attribute, self.wrap(stage, getattr(owner, attribute)))
+
+
+def slug_vocabulary():
+    """Words from the slugs of archived article URLs, so synthetic URLs read like real ones"""
+    from stock_matcher import url_slug_text
+
+    words = sorted({word for links in archived_links(os.path.join(ROOT, "news_archive.json")).values()
+                    for link in links for word in url_slug_text(link).split() if len(word) > 3})
+    return words or FALLBACK_WORDS
+
+
+def article_url(source, i, words, stock_codes):
+    """Return the i-th synthetic article URL of a source (the same for a given i on every call)"""
+    rng = random.Random(f"{source}-{i}")
+    slug = rng.sample(words, min(5, len(words)))
+    if rng.random() < STOCK_HIT_RATE:
+        slug.insert(0, rng.choice(stock_codes).lower())
+    return URL_TEMPLATES[source].format(slug="-".join(slug), id=3000000 + i)
+
+
+def stock_codes():
+    from stock_universe import read_stocks_csv
+
+    return [stock["kod"] for stock in read_stocks_csv(os.path.join(ROOT, "bist_100_hisseleri.csv"))]
+
+
+def archived_per_source(archive_hours):
+    """Links per source already in the archive: the base article rate over the window"""
+    return BASE_ARTICLES // len(SOURCE_HOSTS) * RUNS_PER_HOUR * archive_hours
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def child_setup(options):
+    """Fill the scratch directory's archive and seen-set with the links of the archive window"""
+    import news_scraper
+
+    words, codes = slug_vocabulary(), stock_codes()
+    per_hour = BASE_ARTICLES // len(SOURCE_HOSTS) * RUNS_PER_HOUR
+    now = datetime.utcnow()
+    archive = news_scraper.open_archive()
+    for hour in range(options.archive_hours):
+        timestamp = (now - timedelta(hours=options.archive_hours - hour - 0.5)).isoformat()
+        for source in SOURCE_HOSTS:
+            news_scraper.record_links(archive, [article_url(source, i, words, codes)
+                                                for i in range(hour * per_hour, (hour + 1) * per_hour)], timestamp)
+    seen_articles = news_scraper.load_seen_articles(archive)
+    archive.close()
+    news_scraper.update_seen_articles(seen_articles, [])
+    return {}
+
+
+def child_pipeline(options):
+    """Run one scraper cycle and return its stage timings"""
+    import archive_store
+    import news_scraper
+    import results_log
+
+    news_scraper.NEWS_SOURCES = {source: f"{options.pages_url}/{source}/" for source in SOURCE_HOSTS}
+    news_scraper.NEWS_FEEDS = {}  # listing pages only, comparable with the earlier results
+    timer = StageTimer()
+    timer.install(news_scraper, PIPELINE_STAGES)
+    start = time.perf_counter()
+    news_scraper.main()
+    elapsed = time.perf_counter() - start
+
+    with open("new_articles.json", "r", encoding="utf-8") as f:
+        new_articles = len(json.load(f)["new_articles"])
+    hits = sum(1 for _ in results_log.query())
+    archive = archive_store.open_archive()
+    archive_rows = archive_store.count_links(archive)
+    archive.close()
+    return {"seconds": elapsed, "stages": timer.totals, "new_articles": new_articles, "hits": hits,
+            "archive_rows": archive_rows, "articles_per_second": new_articles / elapsed}
+
+
+def child_notifications(options):
+    """Run one notification pass and return its stage timings"""
+    import notification_outbox
+    import notification_service
+
+    timer = StageTimer()
+    timer.install(notification_service, NOTIFICATION_STAGES)
+    start = time.perf_counter()
+    notification_service.process_notifications()
+    elapsed = time.perf_counter() - start
+
+    conn = notification_outbox.open_outbox(notification_service.OUTBOX_DB)
+    deliveries = sum(notification_outbox.state_counts(conn).values())
+    conn.close()
+    return {"seconds": elapsed, "stages": timer.totals, "deliveries": deliveries,
+            "deliveries_per_second": deliveries / elapsed}
+
+
+CHILDREN = {"setup": child_setup, "pipeline": child_pipeline, "notifications": child_notifications}
+
+
+def run_child(kind, workdir, env, **options):
+    """Run a scenario step in a fresh interpreter in workdir and return its result dict"""
+    args = [sys.executable, "-m", "benchmarks.bench_pipeline", "--child", kind, "--workdir", workdir]
+    for name, value in options.items():
+        args += [f"--{name.replace('_', '-')}", str(value)]
+    with open(os.path.join(workdir, f"{kind}.log"), "w", encoding="utf-8") as log:
+        subprocess.run(args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+    with open(os.path.join(workdir, f"{kind}.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def scratch_dir(prefix):
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    for name in ("bist_100_hisseleri.csv", "stock_aliases.json"):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    return workdir
+
+
+def pipeline_scenario(scale, archive_hours, llm_latency):
+    """Run the scraper at scale times the base article volume over an archive window"""
+    words, codes = slug_vocabulary(), stock_codes()
+    workdir = scratch_dir("pipeline-bench-")
+    archived = archived_per_source(archive_hours)
+    new_per_source = BASE_ARTICLES // len(SOURCE_HOSTS) * scale
+    pages = {}
+    for source in SOURCE_HOSTS:
+        new = [article_url(source, archived + i, words, codes) for i in range(new_per_source)]
+        recent = [article_url(source, i, words, codes)
+                  for i in range(max(0, archived - max(0, PAGE_SIZE - new_per_source)), archived)]
+        pages[f"/{source}/"] = synthetic_page(source, new + recent)
+
+    page_server, pages_url = serve_pages(pages)
+    llm_server, llm_url = serve_fake_openai(latency=llm_latency)
+    env = dict(os.environ, OPENAI_API_KEY="offline-benchmark", OPENAI_BASE_URL=llm_url, POLL_SCHEDULING="0",
+               ARCHIVE_RETENTION_HOURS=str(archive_hours + 1), RUN_DEADLINE_SECONDS="3600",
+               LLM_TOKENS_PER_MINUTE="5000000", PYTHONPATH=ROOT)
+    try:
+        run_child("setup", workdir, env, archive_hours=archive_hours)
+        result = run_child("pipeline", workdir, env, pages_url=pages_url)
+    finally:
+        page_server.shutdown()
+        llm_server.shutdown()
+    result.update(name=f"pipeline scale={scale} archive={archive_hours}h", kind="pipeline", scale=scale,
+                  archive_hours=archive_hours, page_requests=page_server.request_count,
+                  llm_requests=llm_server.request_count)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def notification_scenario(subscribers, seed=1):
+    """Run the notifier for a mapping delta against subscribers users"""
+    rng = random.Random(seed)
+    codes = stock_codes()
+    delta = {code: {"hisse_kodu": code, "sirket_adi": code,
+                    "haberler": [f"https://www.bloomberght.com/{code.lower()}-haber-{n}-{4000000 + n}"
+                                 for n in range(DELTA_NEWS_PER_STOCK)]}
+             for code in codes[:DELTA_STOCKS]}
+    tables = {"users": [], "user_stock_subscriptions": [], "sent_notifications": []}
+    for user_id in range(1, subscribers + 1):
+        tables["users"].append({"id": user_id, "phone_number": f"90555{user_id:07d}"})
+        tables["user_stock_subscriptions"].extend({"user_id": user_id, "stock_kod": code}
+                                                  for code in rng.sample(codes, SUBSCRIPTIONS_PER_USER))
+
+    workdir = scratch_dir("notifications-bench-")
+    with open(os.path.join(workdir, "stock_news_mapping.json"), "w", encoding="utf-8") as f:
+        json.dump({"timestamp": datetime.utcnow().isoformat(), "updated": True, "delta": delta,
+                   "stock_news": delta}, f)
+    postgrest, postgrest_url = serve_fake_postgrest(tables)
+    graph, graph_url = serve_fake_graph_api(latency=0.0)
+    env = dict(os.environ, SUPABASE_URL=postgrest_url, SUPABASE_KEY="offline-benchmark",
+               WHATSAPP_API_URL=graph_url, WHATSAPP_PHONE_NUMBER_ID="1000000000",
+               WHATSAPP_API_TOKEN="offline-benchmark", WHATSAPP_MESSAGES_PER_SECOND="100000",
+               WHATSAPP_BURST="1000", OUTBOX_DB=os.path.join(workdir, "outbox.db"), PYTHONPATH=ROOT)
+    try:
+        result = run_child("notifications", workdir, env)
+    finally:
+        postgrest.shutdown()
+        graph.shutdown()
+    result.update(name=f"notifications subscribers={subscribers}", kind="notifications", subscribers=subscribers,
+                  whatsapp_requests=graph.request_count, supabase_requests=postgrest.request_count)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_result(result):
+    stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in
+                       sorted(result["stages"].items(), key=lambda item: -item[1]))
+    if result["kind"] == "pipeline":
+        detail = (f"{result['new_articles']} new articles ({result['articles_per_second']:.0f}/s), "
+                  f"{result['hits']} hits, {result['llm_requests']} LLM calls, {result['archive_rows']} archived")
+    else:
+        detail = (f"{result['deliveries']} deliveries ({result['deliveries_per_second']:.0f}/s), "
+                  f"{result['whatsapp_requests']} WhatsApp calls, {result['supabase_requests']} Supabase requests")
+    print(f"{result['name']:<36} {result['seconds']:7.2f}s  {result['peak_rss_mb']:6.0f} MB peak  {detail}")
+    print(f"{'':<36} stages: {stages}")
+
+
+def compare(results, baseline_path):
+    """Print the time and memory change of each scenario against an earlier results file"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {result["name"]: result for result in baseline["scenarios"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for result in results["scenarios"]:
+        before = previous.get(result["name"])
+        if before:
+            print(f"{result['name']:<36} time {before['seconds']:7.2f}s -> {result['seconds']:7.2f}s "
+                  f"({result['seconds'] / before['seconds'] - 1:+.0%}), "
+                  f"peak {before['peak_rss_mb']:.0f} -> {result['peak_rss_mb']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="*", default=[1, 10, 100],
+                        help=f"multiples of {BASE_ARTICLES} new articles per run")
+    parser.add_argument("--archive-hours", type=int, nargs="*", default=[24, 720])
+    parser.add_argument("--subscribers", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake OpenAI call")
+    parser.add_argument("--output", help="results file (default benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--child", choices=sorted(CHILDREN), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--pages-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        os.chdir(args.workdir)
+        args.archive_hours = args.archive_hours[0] if args.archive_hours else 0
+        result = CHILDREN[args.child](args)
+        result["peak_rss_mb"] = peak_rss_mb()
+        with open(f"{args.child}.json", "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    results = {"timestamp": datetime.utcnow().isoformat(), "commit": git_commit(),
+               "python": platform.python_version(), "scenarios": []}
+    for scale in args.scales:
+        for archive_hours in args.archive_hours:
+            results["scenarios"].append(pipeline_scenario(scale, archive_hours, args.llm_latency))
+            print_result(results["scenarios"][-1])
+    for subscribers in args.subscribers:
+        results["scenarios"].append(notification_scenario(subscribers))
+        print_result(results["scenarios"][-1])
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{results['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Fixed-interval polling vs the adaptive per-source scheduler over simulated days of publishing
+
+Each source publishes at its own daily rhythm (busy during BIST hours, quiet
+at night) and its listing page shows only its latest links. Reports fetches
+per day and how long new links waited before a poll found them, on the last
+simulated day, after the scheduler has learned the hourly profile.
+
+Usage: python -m benchmarks.bench_polling [--days 7] [--fixed 600 120] [--page-size 30]
+"""
+import argparse
+import random
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+import poll_scheduler
+
+# Links per hour at the busiest hour; busy hours are 06-15 UTC (09-18 in Istanbul)
+SOURCE_PEAK_RATES = {"haberturk": 14, "trthaber": 8, "cnnhaber": 10, "bloomberght": 18, "bigpara": 4}
+
+
+def hourly_factor(hour):
+    """Share of the peak rate published at an hour of day (UTC)"""
+    if 6 <= hour < 15:
+        return 1.0
+    if 4 <= hour < 6 or 15 <= hour < 20:
+        return 0.4
+    return 0.05
+
+
+def simulate_publishing(days, start, seed=1):
+    """Return {source: sorted publish times in seconds since start}"""
+    rng = random.Random(seed)
+    published = {}
+    for source, peak in SOURCE_PEAK_RATES.items():
+        times = []
+        for hour in range(days * 24):
+            rate = peak * hourly_factor((start + timedelta(hours=hour)).hour) / 3600
+            t = rng.expovariate(rate)
+            while t < 3600:
+                times.append(hour * 3600 + t)
+                t += rng.expovariate(rate)
+        published[source] = times
+    return published
+
+
+def run_polls(published, next_poll, horizon, page_size):
+    """Poll each source until horizon; returns [(source, poll time, delays of links found, links missed)]
+
+    next_poll(source, now, new_links) returns the next poll time after a poll.
+    """
+    polls = []
+    for source, times in published.items():
+        now, last = 0.0, 0
+        while now < horizon:
+            upto = bisect_right(times, now)
+            found = times[max(last, upto - page_size):upto]
+            polls.append((source, now, [now - t for t in found], max(0, upto - page_size - last)))
+            last = upto
+            now = next_poll(source, now, len(found))
+    return polls
+
+
+def summarize(label, polls, day_start, day_end):
+    """Print fetches and detection delays for polls within one day"""
+    day = [poll for poll in polls if day_start <= poll[1] < day_end]
+    delays = sorted(delay for poll in day for delay in poll[2])
+    missed = sum(poll[3] for poll in day)
+    mean = sum(delays) / len(delays) if delays else 0.0
+    p90 = delays[int(len(delays) * 0.9)] if delays else 0.0
+    busy = [poll for poll in day if hourly_factor(int(poll[1] // 3600) % 24) == 1.0]
+    busy_delays = [delay for poll in busy for delay in poll[2]]
+    busy_mean = sum(busy_delays) / len(busy_delays) if busy_delays else 0.0
+    print(f"{label:>14}: {len(day):5d} fetches/day, new links found after {mean / 60:5.1f} min on average "
+          f"(p90 {p90 / 60:5.1f} min, market hours {busy_mean / 60:4.1f} min), {missed} missed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=7, help="simulated days; the last one is reported")
+    parser.add_argument("--fixed", type=float, nargs="*", default=[600, 120], help="fixed intervals to compare (seconds)")
+    parser.add_argument("--page-size", type=int, default=30, help="links shown on a listing page")
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 1)
+    horizon = args.days * 86400
+    published = simulate_publishing(args.days, start)
+    print(f"{sum(map(len, published.values()))} links over {args.days} days from {len(published)} sources")
+
+    runs = [(f"fixed {interval:.0f}s", lambda source, now, new, interval=interval: now + interval)
+            for interval in args.fixed]
+    schedule = {}
+
+    def adaptive(source, now, new_links):
+        when = start + timedelta(seconds=now)
+        poll_scheduler.record_poll(schedule, source, new_links, when)
+        return now + schedule[source]["interval"]
+    runs.append(("adaptive", adaptive))
+
+    for label, next_poll in runs:
+        summarize(label, run_polls(published, next_poll, horizon, args.page_size), horizon - 86400, horizon)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Cold-start cost of the entry points: import time per module and wall time of no-op runs
+
+Each measurement runs in a fresh interpreter. Import times come from
+`python -X importtime`; the no-op runs are a scraper run with no source due
+for polling and a notifier run whose mapping has no updates, both in a
+scratch directory. With --record, the medians are appended as one JSON line
+(with the commit and Python version) to a history file, so startup time can
+be tracked over time.
+
+Usage: python -m benchmarks.bench_startup [--repeat 5] [--record benchmarks/startup_history.jsonl]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["news_scraper", "notification_service", "news_daemon"]
+HEAVY_MODULES = ["openai", "supabase", "pandas", "tiktoken"]
+
+
+def importtime(code, env):
+    """Run code under -X importtime; returns (stdout, [(cumulative seconds, nesting depth, module)])"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # two spaces per nesting level
+        imports.append((int(cumulative) / 1e6, depth, name.strip()))
+    return result.stdout, imports
+
+
+def import_profile(module, env, startup_modules):
+    """Return (cumulative import seconds, [(seconds, direct import)] heaviest first, heavy modules loaded)"""
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    stdout, imports = importtime(code, env)
+    total = sum(seconds for seconds, depth, name in imports if depth == 0 and name == module)
+    top = sorted((seconds, name) for seconds, depth, name in imports if depth == 1 and name not in startup_modules)
+    return total, top[::-1], [m for m in stdout.strip().split(",") if m]
+
+
+def timed_run(args, cwd, env):
+    """Return the wall time of one entry point run in a fresh interpreter"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def noop_workdir():
+    """Create a scratch directory in which neither the scraper nor the notifier has work"""
+    import news_scraper
+
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    later = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    with open(os.path.join(workdir, "poll_schedule.json"), "w", encoding="utf-8") as f:
+        json.dump({source: {"polls": 1, "new_links": 0, "rate": 0.0, "hourly": [0.0] * 24,
+                            "last_polled": later, "interval": 60.0, "next_poll": later}
+                   for source in news_scraper.NEWS_SOURCES}, f)
+    with open(os.path.join(workdir, "stock_news_mapping.json"), "w", encoding="utf-8") as f:
+        json.dump({"timestamp": "", "updated": False, "delta": {}, "stock_news": {}}, f)
+    return workdir
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; medians are reported")
+    parser.add_argument("--record", help="append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_KEY="offline-benchmark",
+               SUPABASE_URL="http://127.0.0.1:1", SUPABASE_KEY="offline-benchmark")
+    workdir = noop_workdir()
+    env["OUTBOX_DB"] = os.path.join(workdir, "outbox.db")
+    results = {"imports": {}, "noop_runs": {}}
+    startup_modules = {name for _, _, name in importtime("pass", env)[1]}
+
+    for module in MODULES:
+        profiles = [import_profile(module, env, startup_modules) for _ in range(args.repeat)]
+        total = statistics.median(profile[0] for profile in profiles)
+        _, top, heavy = profiles[-1]
+        results["imports"][module] = round(total, 4)
+        heaviest = ", ".join(f"{name} {seconds * 1000:.0f}ms" for seconds, name in top[:4])
+        print(f"import {module:<22} {total * 1000:6.0f} ms  (heaviest: {heaviest}; "
+              f"heavy SDKs loaded: {', '.join(heavy) or 'none'})")
+
+    for label, entry in (("news_scraper", "news_scraper.py"), ("notification_service", "notification_service.py")):
+        times = [timed_run([os.path.join(ROOT, entry)], workdir, env) for _ in range(args.repeat)]
+        results["noop_runs"][label] = round(statistics.median(times), 4)
+        print(f"no-op run {label:<19} {statistics.median(times) * 1000:6.0f} ms")
+
+    if args.record:
+        record = {"timestamp": datetime.utcnow().isoformat(), "commit": git_commit(),
+                  "python": platform.python_version(), **results}
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Appended results to {args.record}")
+
+
+if __name__ == "__main__":
+    main()
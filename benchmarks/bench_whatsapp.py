@@ -0,0 +1,96 @@
+"""Sequential sends with a fixed sleep vs the rate-limited concurrent dispatcher, against a mock Graph API
+
+Usage: python -m benchmarks.bench_whatsapp [--messages 30] [--recipients 8] [--rate 20] [--limit 25] [--errors 0.05]
+"""
+import argparse
+import os
+import time
+
+import requests
+
+from benchmarks.stubs import serve_fake_graph_api
+
+
+def build_messages(ns, count, recipients):
+    """Spread numbered news alerts round-robin over the recipients"""
+    messages = []
+    for i in range(count):
+        to = f"90555{i % recipients:07d}"
+        payload = ns.build_whatsapp_payload(to, "THYAO", "TURK HAVA YOLLARI", f"https://example.com/haber-{i}")
+        messages.append({"to": to, "payload": payload})
+    return messages
+
+
+def sequential_send(ns, messages, interval):
+    """The previous flow: a new connection per message, then a fixed sleep"""
+    outcomes = []
+    for message in messages:
+        response = requests.post(
+            f"{ns.WHATSAPP_API_URL}/{ns.WHATSAPP_PHONE_NUMBER_ID}/messages",
+            headers={"Authorization": f"Bearer {ns.WHATSAPP_API_TOKEN}", "Content-Type": "application/json"},
+            json=message["payload"]
+        )
+        outcomes.append({"message_id": response.json()["messages"][0]["id"] if response.ok else None,
+                         "error": None if response.ok else response.status_code, "attempts": 1})
+        time.sleep(interval)
+    return outcomes
+
+
+def in_order(messages, delivered):
+    """Check that every recipient received its alerts in the order they were planned"""
+    planned, received = {}, {}
+    for message in messages:
+        planned.setdefault(message["to"], []).append(message["payload"]["template"]["components"][0]["parameters"][2]["text"])
+    for to, texts in delivered:
+        received.setdefault(to, []).append(texts[2])
+    return all(received.get(to, []) == [url for url in urls if url in received.get(to, [])]
+               for to, urls in planned.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--recipients", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=1.0, help="sleep between sequential sends")
+    parser.add_argument("--rate", type=float, default=20, help="dispatcher messages per second")
+    parser.add_argument("--limit", type=int, default=25, help="mock API messages per second before 429")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per mock API call")
+    parser.add_argument("--errors", type=float, default=0.05, help="fraction of transient 503s")
+    args = parser.parse_args()
+
+    server, base_url = serve_fake_graph_api(args.latency, args.limit, args.errors)
+    os.environ["WHATSAPP_API_URL"] = base_url
+    os.environ.setdefault("WHATSAPP_PHONE_NUMBER_ID", "1000000000")
+    os.environ.setdefault("WHATSAPP_API_TOKEN", "offline-benchmark")
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    os.environ.setdefault("SUPABASE_KEY", "offline-benchmark")
+    import notification_service as ns
+    from rate_limit import TokenBucket
+    from whatsapp_dispatch import dispatch_messages
+
+    messages = build_messages(ns, args.messages, args.recipients)
+    runs = (
+        ("sequential", lambda: sequential_send(ns, messages, args.interval)),
+        ("concurrent", lambda: dispatch_messages(
+            messages, lambda message: ns.post_whatsapp_payload(message["payload"]),
+            max_concurrency=ns.WHATSAPP_MAX_CONCURRENCY, limiter=TokenBucket(args.rate, args.rate),
+            backoff_base=0.25)),
+    )
+    try:
+        for label, run in runs:
+            requests_before, limited_before = server.request_count, server.rate_limited
+            server.delivered = []
+            start = time.perf_counter()
+            outcomes = run()
+            elapsed = time.perf_counter() - start
+            sent = sum(1 for outcome in outcomes if outcome["error"] is None)
+            print(f"{label:>10}: {elapsed:.2f}s, {sent}/{len(messages)} sent, "
+                  f"{server.request_count - requests_before} requests "
+                  f"({server.rate_limited - limited_before} rate-limited), "
+                  f"per-recipient order kept: {in_order(messages, server.delivered)}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Listing-page HTML fixtures for the offline benchmarks
+
+Saved pages live in benchmarks/fixtures/<source>.html. Refresh them from the
+live sites with:
+
+    python -m benchmarks.fixtures --save
+
+When no saved page exists for a source, a synthetic page is generated from
+the article URLs recorded in news_archive.json, wrapped in navigation noise,
+scripts and decoy anchors that exercise the edge cases of each selector.
+"""
+import argparse
+import json
+import os
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+SOURCE_HOSTS = {
+    "haberturk": "www.haberturk.com",
+    "trthaber": "www.trthaber.com",
+    "cnnhaber": "www.cnnturk.com",
+    "bloomberght": "www.bloomberght.com",
+    "bigpara": "bigpara.hurriyet.com.tr"
+}
+
+
+def archived_links(archive_path="news_archive.json"):
+    """Return the unique article URLs in the news archive grouped by source"""
+    by_source = {source: [] for source in SOURCE_HOSTS}
+    if not os.path.exists(archive_path):
+        return by_source
+    with open(archive_path, "r", encoding="utf-8") as f:
+        entries = json.load(f).get("entries", [])
+    seen = set()
+    for entry in entries:
+        for link in entry["news_links"]:
+            if link in seen:
+                continue
+            seen.add(link)
+            for source, host in SOURCE_HOSTS.items():
+                if urlparse(link).netloc == host:
+                    by_source[source].append(link)
+    return by_source
+
+
+def _article_anchor(source, link):
+    """Render an anchor that the source's selector should pick up"""
+    path = urlparse(link).path
+    if source == "haberturk":
+        return f'<a class="block gtm-tracker" data-newscategory="Ekonomi" href="{path}">x</a>'
+    if source == "trthaber":
+        return f'<a class="site-url" href="{link}" title="x">x</a>'
+    if source == "cnnhaber":
+        return f'<a class="card navigate" href="{path}">x</a>'
+    if source == "bloomberght":
+        return f'<a href="{path}"><img src="/i.jpg"></a>'
+    return f'<a data-query-param="bpc" href="{path}">x</a>'
+
+
+# Anchors that look close to the selectors but must not match (or match by quirk)
+_DECOYS = [
+    '<a class="block" data-newscategory="Ekonomi" href="/not-block-gtm-1">x</a>',
+    '<a class="gtm-tracker  block" data-newscategory="Ekonomi" href="/reordered-2">x</a>',
+    '<a class="block   gtm-tracker" data-newscategory="Ekonomi" href="/extra-space-3">x</a>',
+    '<a class="block gtm-tracker" data-newscategory="Spor" href="/spor-4">x</a>',
+    '<a class="block gtm-tracker" data-newscategory="Ekonomi">no href</a>',
+    '<a class="site-url" href="https://www.trthaber.com/haber/spor/x-5.html">x</a>',
+    '<a class="site-url" href="https://www.trthaber.com/haber/ekonomi/x-6.htm">x</a>',
+    '<a class="navigate" href="/dunya/x-7">x</a>',
+    '<a class=navigate href=/ekonomi/unquoted-8>x</a>',
+    '<a class="navigate" href="/ekonomi/entity-&amp;-9">x</a>',
+    '<a href="/ekonomi/trailing-slash-10/">x</a>',
+    '<a href="https://www.bloomberght.com/absolute-11">x</a>',
+    '<a href>x</a>',
+    '<a href="/first-12" href="/dup-href">x</a>',
+    '<a data-query-param="bpc" href="/haberler/spor-haberleri/x_ID13/">x</a>',
+    '<a data-query-param="bpc" href="/haberler/ekonomi-haberleri/x_ID14/"/>',
+    '<A HREF="/upper-case-15">x</A>',
+    '<!-- <a href="/commented-16">x</a> -->',
+    '<script>var s = \'<a href="/in-script-17">x</a>\';</script>',
+]
+
+
+def synthetic_page(source, links, noise=300, seed=0):
+    """Build a listing page holding the given article links among noise and decoys"""
+    rng = random.Random(seed)
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Ekonomi</title>',
+             '<style>.a{color:red}</style><script src="/app.js"></script></head><body>']
+    parts.extend(f'<nav><ul><li><a class="menu" href="/kategori/{i}">Kategori {i}</a></li></ul></nav>'
+                 for i in range(noise // 10))
+    body = [_article_anchor(source, link) for link in links] + _DECOYS
+    body.extend(f'<div class="card"><span>Reklam {i}</span><a href="/etiket/konu-{i}x">etiket</a>'
+                f'<img src="/img/{i}.jpg" alt="x"></div>' for i in range(noise))
+    rng.shuffle(body)
+    parts.extend(f'<div class="item">{part}</div>' for part in body)
+    parts.append('<script>window.dataLayer = [];</script></body></html>')
+    return "\n".join(parts)
+
+
+def synthetic_feed(source, links, kind="feed", newest=None, spacing_minutes=10):
+    """Build an RSS feed (kind "feed") or a Google News sitemap (kind "sitemap") listing the links newest first"""
+    newest = newest or datetime(2025, 3, 4, 10, 0)
+    parts = []
+    for i, link in enumerate(links):
+        published = newest - timedelta(minutes=i * spacing_minutes)
+        title = escape(url_slug_title(link))
+        if kind == "sitemap":
+            parts.append(f"<url><loc>{escape(link)}</loc><news:news><news:publication>"
+                         f"<news:name>{source}</news:name><news:language>tr</news:language></news:publication>"
+                         f"<news:publication_date>{published.isoformat()}+00:00</news:publication_date>"
+                         f"<news:title>{title}</news:title></news:news></url>")
+        else:
+            parts.append(f"<item><title>{title}</title><link>{escape(link)}</link>"
+                         f"<guid isPermaLink=\"true\">{escape(link)}</guid>"
+                         f"<pubDate>{format_datetime(published.replace(tzinfo=timezone.utc))}</pubDate>"
+                         f"<description><![CDATA[<p>{title}. {title.lower()}.</p>"
+                         f"<img src=\"https://{SOURCE_HOSTS[source]}/i/{i}.jpg\"/>]]></description></item>")
+    if kind == "sitemap":
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+                'xmlns:news="http://www.google.com/schemas/sitemap-news/0.9">' + "".join(parts) + "</urlset>")
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>'
+            f"<title>{source}</title><link>https://{SOURCE_HOSTS[source]}/</link>" + "".join(parts) + "</channel></rss>")
+
+
+def url_slug_title(link):
+    """Turn an article URL's slug into a title-like string"""
+    slug = urlparse(link).path.rstrip("/").rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return " ".join(word for word in re.split(r"[-_]", slug) if word and not any(c.isdigit() for c in word)).capitalize()
+
+
+def load_fixture(source):
+    """Return the saved listing page for a source, or a synthetic one"""
+    path = os.path.join(FIXTURE_DIR, f"{source}.html")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return synthetic_page(source, archived_links()[source])
+
+
+def load_fixtures():
+    """Return {source: html} for every news source"""
+    return {source: load_fixture(source) for source in SOURCE_HOSTS}
+
+
+def save_live_fixtures():
+    """Download the current listing pages into the fixture directory"""
+    import news_scraper
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    pages = news_scraper.fetch_pages(list(news_scraper.NEWS_SOURCES.values()))
+    for source, url in news_scraper.NEWS_SOURCES.items():
+        if not pages.get(url):
+            print(f"Could not fetch {source}, keeping the existing fixture")
+            continue
+        with open(os.path.join(FIXTURE_DIR, f"{source}.html"), "w", encoding="utf-8") as f:
+            f.write(pages[url])
+        print(f"Saved {source} ({len(pages[url])} chars)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage listing-page fixtures")
+    parser.add_argument("--save", action="store_true", help="download the live listing pages")
+    args = parser.parse_args()
+    if args.save:
+        os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+        save_live_fixtures()
+    else:
+        for source, html in load_fixtures().items():
+            print(f"{source}: {len(html)} chars")
@@ -0,0 +1,348 @@
+"""Local HTTP stand-ins used by the offline benchmarks"""
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class LatencyPageHandler(BaseHTTPRequestHandler):
+    """Serves fixed pages by path after an artificial delay, with optional ETag validators"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    pages = {}
+    latency = {}
+    default_latency = 0.0
+    etags = False
+
+    def do_GET(self):
+        self.server.request_count += 1
+        time.sleep(self.latency.get(self.path, self.default_latency))
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = body.encode("utf-8")
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        if self.etags and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if self.etags:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat-completions endpoint with latency, rate limiting and bad answers
+
+    It "finds" a stock in a news URL when the stock code appears in the URL,
+    so results are deterministic for a given prompt.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    requests_per_second = None  # None = no rate limit
+    garbage_rate = 0.0  # fraction of answers that are not valid JSON
+    retry_after = 1
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.request_count += 1
+            now = time.monotonic()
+            server.recent = [t for t in server.recent if now - t < 1.0]
+            limited = self.requests_per_second is not None and len(server.recent) >= self.requests_per_second
+            if limited:
+                server.rate_limited += 1
+            else:
+                server.recent.append(now)
+        if limited:
+            return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                   {"Retry-After": str(self.retry_after)})
+
+        time.sleep(self.latency)
+        prompt = body["messages"][-1]["content"]
+        if random.random() < self.garbage_rate:
+            content = "Sorry, I cannot answer in JSON right now."
+        else:
+            content = json.dumps(self.answer(prompt), ensure_ascii=False)
+        self._send_json(200, {
+            "id": f"chatcmpl-{server.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt) // 3, "completion_tokens": len(content) // 3,
+                      "total_tokens": (len(prompt) + len(content)) // 3}
+        })
+
+    @staticmethod
+    def answer(prompt):
+        stocks = re.findall(r"([A-Z0-9]{3,6}) - ([^,\n]+)", prompt.split("My Stocks:")[-1].split("News URL:")[0])
+        urls = re.findall(r"https?://[^\s'\",\]]+", prompt.split("News URL:")[-1])
+        hits = [{"hisse_kodu": code, "sirket_adi": name.strip(), "haber_url": url}
+                for code, name in stocks for url in urls if code.lower() in url.lower()]
+        return {"direct_news": hits, "no_direct_news_found": not hits}
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGraphAPIHandler(BaseHTTPRequestHandler):
+    """WhatsApp Cloud API messages endpoint with latency, a throughput limit and transient 5xx errors
+
+    Accepted messages are appended to server.delivered as (to, template text parameters)
+    in the order they arrive.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.05
+    messages_per_second = None  # None = no rate limit
+    error_rate = 0.0  # fraction of requests answered with a 503
+    retry_after = 1
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.request_count += 1
+            now = time.monotonic()
+            server.recent = [t for t in server.recent if now - t < 1.0]
+            limited = self.messages_per_second is not None and len(server.recent) >= self.messages_per_second
+            if limited:
+                server.rate_limited += 1
+            else:
+                server.recent.append(now)
+        if limited:
+            return self._send_json(429, {"error": {"message": "(#130429) Rate limit hit", "code": 130429}},
+                                   {"Retry-After": str(self.retry_after)})
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            return self._send_json(503, {"error": {"message": "Service temporarily unavailable", "code": 2}})
+
+        texts = [parameter.get("text") for component in body.get("template", {}).get("components", [])
+                 for parameter in component.get("parameters", [])]
+        with server.lock:
+            server.delivered.append((body.get("to"), texts))
+            message_id = f"wamid.{len(server.delivered)}"
+        self._send_json(200, {"messaging_product": "whatsapp", "contacts": [{"input": body.get("to")}],
+                              "messages": [{"id": message_id}]})
+
+    _send_json = FakeOpenAIHandler._send_json
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePostgRESTHandler(BaseHTTPRequestHandler):
+    """In-memory PostgREST subset for the Supabase client: select with one embed, eq/in filters,
+    order, offset/limit and (bulk) inserts. Counts requests per table and method.
+
+    Filtered, sorted results are cached per query until the table grows, so paging through
+    a large table does not rescan it for every page."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # small keep-alive responses otherwise stall on delayed ACKs
+    tables = {}
+    max_rows = 1000
+    latency = 0.0
+
+    _in_value = re.compile(r'"((?:[^"\\]|\\.)*)"|([^,]+)')
+    _embed = re.compile(r"(\w+)\(([^)]*)\)")
+
+    def do_GET(self):
+        table, params = self._request("GET")
+        offset, limit, select = 0, self.max_rows, "*"
+        query = []
+        for name, value in params:
+            if name == "select":
+                select = value
+            elif name == "offset":
+                offset = int(value)
+            elif name == "limit":
+                limit = min(int(value), self.max_rows)
+            else:
+                query.append((name, value))
+        rows = self._query(table, tuple(query))
+        rows = [self._project(row, select) for row in rows[offset:offset + limit]]
+        self._send_json(200, rows)
+
+    def _query(self, table, query):
+        stored = self.tables.get(table, [])
+        key = (table, query)
+        with self.server.lock:
+            cached = self.server.query_cache.get(key)
+        if cached and cached[0] == len(stored):
+            return cached[1]
+        rows, order = list(stored), []
+        for name, value in query:
+            if name == "order":
+                order = [part.split(".")[0] for part in value.split(",")]
+            else:
+                rows = [row for row in rows if self._matches(row.get(name), value)]
+        for column in reversed(order):
+            rows.sort(key=lambda row: str(row.get(column)))
+        with self.server.lock:
+            self.server.query_cache[key] = (len(stored), rows)
+        return rows
+
+    def _by_id(self, table):
+        stored = self.tables.get(table, [])
+        with self.server.lock:
+            cached = self.server.id_index.get(table)
+        if not cached or cached[0] != len(stored):
+            cached = (len(stored), {row["id"]: row for row in stored})
+            with self.server.lock:
+                self.server.id_index[table] = cached
+        return cached[1]
+
+    def do_POST(self):
+        table, _ = self._request("POST")
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+        rows = payload if isinstance(payload, list) else [payload]
+        with self.server.lock:
+            stored = self.tables.setdefault(table, [])
+            for row in rows:
+                row = dict(row, id=len(stored) + 1)
+                stored.append(row)
+        self._send_json(201, rows)
+
+    def _request(self, method):
+        time.sleep(self.latency)
+        parts = urlsplit(self.path)
+        table = parts.path.rsplit("/", 1)[-1]
+        with self.server.lock:
+            self.server.request_count += 1
+            key = f"{method} {table}"
+            self.server.requests[key] = self.server.requests.get(key, 0) + 1
+        return table, parse_qsl(parts.query)
+
+    def _matches(self, actual, condition):
+        operator, _, value = condition.partition(".")
+        if operator == "eq":
+            return str(actual) == value
+        if operator == "in":
+            values = [quoted if quoted else bare for quoted, bare in self._in_value.findall(value[1:-1])]
+            return str(actual) in values
+        raise ValueError(f"Unsupported filter: {condition}")
+
+    def _project(self, row, select):
+        if select == "*":
+            return dict(row)
+        projected = {}
+        for embed_table, columns in self._embed.findall(select):
+            # Many-to-one embed through the <singular>_id foreign key, e.g. users(...) via user_id
+            target = self._by_id(embed_table).get(row.get(embed_table.rstrip("s") + "_id"))
+            projected[embed_table] = target and {c.strip(): target.get(c.strip()) for c in columns.split(",")}
+        for column in self._embed.sub("", select).split(","):
+            if column.strip():
+                projected[column.strip()] = row.get(column.strip())
+        return projected
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    """Threaded server that ignores clients hanging up mid-response"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(handler_class):
+    """Start a threaded HTTP server on a free local port and return it"""
+    server = QuietServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    server.request_count = 0
+    server.rate_limited = 0
+    server.recent = []
+    server.requests = {}
+    server.delivered = []
+    server.query_cache = {}
+    server.id_index = {}
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def serve_pages(pages, latency=None, default_latency=0.0, etags=False):
+    """Serve {path: html} with per-path latency in seconds; returns (server, base_url)"""
+    handler = type("PageHandler", (LatencyPageHandler,), {
+        "pages": pages,
+        "latency": dict(latency or {}),
+        "default_latency": default_latency,
+        "etags": etags,
+    })
+    server = start_server(handler)
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def serve_fake_openai(latency=0.2, requests_per_second=None, garbage_rate=0.0, retry_after=1):
+    """Start a fake chat-completions server; returns (server, base_url ending in /v1)"""
+    handler = type("OpenAIHandler", (FakeOpenAIHandler,), {
+        "latency": latency,
+        "requests_per_second": requests_per_second,
+        "garbage_rate": garbage_rate,
+        "retry_after": retry_after,
+    })
+    server = start_server(handler)
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def serve_fake_postgrest(tables, max_rows=1000, latency=0.0):
+    """Serve {table: [row]} as a PostgREST API; returns (server, Supabase project URL)"""
+    handler = type("PostgRESTHandler", (FakePostgRESTHandler,), {
+        "tables": tables,
+        "max_rows": max_rows,
+        "latency": latency,
+    })
+    server = start_server(handler)
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def serve_fake_graph_api(latency=0.05, messages_per_second=None, error_rate=0.0, retry_after=1):
+    """Start a fake WhatsApp Cloud API; returns (server, base URL to use as WHATSAPP_API_URL)"""
+    handler = type("GraphAPIHandler", (FakeGraphAPIHandler,), {
+        "latency": latency,
+        "messages_per_second": messages_per_second,
+        "error_rate": error_rate,
+        "retry_after": retry_after,
+    })
+    server = start_server(handler)
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v19.0"
@@ -0,0 +1,240 @@
+"""Pluggable discovery of article links: RSS/Atom feeds, news sitemaps and listing pages
+
+Each source is discovered with the first of its adapters that works: its
+feeds and sitemaps in the configured order, then its HTML listing page with
+the anchor selectors of link_extractor as the fallback. A feed is a few KB
+instead of a few hundred for a rendered listing page, and it carries publish
+times. Feeds and sitemaps are parsed with XMLPullParser while the body
+streams in; outlets list their newest items first, so the download stops
+after a few items older than the newest one seen by the previous poll.
+
+All adapters send the ETag/Last-Modified validators of their cached entry,
+and a feed that fails is skipped for FEED_RETRY_HOURS before it is tried
+again.
+"""
+import os
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+from xml.etree.ElementTree import XMLPullParser
+
+import metrics
+from link_extractor import extract_links, link_region_hash
+
+# Items older than the newest one of the last poll minus this are stale
+FEED_OVERLAP_MINUTES = float(os.environ.get("FEED_OVERLAP_MINUTES", "60"))
+FEED_STALE_ITEMS = 5  # consecutive stale items before the rest of a feed is skipped
+FEED_RETRY_HOURS = float(os.environ.get("FEED_RETRY_HOURS", "6"))
+CHUNK_SIZE = 4 * 1024
+
+
+def parse_timestamp(text):
+    """Parse an ISO 8601 or RFC 822 timestamp into naive UTC, or return None"""
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        value = datetime.fromisoformat(text[:-1] + "+00:00" if text.endswith("Z") else text)
+    except ValueError:
+        try:
+            value = parsedate_to_datetime(text)
+        except (TypeError, ValueError):
+            return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def freshest_first(urls, published):
+    """Order URLs by publish time, newest first, keeping the ones without one last in their order"""
+    return sorted(urls, key=lambda url: published.get(url, ""), reverse=True)
+
+
+class DiscoveryAdapter(ABC):
+    """Fetches one URL of a source and turns it into article links
+
+    discover() returns a dict with the "outcome" (fetched, not_modified or
+    hash_hit), "links", "published" ({link: ISO publish time}) and the
+    "bytes_downloaded" and "bytes_saved", or None when the URL failed.
+    """
+    kind = None
+
+    def __init__(self, source, url, pattern=None):
+        self.source = source
+        self.url = url
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def discover(self, get_response, entry):
+        """Fetch conditionally with the validators in entry (a cache entry that is updated in place)"""
+        headers = {}
+        if "links" in entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = get_response(self.url, headers, stream=True)
+        if response is None:
+            return None
+        try:
+            if response.status_code == 304:
+                return {"outcome": "not_modified", "links": entry["links"], "published": entry.get("published", {}),
+                        "bytes_downloaded": 0, "bytes_saved": entry.get("size", 0)}
+            with metrics.span("parse", source=self.source, adapter=self.kind):
+                result = self.read(response, entry)
+        except Exception as e:
+            print(f"Error reading {self.kind} {self.url}: {e}")
+            return None
+        finally:
+            response.close()
+        if result is None:
+            return None
+        entry["etag"] = response.headers.get("ETag")
+        entry["last_modified"] = response.headers.get("Last-Modified")
+        return result
+
+    @abstractmethod
+    def read(self, response, entry):
+        """Read a fetched response into a result dict, updating entry, or return None if it is unusable"""
+
+
+class FeedAdapter(DiscoveryAdapter):
+    """RSS 2.0 or Atom feed: <item>/<entry> elements with a link and a publish time"""
+    kind = "feed"
+    item_tags = ("item", "entry")
+
+    def item(self, element):
+        """Return (link, publish time text) of an item element"""
+        link = published = None
+        for child in element:
+            name = _local_name(child.tag)
+            if name == "link":
+                if child.get("href") and child.get("rel", "alternate") == "alternate":
+                    link = child.get("href")
+                elif child.text and child.text.strip():
+                    link = child.text
+            elif name == "guid" and link is None and child.get("isPermaLink", "true") == "true":
+                link = child.text
+            elif name in ("pubDate", "published", "date") or (name == "updated" and published is None):
+                published = child.text
+        return link, published
+
+    def read(self, response, entry):
+        newest = parse_timestamp(entry.get("newest"))
+        cutoff = newest - timedelta(minutes=FEED_OVERLAP_MINUTES) if newest else None
+        parser = XMLPullParser(events=("end",))
+        links, published = [], {}
+        items = stale = size = 0
+        complete = True
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                if _local_name(element.tag) not in self.item_tags:
+                    continue
+                link, published_text = self.item(element)
+                element.clear()
+                items += 1
+                if not link:
+                    continue
+                link = urljoin(self.url, link.strip())
+                timestamp = parse_timestamp(published_text)
+                stale = stale + 1 if cutoff and timestamp and timestamp < cutoff else 0
+                if self.pattern is None or self.pattern.search(link):
+                    if link not in published:
+                        links.append(link)
+                    published[link] = timestamp.isoformat() if timestamp else ""
+                if newest is None or (timestamp and timestamp > newest):
+                    newest = timestamp
+                if stale >= FEED_STALE_ITEMS:
+                    complete = False
+                    break
+            if not complete:
+                break
+        if complete:
+            parser.close()
+        if not items:
+            print(f"No items in {self.kind} {self.url}")
+            return None
+
+        metrics.inc("feed_items", items, source=self.source, adapter=self.kind)
+        if not complete:
+            metrics.inc("feed_early_stops", source=self.source, adapter=self.kind)
+        entry["links"] = sorted(links)
+        entry["published"] = {link: value for link, value in published.items() if value}
+        entry["newest"] = newest.isoformat() if newest else None
+        entry["size"] = size
+        return {"outcome": "fetched", "links": entry["links"], "published": entry["published"],
+                "bytes_downloaded": size, "bytes_saved": 0}
+
+
+class SitemapAdapter(FeedAdapter):
+    """Google News or plain sitemap: <url> elements with a <loc> and a publication date or lastmod"""
+    kind = "sitemap"
+    item_tags = ("url",)
+
+    def item(self, element):
+        link = published = None
+        for child in element.iter():
+            name = _local_name(child.tag)
+            if name == "loc" and link is None:
+                link = child.text
+            elif name == "publication_date" or (name == "lastmod" and published is None):
+                published = child.text
+        return link, published
+
+
+class ListingPageAdapter(DiscoveryAdapter):
+    """HTML listing page read with the source's anchor selectors, skipped when its link markup is unchanged"""
+    kind = "html"
+
+    def read(self, response, entry):
+        page = response.text
+        entry["size"] = len(response.content)
+        region_hash = link_region_hash(page)
+        if region_hash == entry.get("region_hash") and "links" in entry:
+            return {"outcome": "hash_hit", "links": entry["links"], "published": {},
+                    "bytes_downloaded": entry["size"], "bytes_saved": 0}
+        entry["links"] = sorted(extract_links(self.source, page))
+        entry["region_hash"] = region_hash
+        entry.pop("published", None)
+        return {"outcome": "fetched", "links": entry["links"], "published": {},
+                "bytes_downloaded": entry["size"], "bytes_saved": 0}
+
+
+ADAPTERS = {adapter.kind: adapter for adapter in (FeedAdapter, SitemapAdapter, ListingPageAdapter)}
+
+
+def source_adapters(source, listing_url, feeds=()):
+    """Return a source's adapters in the order they are tried: feeds ({"kind", "url", "pattern"}), then its listing page"""
+    adapters = [ADAPTERS[feed["kind"]](source, feed["url"], feed.get("pattern")) for feed in feeds]
+    adapters.append(ListingPageAdapter(source, listing_url))
+    return adapters
+
+
+def discover_links(adapters, entries, get_response, now=None):
+    """Return the result of the first adapter that works, with its "adapter" kind, or None if all failed
+
+    entries maps URLs to their cache entries; get_response(url, headers,
+    stream) returns a response or None.
+    """
+    now = now or datetime.utcnow()
+    retry_after = (now - timedelta(hours=FEED_RETRY_HOURS)).isoformat()
+    for adapter in adapters:
+        entry = entries.setdefault(adapter.url, {})
+        if adapter.kind != "html" and entry.get("failed_at", "") > retry_after:
+            continue
+        result = adapter.discover(get_response, entry)
+        if result is not None:
+            entry.pop("failed_at", None)
+            result["adapter"] = adapter.kind
+            return result
+        if adapter.kind != "html":
+            entry["failed_at"] = now.isoformat()
+    return None
@@ -0,0 +1,94 @@
+"""Fast anchor-link extraction for the news listing pages
+
+Instead of building a full BeautifulSoup tree, the extractor streams the page
+through the standard library HTML tokenizer (the same one behind
+BeautifulSoup's 'html.parser') and only looks at <a> start tags. Attribute
+handling follows BeautifulSoup's rules, so each source returns exactly the
+link set of its former find_all() selector.
+"""
+import hashlib
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+_trailing_digit = re.compile(r'\d$')
+_anchor_start_tag = re.compile(r'<a\s[^>]*>', re.IGNORECASE)
+
+
+class AnchorCollector(HTMLParser):
+    """Collects the attributes of every <a> start tag, ignoring everything else"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.anchors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        anchor = {}
+        for name, value in attrs:
+            # BeautifulSoup turns valueless attributes into "" and keeps the last duplicate
+            anchor[name] = "" if value is None else value
+        self.anchors.append(anchor)
+
+
+def iter_anchors(html):
+    """Return the attribute dicts of all <a> tags in an HTML document"""
+    collector = AnchorCollector()
+    collector.feed(html)
+    collector.close()
+    return collector.anchors
+
+
+def has_class(anchor, class_name):
+    """Match a class the way BeautifulSoup's class_ argument does"""
+    classes = anchor.get("class")
+    if classes is None:
+        return False
+    tokens = classes.split()
+    return class_name in tokens or " ".join(tokens) == class_name
+
+
+# Per-source anchor filters: (predicate on the attribute dict, base URL for relative links)
+SOURCE_RULES = {
+    "haberturk": (
+        lambda a: a.get("data-newscategory") == "Ekonomi" and has_class(a, "block gtm-tracker"),
+        "https://www.haberturk.com"
+    ),
+    "trthaber": (
+        lambda a: has_class(a, "site-url")
+        and a["href"].startswith("https://www.trthaber.com/haber/ekonomi/")
+        and a["href"].endswith(".html"),
+        None  # TRT Haber links are already complete
+    ),
+    "cnnhaber": (
+        lambda a: has_class(a, "navigate") and a["href"].startswith("/ekonomi/"),
+        "https://www.cnnturk.com"
+    ),
+    "bloomberght": (
+        lambda a: _trailing_digit.search(a["href"]) is not None,
+        "https://www.bloomberght.com"
+    ),
+    "bigpara": (
+        lambda a: a.get("data-query-param") == "bpc" and a["href"].startswith("/haberler/ekonomi-haberleri/"),
+        "https://bigpara.hurriyet.com.tr"
+    )
+}
+
+
+def extract_links(source, html):
+    """Return the set of article links on a source's listing page as full URLs"""
+    predicate, base_url = SOURCE_RULES[source]
+    links = set()
+    for anchor in iter_anchors(html):
+        if "href" in anchor and predicate(anchor):
+            links.add(urljoin(base_url, anchor["href"]) if base_url else anchor["href"])
+    return links
+
+
+def link_region_hash(html):
+    """Hash the raw <a> start tags of a page as a cheap change detector for its links"""
+    digest = hashlib.sha1()
+    for match in _anchor_start_tag.finditer(html):
+        digest.update(match.group(0).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
@@ -0,0 +1,71 @@
+"""Persistent cache of LLM verdicts per (article, stock) pair
+
+Every verdict is stored under a fingerprint of the prompt template and model
+name, so changing either makes the old verdicts unreachable. Entries expire
+after a TTL and the oldest are evicted once the cache exceeds its size bound.
+"""
+import sqlite3
+import time
+
+from sqlite_params import parameter_chunks
+
+LLM_CACHE_DB = "llm_cache.db"
+
+
+def open_llm_cache(path=LLM_CACHE_DB):
+    """Open (and create if needed) the verdict cache database"""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS verdicts (
+            fingerprint TEXT NOT NULL,
+            article_key TEXT NOT NULL,
+            stock_code TEXT NOT NULL,
+            mentioned INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (fingerprint, article_key, stock_code)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verdicts_created_at ON verdicts (created_at)")
+    conn.commit()
+    return conn
+
+
+def get_verdicts(conn, fingerprint, pairs, ttl_seconds):
+    """Return {(article_key, stock_code): mentioned} for the cached, unexpired pairs among the given ones"""
+    pairs = set(pairs)
+    keys = sorted({article_key for article_key, _ in pairs})
+    min_created_at = time.time() - ttl_seconds
+    verdicts = {}
+    for chunk, placeholders in parameter_chunks(keys):
+        rows = conn.execute(f"""
+            SELECT article_key, stock_code, mentioned FROM verdicts
+            WHERE fingerprint = ? AND created_at >= ? AND article_key IN ({placeholders})
+        """, [fingerprint, min_created_at] + chunk)
+        for article_key, stock_code, mentioned in rows:
+            if (article_key, stock_code) in pairs:
+                verdicts[(article_key, stock_code)] = bool(mentioned)
+    return verdicts
+
+
+def store_verdicts(conn, fingerprint, verdicts):
+    """Store {(article_key, stock_code): mentioned} verdicts"""
+    now = time.time()
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO verdicts (fingerprint, article_key, stock_code, mentioned, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(fingerprint, key, code, int(mentioned), now) for (key, code), mentioned in verdicts.items()])
+
+
+def evict(conn, ttl_seconds, max_entries):
+    """Drop expired verdicts and the oldest ones beyond max_entries; returns the number removed"""
+    with conn:
+        removed = conn.execute("DELETE FROM verdicts WHERE created_at < ?", (time.time() - ttl_seconds,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] - max_entries
+        if excess > 0:
+            removed += conn.execute("""
+                DELETE FROM verdicts WHERE (fingerprint, article_key, stock_code) IN (
+                    SELECT fingerprint, article_key, stock_code FROM verdicts ORDER BY created_at LIMIT ?
+                )
+            """, (excess,)).rowcount
+    return removed
@@ -0,0 +1,131 @@
+"""Concurrent LLM batch dispatch with rate limiting and selective retries
+
+Batches run on a thread pool under a concurrency cap and a tokens-per-minute
+budget. A batch that hits a 429, a 5xx, a connection error or returns
+unparseable JSON is retried on its own with jittered exponential backoff
+(or after the server's Retry-After), while the other batches keep going.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from rate_limit import TokenBucket
+
+# Without tiktoken, Turkish URLs and names average ~3 characters per token
+CHARS_PER_TOKEN = 3
+COMPLETION_TOKEN_ALLOWANCE = 300
+TOKEN_ENCODING = "o200k_base"  # gpt-4o family
+
+_encoding = None  # loaded on first use; False when tiktoken or its encoding is unavailable
+
+
+def count_tokens(text):
+    """Count the tokens in a text with tiktoken when it is installed, else estimate from its length"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception:
+            _encoding = False  # not installed, or encoding unavailable offline; fall back to the estimate
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_tokens(text):
+    """Estimate the tokens a request with this prompt will consume, including the completion"""
+    return count_tokens(text) + COMPLETION_TOKEN_ALLOWANCE
+
+
+class TokenRateLimiter(TokenBucket):
+    """Token bucket that refills at tokens_per_minute, shared by all dispatch threads"""
+
+    def __init__(self, tokens_per_minute):
+        super().__init__(tokens_per_minute / 60.0, tokens_per_minute)
+
+
+def _retry_after(error):
+    """Return the server's Retry-After delay in seconds, if it sent one"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None  # HTTP-date form is not used by OpenAI-compatible APIs
+
+
+def retry_delay(error, attempt, backoff_base=1.0, backoff_max=30.0):
+    """Return the seconds to wait before retrying after an error, or None if it is not retryable"""
+    # Imported here so that loading this module does not pull in the OpenAI SDK
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+
+    if isinstance(error, RateLimitError):
+        pass
+    elif isinstance(error, APIStatusError):
+        if error.status_code < 500 and error.status_code not in (408, 409):
+            return None
+    elif not isinstance(error, (APIConnectionError, ValueError)):  # ValueError covers bad JSON
+        return None
+
+    # Full jitter on top of the server's Retry-After, so waiting batches do not retry in lockstep
+    jitter = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+    retry_after = _retry_after(error)
+    return jitter if retry_after is None else retry_after + jitter
+
+
+def dispatch_batches(jobs, send, max_concurrency=4, limiter=None, max_retries=4,
+                     backoff_base=1.0, backoff_max=30.0, remaining_time=None, on_result=None):
+    """Run send(job) for every job concurrently and return one outcome dict per job, in order
+
+    Each job needs a "prompt" (used for token accounting). An outcome holds the
+    "result" returned by send, or an "error" message, plus the "attempts" made.
+    remaining_time, if given, returns the seconds left in the run budget.
+    on_result(job, outcome), if given, is called from the worker thread as soon
+    as a job is done.
+    """
+    remaining_time = remaining_time or (lambda: None)
+
+    def run(job):
+        tokens = estimate_tokens(job["prompt"])
+        attempt = 0
+        while True:
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                return {"result": None, "error": "Run deadline exceeded", "attempts": attempt}
+            waited = time.perf_counter()
+            if limiter is not None and not limiter.acquire(tokens, timeout=remaining):
+                return {"result": None, "error": "Run deadline exceeded", "attempts": attempt}
+            metrics.observe("llm_rate_limit_wait_seconds", time.perf_counter() - waited)
+            attempt += 1
+            try:
+                return {"result": send(job), "error": None, "attempts": attempt}
+            except Exception as e:
+                delay = retry_delay(e, attempt - 1, backoff_base, backoff_max)
+                remaining = remaining_time()
+                if delay is None or attempt > max_retries or (remaining is not None and delay >= remaining):
+                    return {"result": None, "error": f"{type(e).__name__}: {e}", "attempts": attempt}
+                print(f"LLM batch failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                metrics.inc("llm_retries", error=type(e).__name__)
+                time.sleep(delay)
+
+    def finish(job):
+        with metrics.span("llm_batch"):
+            outcome = run(job)
+        if on_result is not None:
+            on_result(job, outcome)
+        return outcome
+
+    if max_concurrency <= 1 or len(jobs) <= 1:
+        return [finish(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(jobs))) as executor:
+        return list(executor.map(finish, jobs))
@@ -0,0 +1,207 @@
+"""In-process metrics and tracing: timing spans, counters and latency histograms
+
+Code records spans with `with metrics.span("fetch", source=...)`, counts
+with metrics.inc() and observes values with metrics.observe(); every span
+also feeds a `<name>_seconds` histogram. metrics.flush(job) exports what
+was recorded:
+
+- METRICS_TEXTFILE_DIR: news_signal_<job>.prom in the Prometheus textfile
+  format (cumulative since the process started), for node_exporter
+- METRICS_JSONL_FILE: one JSON line per flush with the counters and
+  histograms recorded since the previous flush, i.e. per run or cycle
+- METRICS_TRACE_FILE: one JSON line per span (with its parent span)
+
+METRICS_PROFILE=<file> profiles a whole run with cProfile (see profiled()).
+Without any of these set, flush() only prints a summary of span times.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from state_file import atomic_open
+
+METRICS_TEXTFILE_DIR = os.environ.get("METRICS_TEXTFILE_DIR")
+METRICS_JSONL_FILE = os.environ.get("METRICS_JSONL_FILE")
+METRICS_TRACE_FILE = os.environ.get("METRICS_TRACE_FILE")
+METRICS_PROFILE = os.environ.get("METRICS_PROFILE")
+
+PREFIX = "news_signal_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_local = threading.local()
+_span_ids = itertools.count(1)
+_totals = {"counters": {}, "histograms": {}}  # since the process started
+_window = {"counters": {}, "histograms": {}}  # since the last flush
+_trace = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add value to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        for store in (_totals, _window):
+            store["counters"][key] = store["counters"].get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record a value (seconds, by convention) in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        for store in (_totals, _window):
+            histogram = store["histograms"].get(key)
+            if histogram is None:
+                histogram = store["histograms"][key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block into the <name>_seconds histogram; failures also count in <name>_errors_total"""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    span_id = next(_span_ids)
+    parent = stack[-1] if stack else None
+    stack.append(span_id)
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        inc(f"{name}_errors", error=error, **labels)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        observe(f"{name}_seconds", duration, **labels)
+        if METRICS_TRACE_FILE:
+            with _lock:
+                _trace.append({"id": span_id, "parent": parent, "name": name, "labels": labels,
+                               "start": started_at, "duration": round(duration, 6), "error": error,
+                               "thread": threading.current_thread().name})
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(store=None):
+    """Render counters and histograms in the Prometheus text exposition format"""
+    store = store or _totals
+    lines = []
+    with _lock:
+        counters = sorted(store["counters"].items())
+        histograms = sorted((key, dict(value, buckets=list(value["buckets"])))
+                            for key, value in store["histograms"].items())
+    typed = set()
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}{name}_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_labels_text(labels)} {value}")
+    for (name, labels), histogram in histograms:
+        metric = f"{PREFIX}{name}"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+            lines.append(f"{metric}_bucket{_labels_text(labels, [('le', bound)])} {count}")
+        lines.append(f"{metric}_bucket{_labels_text(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{metric}_sum{_labels_text(labels)} {histogram['sum']:.6f}")
+        lines.append(f"{metric}_count{_labels_text(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot(store):
+    return {
+        "counters": [{"name": name, "labels": dict(labels), "value": value}
+                     for (name, labels), value in sorted(store["counters"].items())],
+        "histograms": [{"name": name, "labels": dict(labels), "count": h["count"], "sum": round(h["sum"], 6),
+                        "buckets": dict(zip(map(str, LATENCY_BUCKETS), h["buckets"]))}
+                       for (name, labels), h in sorted(store["histograms"].items())]
+    }
+
+
+def span_summary(store=None):
+    """Return [(span name, total seconds, count)] for the spans recorded since the last flush, slowest first"""
+    store = store or _window
+    totals = {}
+    with _lock:
+        for (name, _), histogram in store["histograms"].items():
+            if name.endswith("_seconds"):
+                seconds, count = totals.get(name[:-len("_seconds")], (0.0, 0))
+                totals[name[:-len("_seconds")]] = (seconds + histogram["sum"], count + histogram["count"])
+    return sorted(((name, seconds, count) for name, (seconds, count) in totals.items()), key=lambda item: -item[1])
+
+
+def flush(job):
+    """Export the metrics of the job's run to the configured files and start a new window"""
+    global _window, _trace
+    summary = span_summary()
+    if summary:
+        print("Time by span: " + ", ".join(f"{name} {seconds:.2f}s/{count}" for name, seconds, count in summary))
+    with _lock:
+        window, _window = _window, {"counters": {}, "histograms": {}}
+        trace, _trace = _trace, []
+    try:
+        if METRICS_TEXTFILE_DIR:
+            os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+            # node_exporter may read the file at any moment, so never let it see a partial write
+            with atomic_open(os.path.join(METRICS_TEXTFILE_DIR, f"{PREFIX}{job}.prom")) as f:
+                f.write(prometheus_text())
+        if METRICS_JSONL_FILE:
+            with open(METRICS_JSONL_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dict(timestamp=datetime.utcnow().isoformat(), job=job, **_snapshot(window)),
+                                   ensure_ascii=False) + "\n")
+        if METRICS_TRACE_FILE and trace:
+            with open(METRICS_TRACE_FILE, "a", encoding="utf-8") as f:
+                for record in trace:
+                    f.write(json.dumps(dict(record, job=job), ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Error writing metrics: {e}")
+
+
+@contextmanager
+def profiled(path=None, top=25):
+    """Profile the block with cProfile when a path is given (default METRICS_PROFILE); prints the top functions"""
+    path = path or METRICS_PROFILE
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        print(out.getvalue())
+        print(f"Profile written to {path} (inspect with: python -m pstats {path})")
@@ -0,0 +1,176 @@
+"""Long-running mode: scrape on an interval and hand confirmed hits straight to the notifier
+
+One process keeps the HTTP pools, OpenAI client, stock matcher and caches
+warm between cycles. Hits confirmed by analyze_news_for_stocks are put on an
+in-process queue the moment their LLM batch returns; a notifier thread plans
+them against Supabase, queues them in the durable outbox and drains it right
+away. Every cycle still writes the archive, seen set, verdict cache and
+stock_news_mapping.json, and the outbox survives a crash, so a restarted
+daemon picks up where it stopped.
+
+With POLL_SCHEDULING on (the default), a cycle starts when the next source
+is due per poll_scheduler and only polls the sources that are due; otherwise
+every source is polled every interval seconds.
+
+Usage: python news_daemon.py [--interval 120]
+"""
+import argparse
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+
+import metrics
+import news_scraper
+import notification_outbox as outbox
+import notification_service
+import poll_scheduler
+
+DAEMON_INTERVAL_SECONDS = 120
+HANDOFF_LINGER_SECONDS = 1.0  # hits arriving together share one Supabase lookup
+
+
+def group_hits(hits):
+    """Turn direct news items into {stock_kod: {"hisse_kodu", "sirket_adi", "haberler"}}"""
+    stock_news = {}
+    for item in hits:
+        stock_data = stock_news.setdefault(item["hisse_kodu"], {
+            "hisse_kodu": item["hisse_kodu"],
+            "sirket_adi": item.get("sirket_adi", item["hisse_kodu"]),
+            "haberler": []
+        })
+        if item["haber_url"] not in stock_data["haberler"]:
+            stock_data["haberler"].append(item["haber_url"])
+    return stock_news
+
+
+def next_handoff(hits_queue, stop):
+    """Wait for the next handoff and return (oldest confirmation time, hits, mapping timestamp), or None when stopped
+
+    Hits arriving just after are included. The mapping timestamp is that of
+    the newest cycle that ended among them, or None.
+    """
+    while True:
+        try:
+            confirmed_at, hits, mapping_timestamp = hits_queue.get(timeout=1)
+            break
+        except queue.Empty:
+            if stop.is_set():
+                return None
+    hits = list(hits)
+    linger_until = time.monotonic() + HANDOFF_LINGER_SECONDS
+    while True:
+        try:
+            _, more, timestamp = hits_queue.get(timeout=max(0.0, linger_until - time.monotonic()))
+            hits.extend(more)
+            mapping_timestamp = timestamp or mapping_timestamp
+        except queue.Empty:
+            return confirmed_at, hits, mapping_timestamp
+
+
+def notifier_loop(hits_queue, stop):
+    """Queue and send alerts for hits from the scraper until stopped and the queue is empty
+
+    Once a cycle's mapping is saved and every hit handed off before it was
+    queued, the outbox's mapping cursor moves to that mapping, so a restart
+    only plans what came after. If hits could not be planned, the cursor stays
+    and the next saved mapping is planned from the cursor instead.
+    """
+    conn = outbox.open_outbox(notification_service.OUTBOX_DB)
+    try:
+        requeued, failed = outbox.recover_stale(conn, notification_service.OUTBOX_LEASE_SECONDS)
+        if requeued or failed:
+            print(f"Recovered interrupted notifications: {requeued} requeued, {failed} failed")
+        replan = False
+        if os.path.exists("stock_news_mapping.json"):
+            # News a crashed daemon (or a missed notifier run) never queued; the
+            # outbox and the sent history drop whatever was already queued or sent
+            replan = not notification_service.enqueue_new_deliveries(conn)
+        notification_service.drain_outbox(conn)
+        notification_service.sync_sent_records(conn)
+
+        while True:
+            handoff = next_handoff(hits_queue, stop)
+            if handoff is None:
+                return
+            confirmed_at, hits, mapping_timestamp = handoff
+            if hits:
+                try:
+                    notification_service.enqueue_deliveries(conn, group_hits(hits))
+                except Exception as e:
+                    # Nothing was queued; the hits are planned from the mapping once it is saved
+                    print(f"Error planning notifications: {e}")
+                    replan = True
+            if mapping_timestamp is not None:
+                if replan:
+                    replan = not notification_service.enqueue_new_deliveries(conn)
+                else:
+                    outbox.set_cursor(conn, notification_service.MAPPING_CURSOR, mapping_timestamp)
+            try:
+                sent = notification_service.drain_outbox(conn)
+                notification_service.sync_sent_records(conn)
+                outbox.purge(conn, time.time() - notification_service.OUTBOX_RETENTION_DAYS * 86400)
+                if hits:
+                    metrics.observe("handoff_latency_seconds", time.monotonic() - confirmed_at)
+                    print(f"Handed off {len(hits)} hits, sent {sent} notifications "
+                          f"{time.monotonic() - confirmed_at:.1f}s after the first confirmation")
+            except Exception as e:
+                # The deliveries are queued in the outbox and are sent by the next drain
+                print(f"Error delivering notifications: {e}")
+    finally:
+        conn.close()
+
+
+def seconds_until_next_poll():
+    """Return the seconds until the next source is due for a poll"""
+    next_poll = poll_scheduler.next_poll_time(poll_scheduler.load_schedule(), news_scraper.NEWS_SOURCES)
+    if next_poll is None:
+        return 0.0
+    return max(0.0, (next_poll - datetime.utcnow()).total_seconds())
+
+
+def run_daemon(interval=DAEMON_INTERVAL_SECONDS, stop=None):
+    """Run scrape cycles as sources come due (or every interval seconds) until stop is set (or SIGINT/SIGTERM)"""
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+    hits_queue = queue.Queue()
+    notifier = threading.Thread(target=notifier_loop, args=(hits_queue, stop), name="notifier")
+    notifier.start()
+
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                with metrics.span("run"):
+                    news_scraper.run_cycle(
+                        on_hits=lambda hits: hits_queue.put((time.monotonic(), hits, None)),
+                        on_mapping=lambda timestamp: hits_queue.put((time.monotonic(), [], timestamp))
+                    )
+            except Exception as e:
+                print(f"Error in scrape cycle: {e}")
+            metrics.flush("daemon")
+            if news_scraper.POLL_SCHEDULING:
+                # At least a second, so a cycle that failed before saving the schedule does not spin
+                stop.wait(max(seconds_until_next_poll(), 1.0))
+            else:
+                stop.wait(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        stop.set()
+        notifier.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL_SECONDS,
+                        help="seconds between the starts of two scrape cycles when POLL_SCHEDULING=0")
+    args = parser.parse_args()
+    run_daemon(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,168 +1,435 @@
 import requests
-from bs4 import BeautifulSoup
-import re
-from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import copy
+import hashlib
 import json
 import os
 from datetime import datetime, timedelta
 import time
-import pandas as pd
-from openai import OpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
-# Initialize OpenAI client
-client = OpenAI()
+import metrics
 
-def get_website_html(url):
-    """Fetch HTML content from a given URL"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+from archive_store import open_archive, find_known_links, record_links, prune_archive, iter_links
+from batch_planner import plan_batches
+from discovery import discover_links, freshest_first, source_adapters
+from llm_cache import open_llm_cache, get_verdicts, store_verdicts, evict
+from llm_dispatch import TokenRateLimiter, count_tokens, dispatch_batches
+from poll_scheduler import load_schedule, save_schedule, due_sources, record_poll, defer_poll
+from relevance_gate import gate_articles
+from results_log import append as append_results, run_records, sibling_records
+from seen_set import SeenSet, day_number
+from state_file import write_json
+from stock_universe import load_stock_universe
+from story_clusters import open_clusters, assign_clusters, move_representatives
+from url_canonical import article_key, canonicalize_url
+
+# HTTP settings shared by all listing-page fetches
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+SCRAPER_MAX_WORKERS = int(os.environ.get("SCRAPER_MAX_WORKERS", "5"))  # 1 = sequential fetching
+SCRAPER_PER_HOST_LIMIT = int(os.environ.get("SCRAPER_PER_HOST_LIMIT", "2"))
+
+# Time budget for a whole run, split into per-request timeouts (seconds)
+RUN_DEADLINE_SECONDS = float(os.environ.get("RUN_DEADLINE_SECONDS", "600"))
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("READ_TIMEOUT", "20"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+
+# Circuit breaker for sources that keep failing
+SOURCE_HEALTH_FILE = "source_health.json"
+BREAKER_FAILURE_THRESHOLD = 3  # consecutive failures before a source is probed less often
+BREAKER_BASE_COOLDOWN_MINUTES = 30
+BREAKER_MAX_COOLDOWN_MINUTES = 24 * 60
+
+# Conditional-request cache for listing pages
+HTTP_CACHE_FILE = "http_cache.json"
+
+# Discover links from the sources' feeds and sitemaps before falling back to their listing pages;
+# off until the feed URLs in NEWS_FEEDS are verified against the live sites
+DISCOVERY_FEEDS = os.environ.get("DISCOVERY_FEEDS", "0") != "0"
+
+# Poll each source only when its adaptive interval is up; 0 polls every source on every run.
+# Sources due within the slack are polled now rather than waiting for the next run.
+POLL_SCHEDULING = os.environ.get("POLL_SCHEDULING", "1") != "0"
+POLL_DUE_SLACK_SECONDS = float(os.environ.get("POLL_DUE_SLACK_SECONDS", "60"))
+
+# How long a link stays in the archive after it was last seen on a listing page
+ARCHIVE_RETENTION_HOURS = float(os.environ.get("ARCHIVE_RETENTION_HOURS", "24"))
+
+# How long an article ID is remembered after it was last seen, for long-horizon dedup
+SEEN_SET_RETENTION_DAYS = int(os.environ.get("SEEN_SET_RETENTION_DAYS", "180"))
+
+# How long a stock's news stays in the stock_news_mapping.json history after it was first found
+MAPPING_RETENTION_DAYS = int(os.environ.get("MAPPING_RETENTION_DAYS", "30"))
+
+# Only send (article, stock) pairs found by the local matcher to the LLM; 0 sends everything
+STOCK_PREFILTER = os.environ.get("STOCK_PREFILTER", "1") != "0"
+
+# Analyze one representative per cluster of near-duplicate stories; 0 analyzes every new article
+STORY_CLUSTERING = os.environ.get("STORY_CLUSTERING", "1") != "0"
+
+# Drop articles the trained relevance model (relevance_model.json) scores below its threshold; 0 disables
+RELEVANCE_GATE = os.environ.get("RELEVANCE_GATE", "1") != "0"
+
+# LLM batch dispatch limits
+LLM_MODEL = "gpt-4o-mini"
+LLM_SYSTEM_PROMPT = "You are a helpful assistant. Respond with plain JSON only, no markdown formatting."
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+
+# Prompt packing: target prompt size and the most stocks/articles one prompt may carry
+LLM_PROMPT_TOKEN_BUDGET = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", "4000"))
+LLM_MAX_STOCKS_PER_BATCH = int(os.environ.get("LLM_MAX_STOCKS_PER_BATCH", "20"))
+LLM_MAX_ARTICLES_PER_BATCH = int(os.environ.get("LLM_MAX_ARTICLES_PER_BATCH", "40"))
+
+# Verdict cache per (article, stock) pair, keyed by prompt template and model
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "200000"))
+
+# Listing pages to scrape
+NEWS_SOURCES = {
+    "haberturk": "https://www.haberturk.com/ekonomi/",
+    "trthaber": "https://www.trthaber.com/haber/ekonomi/",
+    "cnnhaber": "https://www.cnnturk.com/ekonomi-haberleri/",
+    "bloomberght": "https://www.bloomberght.com/haberler/turkiye-ekonomisi/",
+    "bigpara": "https://bigpara.hurriyet.com.tr/haberler/ekonomi-haberleri/"
+}
+
+# RSS/Atom feeds and news sitemaps tried before each listing page, in order;
+# pattern keeps the feed's links to the economy section the listing page covers.
+# Bloomberg HT article URLs carry no section, so its site-wide news sitemap
+# cannot be narrowed down and the source keeps its listing page.
+NEWS_FEEDS = {
+    "haberturk": [{"kind": "feed", "url": "https://www.haberturk.com/rss/ekonomi.xml",
+                   "pattern": r"^https://www\.haberturk\.com/[^/]+-\d+-ekonomi$"}],
+    "trthaber": [{"kind": "feed", "url": "https://www.trthaber.com/ekonomi_articles.rss",
+                  "pattern": r"^https://www\.trthaber\.com/haber/ekonomi/[^/]+\.html$"}],
+    "cnnhaber": [{"kind": "feed", "url": "https://www.cnnturk.com/feed/rss/ekonomi/news",
+                  "pattern": r"^https://www\.cnnturk\.com/ekonomi/"}],
+    "bigpara": [{"kind": "feed", "url": "https://bigpara.hurriyet.com.tr/rss/",
+                 "pattern": r"^https://bigpara\.hurriyet\.com\.tr/haberler/ekonomi-haberleri/"}]
+}
+
+_session = None
+_session_lock = threading.Lock()
+_openai_client = None
+_openai_client_lock = threading.Lock()
+_host_semaphores = {}
+_run_deadline = None
+
+def start_run_deadline(seconds=None):
+    """Start the deadline budget for the current run"""
+    global _run_deadline
+    _run_deadline = time.monotonic() + (RUN_DEADLINE_SECONDS if seconds is None else seconds)
+
+def remaining_time():
+    """Return the seconds left in the run budget, or None if no deadline is set"""
+    if _run_deadline is None:
+        return None
+    return max(_run_deadline - time.monotonic(), 0.0)
+
+def deadline_exceeded():
+    """Check whether the run budget has been used up"""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+def get_request_timeout():
+    """Return a (connect, read) timeout for one source, capped by the run budget"""
+    remaining = remaining_time()
+    if remaining is None:
+        return (CONNECT_TIMEOUT, READ_TIMEOUT)
+    return (min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+
+def get_llm_timeout():
+    """Return the timeout for one LLM call, capped by the run budget"""
+    remaining = remaining_time()
+    if remaining is None:
+        return LLM_TIMEOUT
+    return min(LLM_TIMEOUT, remaining)
+
+def get_http_session():
+    """Return the shared requests session with a keep-alive connection pool"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(
+                pool_connections=len(NEWS_SOURCES),
+                pool_maxsize=max(SCRAPER_PER_HOST_LIMIT, 1)
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def get_openai_client():
+    """Return the OpenAI client, created on the first LLM call (retries are handled by the batch dispatcher)"""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            from openai import OpenAI
+            _openai_client = OpenAI(max_retries=0)
+        return _openai_client
+
+def get_host_semaphore(url):
+    """Return the semaphore capping concurrent requests to the host of a URL"""
+    host = urlparse(url).netloc
+    with _session_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(max(SCRAPER_PER_HOST_LIMIT, 1))
+        return _host_semaphores[host]
+
+def get_website_response(url, headers=None, stream=False):
+    """Fetch a URL over the shared session and return the response (None on failure)
+
+    With stream=True the body is read, and the response closed, by the caller.
+    """
+    if deadline_exceeded():
+        print(f"Skipping {url}: run deadline exceeded")
+        return None
+    host = urlparse(url).netloc
     try:
-        response = requests.get(url, headers=headers)
+        with get_host_semaphore(url), metrics.span("fetch", host=host):
+            response = get_http_session().get(url, headers=headers, timeout=get_request_timeout(), stream=stream)
+        metrics.inc("http_responses", host=host, status=response.status_code)
         response.raise_for_status()
-        return response.text
+        return response
     except Exception as e:
+        metrics.inc("fetch_failures", host=host, error=type(e).__name__)
         print(f"Error fetching {url}: {e}")
         return None
 
-def scrape_economy_news():
-    """Scrape economy news links from multiple Turkish news websites and return only unique links with full URLs"""
-    # Set to keep track of all unique links
-    all_unique_links = set()
-    
-    # Define base URLs for each website
-    base_urls = {
-        "haberturk": "https://www.haberturk.com",
-        "trthaber": "",  # TRT Haber links are already complete
-        "cnnhaber": "https://www.cnnturk.com",
-        "bloomberght": "https://www.bloomberght.com",
-        "bigpara": "https://bigpara.hurriyet.com.tr"
-    }
-    
-    # Haberturk
-    haberturk_url = "https://www.haberturk.com/ekonomi/"
-    haberturk = get_website_html(haberturk_url)
-    if haberturk:
-        soup = BeautifulSoup(haberturk, 'html.parser')
-        haberturk_links = soup.find_all('a', {'data-newscategory': 'Ekonomi'}, class_="block gtm-tracker", href=True)
-        for link in haberturk_links:
-            full_url = urljoin(base_urls["haberturk"], link['href'])
-            all_unique_links.add(full_url)
-    
-    # TRT Haber
-    trthaber_url = "https://www.trthaber.com/haber/ekonomi/"
-    trthaber = get_website_html(trthaber_url)
-    if trthaber:
-        soup = BeautifulSoup(trthaber, 'html.parser')
-        all_trt_links = soup.find_all('a', class_="site-url", href=True)
-        for link in all_trt_links:
-            if link['href'].startswith("https://www.trthaber.com/haber/ekonomi/") and link['href'].endswith(".html"):
-                # TRT Haber links are already complete
-                all_unique_links.add(link['href'])
-    
-    # CNN Türk
-    cnnhaber_url = "https://www.cnnturk.com/ekonomi-haberleri/"
-    cnnhaber = get_website_html(cnnhaber_url)
-    if cnnhaber:
-        soup = BeautifulSoup(cnnhaber, 'html.parser')
-        all_cnn_links = soup.find_all('a', class_="navigate", href=True)
-        for link in all_cnn_links:
-            if link['href'].startswith("/ekonomi/"):
-                full_url = urljoin(base_urls["cnnhaber"], link['href'])
-                all_unique_links.add(full_url)
-    
-    # Bloomberg HT
-    bloomberght_url = "https://www.bloomberght.com/haberler/turkiye-ekonomisi/"
-    bloomberght = get_website_html(bloomberght_url)
-    if bloomberght:
-        soup = BeautifulSoup(bloomberght, 'html.parser')
-        all_bloomberg_links = soup.find_all('a', href=True)
-        for link in all_bloomberg_links:
-            if re.search(r'\d$', link['href']):
-                full_url = urljoin(base_urls["bloomberght"], link['href'])
-                all_unique_links.add(full_url)
-    
-    # Big Para
-    bigpara_url = "https://bigpara.hurriyet.com.tr/haberler/ekonomi-haberleri/"
-    bigpara = get_website_html(bigpara_url)
-    if bigpara:
-        soup = BeautifulSoup(bigpara, 'html.parser')
-        all_bigpara_links = soup.find_all('a', {'data-query-param': "bpc", 'href': True})
-        for link in all_bigpara_links:
-            if link['href'].startswith("/haberler/ekonomi-haberleri/"):
-                full_url = urljoin(base_urls["bigpara"], link['href'])
-                all_unique_links.add(full_url)
-    
-    # Return just the list of all unique links with full URLs
-    return list(all_unique_links)
+def get_website_html(url):
+    """Fetch HTML content from a given URL"""
+    response = get_website_response(url)
+    return response.text if response is not None else None
 
-def load_historical_data():
-    """Load historical news data from JSON file"""
-    if os.path.exists("news_archive.json"):
+def fetch_pages(urls, max_workers=None, fetch=get_website_html):
+    """Fetch several URLs concurrently and return a dict of URL to HTML (None on failure)
+    
+    URLs that were not fetched before the run deadline are left out of the
+    result. fetch can be swapped for any function of one key (scrape_economy_news
+    passes source names).
+    """
+    max_workers = max_workers or SCRAPER_MAX_WORKERS
+    if max_workers <= 1 or len(urls) <= 1:
+        pages = {}
+        for url in urls:
+            if deadline_exceeded():
+                break
+            pages[url] = fetch(url)
+        return pages
+    
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    try:
+        futures = {url: executor.submit(fetch, url) for url in urls}
+        wait(futures.values(), timeout=remaining_time())
+        # Sources still running when the budget runs out are given up on
+        return {url: future.result() for url, future in futures.items() if future.done()}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def load_http_cache():
+    """Load stored validators, link sets and hit statistics for listing pages"""
+    if os.path.exists(HTTP_CACHE_FILE):
         try:
-            with open("news_archive.json", "r", encoding="utf-8") as f:
+            with open(HTTP_CACHE_FILE, "r", encoding="utf-8") as f:
                 return json.load(f)
         except:
-            return {"entries": []}
-    return {"entries": []}
+            return {"entries": {}, "stats": {}}
+    return {"entries": {}, "stats": {}}
 
-def save_historical_data(data):
-    """Save historical news data to JSON file"""
-    with open("news_archive.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def save_http_cache(cache):
+    """Save validators, link sets and hit statistics for listing pages"""
+    write_json(HTTP_CACHE_FILE, cache)
 
-def clean_old_entries(data, hours=24):
-    """Remove entries older than specified hours"""
-    now = datetime.utcnow()
-    retention_limit = now - timedelta(hours=hours)
+def update_cache_stats(cache, source, outcome, bytes_downloaded=0, bytes_saved=0):
+    """Count one listing-page fetch outcome (fetched, not_modified or hash_hit) for a source"""
+    stats = cache["stats"].setdefault(source, {
+        "requests": 0, "fetched": 0, "not_modified": 0, "hash_hit": 0,
+        "bytes_downloaded": 0, "bytes_saved": 0
+    })
+    stats["requests"] += 1
+    stats[outcome] += 1
+    stats["bytes_downloaded"] += bytes_downloaded
+    stats["bytes_saved"] += bytes_saved
+    metrics.inc("listing_pages", source=source, outcome=outcome)
+    metrics.inc("listing_bytes_downloaded", bytes_downloaded, source=source)
+
+def print_cache_report(cache, run_outcomes):
+    """Print this run's cache outcome and the overall hit rate for each source"""
+    for source, outcome in run_outcomes.items():
+        stats = cache["stats"][source]
+        hit_rate = (stats["not_modified"] + stats["hash_hit"]) / stats["requests"]
+        print(f"Cache {source}: {outcome} (hit rate {hit_rate:.0%}, "
+              f"{stats['bytes_saved'] / 1024:.0f} KB saved, {stats['bytes_downloaded'] / 1024:.0f} KB downloaded)")
+
+def load_source_health():
+    """Load per-source failure counts and circuit breaker state"""
+    if os.path.exists(SOURCE_HEALTH_FILE):
+        try:
+            with open(SOURCE_HEALTH_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except:
+            return {}
+    return {}
+
+def save_source_health(health):
+    """Save per-source failure counts and circuit breaker state"""
+    write_json(SOURCE_HEALTH_FILE, health)
+
+def is_source_available(health, source, now):
+    """Check whether a source may be fetched, or its circuit is open until the next probe"""
+    state = health.get(source)
+    if not state or state.get("failures", 0) < BREAKER_FAILURE_THRESHOLD:
+        return True
+    return now.isoformat() >= state.get("next_probe", "")
+
+def record_source_result(health, source, success, now):
+    """Update a source's breaker state; each failed probe doubles the cooldown"""
+    if success:
+        health[source] = {"failures": 0, "last_success": now.isoformat()}
+        return
+    state = health.setdefault(source, {"failures": 0})
+    state["failures"] = state.get("failures", 0) + 1
+    state["last_failure"] = now.isoformat()
+    if state["failures"] >= BREAKER_FAILURE_THRESHOLD:
+        cooldown = min(
+            BREAKER_BASE_COOLDOWN_MINUTES * 2 ** (state["failures"] - BREAKER_FAILURE_THRESHOLD),
+            BREAKER_MAX_COOLDOWN_MINUTES
+        )
+        state["next_probe"] = (now + timedelta(minutes=cooldown)).isoformat()
+
+def scrape_economy_news(degraded_sources=None, sources=None, links_by_source=None, published=None):
+    """Scrape economy news links from multiple Turkish news websites and return only unique links with full URLs
+    
+    Only the given sources are polled (all by default). Sources that fail,
+    time out or have an open circuit are skipped and, if a dict is given,
+    recorded in degraded_sources with the reason; if links_by_source is
+    given, it receives each polled source's links, and published receives
+    {link: publish time} for the links that came from a feed or sitemap.
+    """
+    if degraded_sources is None:
+        degraded_sources = {}
+    if links_by_source is None:
+        links_by_source = {}
+    if published is None:
+        published = {}
     
-    # Convert retention_limit to ISO format string for comparison
-    retention_limit_iso = retention_limit.isoformat()
+    # Set to keep track of all unique links
+    all_unique_links = set()
     
-    # Filter out entries older than retention_limit
-    data["entries"] = [entry for entry in data["entries"] if entry["timestamp"] > retention_limit_iso]
-    return data
-
-def identify_new_articles(current_links, historical_data):
-    """Identify articles that are new in this run"""
-    # Get all historical links
-    historical_links = set()
-    for entry in historical_data["entries"]:
-        historical_links.update(entry["news_links"])
+    # Skip sources whose circuit is open
+    now = datetime.utcnow()
+    health = load_source_health()
+    active_sources = {}
+    for source, url in NEWS_SOURCES.items():
+        if sources is not None and source not in sources:
+            continue
+        if is_source_available(health, source, now):
+            active_sources[source] = url
+        else:
+            print(f"Skipping {source}: circuit open until {health[source]['next_probe']}")
+            degraded_sources[source] = "circuit open"
+    
+    # Discover each source's links concurrently over the shared session, from its
+    # feeds where they work and from its listing page otherwise, conditionally where cached
+    http_cache = load_http_cache()
+    adapters = {
+        source: source_adapters(source, url, NEWS_FEEDS.get(source, ()) if DISCOVERY_FEEDS else ())
+        for source, url in active_sources.items()
+    }
+    def discover_source(source):
+        # Each source works on its own copy of its cache entries: a source still
+        # running past the deadline must not touch the cache that is saved
+        entries = {adapter.url: copy.deepcopy(http_cache["entries"][adapter.url])
+                   for adapter in adapters[source] if adapter.url in http_cache["entries"]}
+        return discover_links(adapters[source], entries, get_website_response, now), entries
+    
+    finished = fetch_pages(list(active_sources), fetch=discover_source)
+    results = {}
+    for source, (result, entries) in finished.items():
+        http_cache["entries"].update(entries)
+        results[source] = result
+    for source in active_sources:
+        if source not in results:
+            degraded_sources[source] = "deadline exceeded"
+        elif results[source] is None:
+            degraded_sources[source] = "fetch failed"
+        record_source_result(health, source, results.get(source) is not None, now)
+    for source, reason in degraded_sources.items():
+        metrics.inc("degraded_sources", source=source, reason=reason)
+    save_source_health(health)
+    
+    # Collect the links; unchanged pages and link markup reuse the cached links
+    run_outcomes = {}
+    for source, result in results.items():
+        if result is None:
+            continue
+        update_cache_stats(http_cache, source, result["outcome"], result["bytes_downloaded"], result["bytes_saved"])
+        metrics.inc("discovery", source=source, adapter=result["adapter"])
+        run_outcomes[source] = f"{result['outcome']} from {result['adapter']}"
+        links_by_source[source] = result["links"]
+        published.update(result["published"])
+        metrics.inc("links", len(result["links"]), source=source)
+        all_unique_links.update(result["links"])
+    save_http_cache(http_cache)
+    print_cache_report(http_cache, run_outcomes)
     
-    # Find links that are in current_links but not in historical_links
-    new_articles = [link for link in current_links if link not in historical_links]
-    return new_articles
+    # Return just the list of all unique links with full URLs
+    return list(all_unique_links)
 
-def load_bist100_stocks():
-    """Load BIST 100 stocks from CSV with both names and codes"""
-    csv_path = "bist_100_hisseleri.csv"
-    
-    if not os.path.exists(csv_path):
-        print("Downloading BIST 100 stocks data...")
-        url = "https://raw.githubusercontent.com/burakemretetik/news_signal/master/bist_100_hisseleri.csv"
-        response = requests.get(url)
-        with open(csv_path, "wb") as f:
-            f.write(response.content)
-    
-    bist_100 = pd.read_csv(csv_path)
-    
-    # Return a list of dictionaries with both code and name
-    stocks_with_codes = []
-    for _, row in bist_100.iterrows():
-        stocks_with_codes.append({
-            "kod": row["Hisse Kodu"],
-            "adi": row["Hisse Adı"]
-        })
+def clean_old_entries(archive, hours=None):
+    """Remove links not seen within the specified hours"""
+    hours = ARCHIVE_RETENTION_HOURS if hours is None else hours
+    retention_limit = datetime.utcnow() - timedelta(hours=hours)
     
-    return stocks_with_codes
+    # Range delete on the last_seen index
+    return prune_archive(archive, retention_limit.isoformat())
 
-def create_stock_name_code_mapping(stocks_list):
-    """Creates a mapping between stock names and codes"""
-    name_to_code = {}
-    for stock in stocks_list:
-        name_to_code[stock["adi"]] = stock["kod"]
-    return name_to_code
+def load_seen_articles(archive):
+    """Load the long-horizon seen-set, seeding it from the archive on first use"""
+    seen_articles = SeenSet.load()
+    if seen_articles is None:
+        seen_articles = SeenSet()
+        for url, first_seen, last_seen in iter_links(archive):
+            seen_articles.add(article_key(url), day_number(datetime.fromisoformat(last_seen).date()))
+    return seen_articles
+
+def update_seen_articles(seen_articles, links):
+    """Mark links as seen today and persist the seen-set, dropping expired keys"""
+    today = day_number()
+    for link in links:
+        seen_articles.add(article_key(link), today)
+    seen_articles.save(min_day=today - SEEN_SET_RETENTION_DAYS)
+
+def identify_new_articles(current_links, archive, seen_articles=None):
+    """Identify articles that are new in this run, returned as canonical URLs
+    
+    A link is new if it is neither in the archive nor, by article key, in the
+    seen-set. Variants of the same article within a run are reported once.
+    """
+    # Indexed lookup of the links already in the archive
+    known_links = find_known_links(archive, current_links)
+    
+    # Find links that are in current_links but not in the archive or the seen-set
+    new_articles = []
+    new_keys = set()
+    for link in current_links:
+        if link in known_links:
+            continue
+        key = article_key(link)
+        if key in new_keys or (seen_articles is not None and key in seen_articles):
+            continue
+        new_keys.add(key)
+        new_articles.append(canonicalize_url(link))
+    return new_articles
 
 def create_stock_batches(stock_list, n=10):
     """Creates batches of stock information from a list."""
@@ -171,8 +438,8 @@ def create_stock_batches(stock_list, n=10):
         stock_batches.append(stock_list[i : i + n])  # Slices list into batches of size n
     return stock_batches
 
-def get_llm_response(stock_batch, recent_news):
-    """Sends a prompt with stock batch and news to the LLM and gets a response."""
+def build_llm_prompt(stock_batch, recent_news):
+    """Builds the prompt asking the LLM which news URLs mention the batch's stocks."""
     # Create a stock list with both names and codes for the prompt
     stock_info_list = []
     for stock in stock_batch:
@@ -201,116 +468,330 @@ def get_llm_response(stock_batch, recent_news):
     My Stocks: {stocks_text}
 
     News URL: {recent_news}"""
+    return prompt
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using gpt-4o-mini as specified
+def call_llm(prompt):
+    """Sends a prompt to the LLM and returns the response text; raises on API errors."""
+    with metrics.span("llm_request", model=LLM_MODEL):
+        response = get_openai_client().chat.completions.create(
+            model=LLM_MODEL,  # Using gpt-4o-mini as specified
             messages=[
-                {"role": "system", "content": "You are a helpful assistant. Respond with plain JSON only, no markdown formatting."},
+                {"role": "system", "content": LLM_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            timeout=get_llm_timeout()
         )
-        content = response.choices[0].message.content
+    if response.usage is not None:
+        metrics.inc("llm_prompt_tokens", response.usage.prompt_tokens, model=LLM_MODEL)
+        metrics.inc("llm_completion_tokens", response.usage.completion_tokens, model=LLM_MODEL)
+    content = response.choices[0].message.content
+    
+    # Remove markdown code block formatting if present
+    if content.startswith("```json") and content.endswith("```"):
+        content = content.strip("```json").strip("```").strip()
+    elif content.startswith("```") and content.endswith("```"):
+        content = content.strip("```").strip()
         
-        # Remove markdown code block formatting if present
-        if content.startswith("```json") and content.endswith("```"):
-            content = content.strip("```json").strip("```").strip()
-        elif content.startswith("```") and content.endswith("```"):
-            content = content.strip("```").strip()
-            
-        return content
-    except Exception as e:
-        print(f"Error getting LLM response: {e}")
-        return json.dumps({"direct_news": [], "no_direct_news_found": True, "error": str(e)})
+    return content
 
-def analyze_news_for_stocks(new_articles):
-    """Analyze new articles for relevance to BIST 100 stocks"""
-    # Load BIST 100 stocks with codes
-    stocks_with_codes = load_bist100_stocks()
-    
-    # Create a mapping from company name to stock code for later use
-    name_to_code_map = create_stock_name_code_mapping(stocks_with_codes)
-    
-    # Create batches of 10 stocks
-    stock_batches = create_stock_batches(stocks_with_codes, n=10)
-    
-    # Initialize results
+def get_prompt_fingerprint():
+    """Hashes the model and prompt template; cached verdicts are only reused while it is unchanged."""
+    template = build_llm_prompt([{"kod": "{kod}", "adi": "{adi}"}], ["{url}"])
+    return hashlib.sha256(f"{LLM_MODEL}\n{LLM_SYSTEM_PROMPT}\n{template}".encode("utf-8")).hexdigest()
+
+def parse_llm_result(content):
+    """Parses the LLM's JSON answer; raises ValueError if it has no direct_news list."""
+    result = json.loads(content)
+    if not isinstance(result, dict) or not isinstance(result.get("direct_news"), list):
+        raise ValueError("LLM response has no direct_news list")
+    return result
+
+def confirmed_hits(result):
+    """Return the well-formed direct news items of a parsed LLM result"""
+    return [
+        item for item in result.get("direct_news", [])
+        if isinstance(item, dict) and item.get("hisse_kodu") and item.get("haber_url")
+    ]
+
+def analyze_news_for_stocks(new_articles, on_hits=None, siblings=None):
+    """Analyze new articles for relevance to BIST 100 stocks
+
+    on_hits(direct_news), if given, receives confirmed hits as soon as each
+    batch (or the verdict cache) produces them, before the analysis finishes.
+    siblings ({article: [URLs of the same story]}) are prefiltered with the
+    article they belong to.
+    """
+    # Load BIST 100 stocks with codes (indexed once per process)
+    universe = load_stock_universe()
+    stocks_with_codes = universe.stocks
+    
+    # (stock, article) pairs to decide: local mentions only, or every pair without the prefilter
+    full_batch_count = len(create_stock_batches(stocks_with_codes, n=10))
+    if STOCK_PREFILTER:
+        candidates = story_candidates(universe.get_matcher(), new_articles, siblings or {})
+    else:
+        candidates = {stock["kod"]: list(new_articles) for stock in stocks_with_codes}
+    
+    # Reuse cached verdicts; only the uncached pairs go to the LLM
+    fingerprint = get_prompt_fingerprint()
+    llm_cache = open_llm_cache()
+    cached_verdicts = get_verdicts(
+        llm_cache, fingerprint,
+        [(article_key(url), code) for code, urls in candidates.items() for url in urls],
+        LLM_CACHE_TTL_SECONDS
+    )
+    stocks_by_code = universe.by_code
+    cached_news = []
+    pending = {}
+    for code, urls in candidates.items():
+        for url in urls:
+            verdict = cached_verdicts.get((article_key(url), code))
+            if verdict is None:
+                pending.setdefault(code, []).append(url)
+            elif verdict:
+                cached_news.append({"hisse_kodu": code, "sirket_adi": stocks_by_code[code]["adi"], "haber_url": url})
+    
+    if on_hits is not None and cached_news:
+        on_hits(cached_news)
+    
+    # Pack the pending pairs into prompts under the token budget
+    overhead_tokens = count_tokens(LLM_SYSTEM_PROMPT) + count_tokens(build_llm_prompt([], []))
+    strategy, jobs = plan_batches(
+        pending, stocks_with_codes, count_tokens, overhead_tokens,
+        LLM_PROMPT_TOKEN_BUDGET, LLM_MAX_STOCKS_PER_BATCH, LLM_MAX_ARTICLES_PER_BATCH
+    )
+    for job in jobs:
+        job["prompt"] = build_llm_prompt(job["stocks"], job["articles"])
+    estimated_tokens = sum(job["estimated_tokens"] for job in jobs)
+    candidate_pairs = sum(len(urls) for urls in candidates.values())
+    metrics.inc("llm_cache_hits", len(cached_verdicts))
+    metrics.inc("llm_cache_misses", candidate_pairs - len(cached_verdicts))
+    metrics.inc("llm_batches", len(jobs))
+    metrics.inc("llm_estimated_prompt_tokens", estimated_tokens)
+    print(f"{candidate_pairs} candidate pairs, {len(cached_verdicts)} cached, "
+          f"{len(jobs)}/{full_batch_count} LLM calls ({strategy}), ~{estimated_tokens} prompt tokens")
+    for batch_idx, job in enumerate(jobs):
+        print(f"Batch {batch_idx+1}: {len(job['stocks'])} stocks x {len(job['articles'])} articles, "
+              f"~{job['estimated_tokens']} prompt tokens")
+    
+    def stream_hits(job, outcome):
+        if on_hits is not None and outcome["error"] is None:
+            hits = confirmed_hits(outcome["result"])
+            if hits:
+                on_hits(hits)
+    
+    # Run all batches concurrently; failed or unparseable batches are retried on their own
+    outcomes = dispatch_batches(
+        jobs,
+        lambda job: parse_llm_result(call_llm(job["prompt"])),
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        limiter=TokenRateLimiter(LLM_TOKENS_PER_MINUTE),
+        max_retries=LLM_MAX_RETRIES,
+        remaining_time=remaining_time,
+        on_result=stream_hits
+    )
+    
+    # Summarize each batch, referencing its stocks by code
     all_results = []
+    for batch_idx, (job, outcome) in enumerate(zip(jobs, outcomes)):
+        if outcome["error"]:
+            metrics.inc("llm_batch_failures")
+            print(f"Batch {batch_idx+1}/{len(jobs)} failed after {outcome['attempts']} attempts: {outcome['error']}")
+        all_results.append({
+            "batch": batch_idx + 1,
+            "stocks": [stock["kod"] for stock in job["stocks"]],
+            "articles": len(job["articles"]),
+            "estimated_tokens": job["estimated_tokens"],
+            "attempts": outcome["attempts"],
+            "error": outcome["error"]
+        })
+    
+    # Cache a verdict for every pair sent in a batch that got a valid answer
+    new_verdicts = {}
+    for job, outcome in zip(jobs, outcomes):
+        if outcome["error"]:
+            continue
+        hits = {
+            (item.get("hisse_kodu"), article_key(item.get("haber_url", "")))
+            for item in outcome["result"]["direct_news"] if isinstance(item, dict)
+        }
+        for stock in job["stocks"]:
+            for url in job["articles"]:
+                key = article_key(url)
+                new_verdicts[(key, stock["kod"])] = (stock["kod"], key) in hits
+    store_verdicts(llm_cache, fingerprint, new_verdicts)
+    evict(llm_cache, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES)
+    llm_cache.close()
+    
+    # Articles with a verdict for every candidate pair: the labeled data for the relevance gate
+    failed_articles = {url for job, outcome in zip(jobs, outcomes) if outcome["error"] for url in job["articles"]}
+    candidate_articles = {url for urls in candidates.values() for url in urls}
+    judged_articles = [url for url in new_articles if url in candidate_articles and url not in failed_articles]
+    
+    # Aggregate the well-formed direct news, including cached hits
+    direct_news = list(cached_news)
+    for outcome in outcomes:
+        if outcome["error"] is None:
+            direct_news.extend(confirmed_hits(outcome["result"]))
     
-    # Process each batch
-    for batch_idx, stock_batch in enumerate(stock_batches):
-        print(f"Processing batch {batch_idx+1}/{len(stock_batches)}")
-        response = get_llm_response(stock_batch, new_articles)
-        
-        try:
-            # Try to parse the response as JSON
-            result = json.loads(response)
-            all_results.append({
-                "batch": batch_idx + 1,
-                "stocks": stock_batch,
-                "result": result
-            })
-        except json.JSONDecodeError:
-            print(f"Error parsing JSON response for batch {batch_idx+1}")
-            all_results.append({
-                "batch": batch_idx + 1,
-                "stocks": stock_batch,
-                "result": {"error": "Failed to parse response", "raw_response": response}
-            })
-    
-    # Aggregate all direct news
-    direct_news = []
-    for result in all_results:
-        if "result" in result and "direct_news" in result["result"]:
-            direct_news.extend(result["result"]["direct_news"])
-    
-    # Save results
     current_time = datetime.utcnow().isoformat()
     analysis_results = {
         "timestamp": current_time,
-        "total_batches": len(stock_batches),
+        "total_batches": len(jobs),
+        "batches_without_prefilter": full_batch_count,
+        "batch_strategy": strategy,
+        "estimated_prompt_tokens": estimated_tokens,
+        "cached_verdicts": len(cached_verdicts),
         "total_direct_news": len(direct_news),
         "direct_news": direct_news,
+        "judged_articles": judged_articles,
         "batch_results": all_results
     }
     
-    with open("stock_news_analysis.json", "w", encoding="utf-8") as f:
-        json.dump(analysis_results, f, indent=2, ensure_ascii=False)
-    
+    metrics.inc("direct_news", len(direct_news))
     print(f"Stock news analysis completed. Found {len(direct_news)} relevant news articles.")
     return analysis_results
 
-def create_stock_news_mapping(direct_news):
-    """Create a mapping of stocks to their related news articles"""
-    stock_news_mapping = {}
-    
+def story_candidates(matcher, representatives, siblings):
+    """Map stock code -> the representatives of the stories where any article's slug may mention it"""
+    story_of = {}
+    for url in representatives:
+        for member in [url] + siblings.get(url, []):
+            story_of.setdefault(member, url)
+    return {
+        code: list(dict.fromkeys(story_of[url] for url in urls))
+        for code, urls in matcher.candidates(list(story_of)).items()
+    }
+
+def prefer_matched_representatives(matcher, representatives, siblings):
+    """Make each story's representative the article whose slug names the most stocks (the first on a tie)
+
+    Returns (representatives, siblings, moved), moved mapping each replaced
+    representative to its replacement.
+    """
+    stories = {url: [url] + siblings.get(url, []) for url in representatives if url in siblings}
+    codes = {}
+    for code, urls in matcher.candidates([url for members in stories.values() for url in members]).items():
+        for url in urls:
+            codes[url] = codes.get(url, 0) + 1
+    chosen, regrouped, moved = [], {}, {}
+    for url in representatives:
+        members = stories.get(url)
+        if members is None:
+            chosen.append(url)
+            continue
+        best = max(members, key=lambda member: codes.get(member, 0))
+        if best != url:
+            moved[url] = best
+        chosen.append(best)
+        regrouped[best] = [member for member in members if member != best]
+    return chosen, regrouped, moved
+
+def late_story_siblings(history, absorbed):
+    """Map (stock code, earlier hit URL) -> the articles that joined that hit's story in this run"""
+    hits = {}
+    for stock_code, stock_data in history.items():
+        for url in stock_data["first_seen"]:
+            hits.setdefault(article_key(url), []).append((stock_code, url))
+    late = {}
+    for url, representative in absorbed.items():
+        for hit in hits.get(article_key(representative), ()):
+            late.setdefault(hit, []).append(url)
+    return late
+
+def attach_siblings(direct_news, siblings):
+    """Add the URLs of the same story on other outlets to each hit on a cluster representative"""
+    siblings_by_key = {article_key(url): urls for url, urls in siblings.items()}
     for news_item in direct_news:
-        stock_code = news_item['hisse_kodu']
-        news_url = news_item['haber_url']
-        
-        if stock_code not in stock_news_mapping:
-            stock_news_mapping[stock_code] = {
-                "hisse_kodu": stock_code,  # Added this line to include the stock code in each entry
-                "sirket_adi": news_item['sirket_adi'],
-                "haberler": []
-            }
-        
-        stock_news_mapping[stock_code]["haberler"].append(news_url)
-    
-    return stock_news_mapping
+        urls = siblings_by_key.get(article_key(news_item.get("haber_url", "")))
+        if urls:
+            news_item["sibling_urls"] = urls
+
+def load_stock_news_history(path="stock_news_mapping.json"):
+    """Load the stock news history and the timestamp of the run that saved it
+
+    The history is {stock code: {"hisse_kodu", "sirket_adi", "first_seen": {url: timestamp}}}.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            mapping_data = json.load(f)
+    except Exception:
+        print("Error loading existing stock news mapping, creating new one")
+        return {}, None
+
+    # Mappings written before first-seen tracking age out from their last timestamp
+    fallback = mapping_data.get("timestamp") or datetime.utcnow().isoformat()
+    history = {}
+    for stock_code, stock_data in mapping_data.get("stock_news", {}).items():
+        first_seen = stock_data.get("first_seen", {})
+        history[stock_code] = {
+            "hisse_kodu": stock_code,
+            "sirket_adi": stock_data.get("sirket_adi", stock_code),
+            "first_seen": {url: first_seen.get(url, fallback) for url in stock_data.get("haberler", [])}
+        }
+    return history, mapping_data.get("timestamp")
 
-def save_stock_news_mapping(stock_news_mapping, timestamp):
-    """Save the stock-to-news mapping to a JSON file"""
+def merge_stock_news(history, direct_news, timestamp):
+    """Add direct news hits to the history and return the delta: the (stock, URL) pairs new in this run"""
+    delta = {}
+    for news_item in direct_news:
+        stock_code = news_item["hisse_kodu"]
+        news_url = news_item["haber_url"]
+        stock_history = history.setdefault(stock_code, {
+            "hisse_kodu": stock_code,
+            "sirket_adi": news_item.get("sirket_adi", stock_code),
+            "first_seen": {}
+        })
+        if news_url in stock_history["first_seen"]:
+            continue
+        stock_history["first_seen"][news_url] = timestamp
+        delta.setdefault(stock_code, {
+            "hisse_kodu": stock_code,
+            "sirket_adi": stock_history["sirket_adi"],
+            "first_seen": {}
+        })["first_seen"][news_url] = timestamp
+    return delta
+
+def prune_stock_news_history(history, cutoff):
+    """Drop news first seen before the cutoff timestamp and stocks left without news; returns the URLs removed"""
+    removed = 0
+    for stock_code in list(history):
+        first_seen = history[stock_code]["first_seen"]
+        expired = [url for url, seen in first_seen.items() if seen < cutoff]
+        for url in expired:
+            del first_seen[url]
+        removed += len(expired)
+        if not first_seen:
+            del history[stock_code]
+    return removed
+
+def serialize_stock_news(stock_news):
+    """Turn {stock code: entry} into the mapping file layout with a "haberler" URL list per stock"""
+    return {
+        stock_code: {
+            "hisse_kodu": stock_code,
+            "sirket_adi": stock_data["sirket_adi"],
+            "haberler": list(stock_data["first_seen"]),
+            "first_seen": stock_data["first_seen"]
+        }
+        for stock_code, stock_data in stock_news.items()
+    }
+
+def save_stock_news_mapping(history, delta, timestamp, previous_timestamp=None):
+    """Save the run's delta next to the pruned stock news history
+
+    previous_timestamp is the run the loaded history came from: the delta
+    holds everything first seen after it.
+    """
     mapping_data = {
-        "timestamp": timestamp,
-        "updated": len(stock_news_mapping) > 0,
-        "stock_news": stock_news_mapping
+        "timestamp": timestamp,  # Always update timestamp
+        "previous_timestamp": previous_timestamp,
+        "updated": len(delta) > 0,
+        "delta": serialize_stock_news(delta),
+        "stock_news": serialize_stock_news(history)
     }
     
-    with open("stock_news_mapping.json", "w", encoding="utf-8") as f:
-        json.dump(mapping_data, f, indent=2, ensure_ascii=False)
-    
-    return mapping_data
+    write_json("stock_news_mapping.json", mapping_data)
 
 def ensure_mapping_file_exists():
     """Ensure stock_news_mapping.json file exists"""
@@ -319,49 +800,113 @@ def ensure_mapping_file_exists():
         mapping_data = {
             "timestamp": datetime.utcnow().isoformat(),
             "updated": False,
+            "delta": {},
             "stock_news": {}
         }
-        with open("stock_news_mapping.json", "w", encoding="utf-8") as f:
-            json.dump(mapping_data, f, indent=2, ensure_ascii=False)
+        write_json("stock_news_mapping.json", mapping_data)
         print("Created initial stock_news_mapping.json file")
 
-def main():
-    """Main function to run the news scraper and analyzer."""
+def run_cycle(on_hits=None, on_mapping=None):
+    """Scrape, dedup and analyze one round of news and publish the stock news mapping; returns the delta
+
+    on_hits is passed on to analyze_news_for_stocks to stream confirmed hits;
+    on_mapping(timestamp), if given, is called once the mapping is saved.
+    """
+    # Start the time budget for this run
+    start_run_deadline()
+    
     # Ensure mapping file exists
     ensure_mapping_file_exists()
     
     current_time = datetime.utcnow()
     current_time_iso = current_time.isoformat()
     
-    # Scrape current news
-    news_links = scrape_economy_news()
+    # Pick the sources whose polling interval is up
+    schedule = load_schedule()
+    sources = list(NEWS_SOURCES)
+    if POLL_SCHEDULING:
+        sources = due_sources(schedule, sources, current_time, POLL_DUE_SLACK_SECONDS)
+        print(f"Sources due for polling: {', '.join(sources) if sources else 'none'}")
+    
+    # Scrape current news, continuing with whatever sources responded in time
+    degraded_sources = {}
+    links_by_source = {}
+    published = {}
+    with metrics.span("scrape"):
+        news_links = scrape_economy_news(degraded_sources, sources, links_by_source, published) if sources else []
+    metrics.inc("scraped_links", len(news_links))
     print(f"Scraped {len(news_links)} news links at {current_time_iso}")
+    if degraded_sources:
+        print(f"Degraded sources in this run: {degraded_sources}")
     
-    # Load historical data
-    historical_data = load_historical_data()
+    # Open the news archive (migrates news_archive.json on first use)
+    archive = open_archive()
     
     # Identify new articles
-    new_articles = identify_new_articles(news_links, historical_data)
-    
-    # Add current batch to historical data
-    historical_data["entries"].append({
-        "timestamp": current_time_iso,
-        "news_links": news_links
-    })
-    
-    # Clean old entries (older than 24 hours)
-    historical_data = clean_old_entries(historical_data)
-    
-    # Save updated historical data
-    save_historical_data(historical_data)
+    with metrics.span("dedup"):
+        seen_articles = load_seen_articles(archive)
+        new_articles = identify_new_articles(news_links, archive, seen_articles)
+    metrics.inc("new_articles", len(new_articles))
+    
+    # Newest first where a feed gave the publish time, so the freshest news is analyzed first
+    published = {canonicalize_url(link): timestamp for link, timestamp in published.items()}
+    new_articles = freshest_first(new_articles, published)
+    
+    # Adapt each polled source's interval to how many new links it just had
+    new_set = set(new_articles)
+    for source in sources:
+        if source in links_by_source:
+            new_links = sum(1 for link in links_by_source[source] if canonicalize_url(link) in new_set)
+            record_poll(schedule, source, new_links, current_time)
+            print(f"Polling {source}: {new_links} new links, next poll in {schedule[source]['interval']:.0f}s")
+        else:
+            defer_poll(schedule, source, current_time)
+    save_schedule(schedule)
+    
+    # Add current links to the archive and drop links outside the retention window
+    with metrics.span("archive"):
+        record_links(archive, news_links, current_time_iso)
+        clean_old_entries(archive)
+        archive.close()
+        update_seen_articles(seen_articles, news_links)
+    
+    # Group near-duplicates of the same story across outlets, here or in recent runs
+    representatives, siblings, absorbed = list(new_articles), {}, {}
+    if STORY_CLUSTERING and new_articles:
+        with metrics.span("cluster"):
+            clusters = open_clusters()
+            representatives, siblings, absorbed = assign_clusters(clusters, new_articles)
+            if STOCK_PREFILTER and siblings:
+                # Analyze the article of each story that names a company, if one does
+                representatives, siblings, moved = prefer_matched_representatives(
+                    load_stock_universe().get_matcher(), representatives, siblings)
+                move_representatives(clusters, moved)
+            clusters.close()
+        duplicates = len(new_articles) - len(representatives)
+        metrics.inc("duplicate_articles", duplicates)
+        if duplicates:
+            print(f"Clustered {len(new_articles)} new articles into {len(representatives)} stories "
+                  f"({len(absorbed)} joined stories from earlier runs)")
+            for url, representative in absorbed.items():
+                print(f"Duplicate of an earlier story: {url} ({representative})")
+    
+    # Skip stories the relevance model is confident no stock is linked to
+    gated = []
+    if RELEVANCE_GATE and representatives:
+        with metrics.span("gate"):
+            representatives, gated = gate_articles(representatives)
+        metrics.inc("gated_articles", len(gated))
+        if gated:
+            print(f"Relevance gate dropped {len(gated)} of {len(representatives) + len(gated)} stories")
     
     # Always create/update the new_articles.json file with timestamp even if empty
     new_articles_data = {
         "timestamp": current_time_iso,
-        "new_articles": new_articles if new_articles else []
+        "new_articles": new_articles if new_articles else [],
+        "published": {url: published[url] for url in new_articles if url in published},
+        "degraded_sources": degraded_sources
     }
-    with open("new_articles.json", "w", encoding="utf-8") as f:
-        json.dump(new_articles_data, f, indent=2, ensure_ascii=False)
+    write_json("new_articles.json", new_articles_data)
     print(f"New articles file updated at {current_time_iso}")
     
     # Initialize analysis_results with current timestamp
@@ -378,77 +923,64 @@ def main():
         print(f"\n{len(new_articles)} NEW ARTICLES FOUND IN THIS RUN:")
         for article in new_articles:
             print(article)
-        
-        # Analyze new articles for BIST 100 stock relevance
+    if representatives:
+        # Analyze one article per story for BIST 100 stock relevance
         print("\nAnalyzing new articles for BIST 100 stock relevance...")
-        analysis_results = analyze_news_for_stocks(new_articles)
+        with metrics.span("analysis"):
+            analysis_results = analyze_news_for_stocks(representatives, on_hits, siblings)
+        attach_siblings(analysis_results["direct_news"], siblings)
         
         # Print summary of analysis
         if analysis_results["total_direct_news"] > 0:
             print("\nRELEVANT NEWS FOUND:")
             for news in analysis_results["direct_news"]:
-                print(f"Stock: {news['hisse_kodu']} - {news['sirket_adi']} - URL: {news['haber_url']}")
+                print(f"Stock: {news['hisse_kodu']} - {news.get('sirket_adi', '')} - URL: {news['haber_url']}")
         else:
             print("\nNo relevant news found for BIST 100 stocks.")
+    elif new_articles:
+        print("\nNo new article passed clustering and the relevance gate.")
     else:
         print("\nNo new articles found in this run.")
     
-    # Always save analysis results with updated timestamp, even if empty
+    # Log the run and its hits, even if empty
     analysis_results["timestamp"] = current_time_iso  # Ensure timestamp is always current
-    with open("stock_news_analysis.json", "w", encoding="utf-8") as f:
-        json.dump(analysis_results, f, indent=2, ensure_ascii=False)
-    
-    # Load existing stock news mapping if it exists
-    existing_mapping = {}
-    if os.path.exists("stock_news_mapping.json"):
-        try:
-            with open("stock_news_mapping.json", "r", encoding="utf-8") as f:
-                mapping_data = json.load(f)
-                existing_mapping = mapping_data.get("stock_news", {})
-        except:
-            print("Error loading existing stock news mapping, creating new one")
-    
-    # Create new mapping from direct news
-    if analysis_results["total_direct_news"] > 0:
-        new_mapping = create_stock_news_mapping(analysis_results["direct_news"])
+    append_results(run_records(current_time_iso, analysis_results, len(new_articles), degraded_sources,
+                               len(new_articles) - len(representatives) - len(gated), len(gated), new_articles))
+    
+    # Merge this run's hits into the history; the notifier plans what it has not planned yet
+    with metrics.span("mapping"):
+        history, previous_timestamp = load_stock_news_history()
+        late_siblings = late_story_siblings(history, absorbed)
+        if late_siblings:
+            # Copies of a story that was a hit in an earlier run join that hit
+            append_results(sibling_records(current_time_iso, late_siblings))
+            print(f"Attached {sum(map(len, late_siblings.values()))} late copies to {len(late_siblings)} earlier hits")
+        delta = merge_stock_news(history, analysis_results["direct_news"], current_time_iso)
+        cutoff = (current_time - timedelta(days=MAPPING_RETENTION_DAYS)).isoformat()
+        pruned = prune_stock_news_history(history, cutoff)
+        if pruned:
+            print(f"Pruned {pruned} stock news older than {MAPPING_RETENTION_DAYS} days from the mapping")
         
-        # Merge with existing mapping
-        new_mapping_items = False
-        for stock_code, stock_data in new_mapping.items():
-            if stock_code not in existing_mapping:
-                # Add new stock entry with hisse_kodu
-                existing_mapping[stock_code] = {
-                    "hisse_kodu": stock_code,  # Added this line to include the stock code in each entry
-                    "sirket_adi": stock_data["sirket_adi"],
-                    "haberler": []
-                }
-            elif "hisse_kodu" not in existing_mapping[stock_code]:
-                # Add hisse_kodu to existing entries that might not have it
-                existing_mapping[stock_code]["hisse_kodu"] = stock_code
-            
-            # Add any new news URLs
-            for news_url in stock_data["haberler"]:
-                if news_url not in existing_mapping[stock_code]["haberler"]:
-                    existing_mapping[stock_code]["haberler"].append(news_url)
-                    new_mapping_items = True
-    else:
-        new_mapping_items = False
-    
-    # Always save the mapping file with current timestamp in every run
-    mapping_data = {
-        "timestamp": current_time_iso,  # Always update timestamp
-        "updated": new_mapping_items,
-        "stock_news": existing_mapping
-    }
-    
-    with open("stock_news_mapping.json", "w", encoding="utf-8") as f:
-        json.dump(mapping_data, f, indent=2, ensure_ascii=False)
+        # Always save the mapping file with current timestamp in every run
+        save_stock_news_mapping(history, delta, current_time_iso, previous_timestamp)
+    if on_mapping is not None:
+        on_mapping(current_time_iso)
+    new_mapping_items = len(delta) > 0
     
     print(f"\nStock news mapping updated at {current_time_iso}")
     if new_mapping_items:
-        print(f"Added new news for stocks")
+        print(f"Added {sum(len(data['first_seen']) for data in delta.values())} new news for {len(delta)} stocks")
     else:
         print("No new stock-specific news added in this run")
+    return delta
+
+def main():
+    """Main function to run the news scraper and analyzer."""
+    try:
+        with metrics.profiled(), metrics.span("run"):
+            run_cycle()
+    finally:
+        metrics.flush("scraper")
 
 if __name__ == "__main__":
     main()
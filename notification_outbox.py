@@ -0,0 +1,264 @@
+"""Durable SQLite outbox for WhatsApp deliveries
+
+Every planned delivery is stored under a deterministic key derived from
+(user, stock, news URL) before anything is sent, so planning twice never
+queues a message twice. Deliveries move pending -> in_flight -> sent/failed;
+workers claim pending rows in batches inside an immediate transaction, so
+several drainers can work on the same outbox. A recipient with a message in
+flight is not claimed by another worker, which keeps each recipient's
+messages in order. Several deliveries may share one (digest) message; each
+keeps its own row and state. Finished rows are pushed to Supabase's
+sent_notifications and marked recorded, so a failed insert is retried on the
+next run instead of being lost. A cursor records how far the stock news
+mapping has been planned, so news from runs the notifier missed is still
+planned.
+
+The connection is shared by the sender threads; callers serialize writes.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+from sqlite_params import parameter_chunks
+
+OUTBOX_DB = "notification_outbox.db"
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+SENT = "sent"
+FAILED = "failed"
+
+# recorded flag of a row whose sent_notifications write is in progress
+_RECORDING = -1
+
+
+def open_outbox(path=OUTBOX_DB):
+    """Open (and create if needed) the outbox database"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            user_id TEXT NOT NULL,
+            stock_kod TEXT NOT NULL,
+            news_url TEXT NOT NULL,
+            phone_number TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            message_id TEXT,
+            error TEXT,
+            claimed_by TEXT,
+            claimed_at REAL,
+            recorded INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_state_phone ON outbox (state, phone_number)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_state_id ON outbox (state, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_recorded ON outbox (recorded, state)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cursors (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def delivery_key(user_id, stock_kod, news_url):
+    """Return the idempotency key of a (user, stock, news URL) delivery"""
+    return hashlib.sha256(f"{user_id}\n{stock_kod}\n{news_url}".encode("utf-8")).hexdigest()[:32]
+
+
+def enqueue(conn, entries):
+    """Queue {user_id, stock_kod, news_url, phone_number, payload} deliveries; returns the number added
+
+    Deliveries whose key is already in the outbox, in any state, are skipped.
+    """
+    now = time.time()
+    before = conn.total_changes
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO outbox
+                (key, user_id, stock_kod, news_url, phone_number, payload, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            delivery_key(entry["user_id"], entry["stock_kod"], entry["news_url"]),
+            str(entry["user_id"]), entry["stock_kod"], entry["news_url"], entry["phone_number"],
+            json.dumps(entry["payload"], ensure_ascii=False), now, now
+        ) for entry in entries])
+    return conn.total_changes - before
+
+
+def recover_stale(conn, lease_seconds):
+    """Release the claims of workers that died; returns (requeued, failed) in-flight delivery counts
+
+    Deliveries that were never attempted go back to pending. An attempted one
+    may or may not have reached WhatsApp, so it is failed rather than sent
+    again: a duplicate alert is worse than a missed one.
+    """
+    now = time.time()
+    cutoff = now - lease_seconds
+    with conn:
+        conn.execute("UPDATE outbox SET recorded = 0 WHERE recorded = ? AND updated_at < ?",
+                     (_RECORDING, cutoff))
+        requeued = conn.execute("""
+            UPDATE outbox SET state = ?, claimed_by = NULL, claimed_at = NULL, updated_at = ?
+            WHERE state = ? AND claimed_at < ? AND attempts = 0
+        """, (PENDING, now, IN_FLIGHT, cutoff)).rowcount
+        failed = conn.execute("""
+            UPDATE outbox SET state = ?, error = 'Interrupted while in flight', updated_at = ?
+            WHERE state = ? AND claimed_at < ?
+        """, (FAILED, now, IN_FLIGHT, cutoff)).rowcount
+    return requeued, failed
+
+
+def claim_batch(conn, worker_id, limit):
+    """Claim the pending deliveries of the oldest waiting recipients, about limit in total, as dicts
+
+    A recipient's pending deliveries are claimed together, so they can be
+    coalesced; recipients that already have a delivery in flight are skipped.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        busy = {row[0] for row in conn.execute(
+            "SELECT DISTINCT phone_number FROM outbox WHERE state = ?", (IN_FLIGHT,))}
+        # Walk the pending rows in id order until the waiting recipients found hold limit rows
+        waiting, seen = [], 0
+        pending = conn.execute("SELECT phone_number FROM outbox WHERE state = ? ORDER BY id", (PENDING,))
+        for (phone_number,) in pending:
+            if phone_number in busy:
+                continue
+            if phone_number not in waiting:
+                waiting.append(phone_number)
+            seen += 1
+            if seen >= limit:
+                break
+        pending.close()
+        counts = dict(_pending_counts(conn, waiting))
+        phones, total = [], 0
+        for phone_number in waiting:
+            count = counts[phone_number]
+            if phones and total + count > limit:
+                break
+            phones.append(phone_number)
+            total += count
+
+        rows = []
+        for chunk, placeholders in parameter_chunks(phones):
+            rows += conn.execute(f"""
+                SELECT id, key, user_id, stock_kod, news_url, phone_number, payload, created_at FROM outbox
+                WHERE state = ? AND phone_number IN ({placeholders})
+            """, [PENDING] + chunk).fetchall()
+            conn.execute(f"""
+                UPDATE outbox SET state = ?, claimed_by = ?, claimed_at = ?, updated_at = ?
+                WHERE state = ? AND phone_number IN ({placeholders})
+            """, [IN_FLIGHT, worker_id, now, now, PENDING] + chunk)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    rows.sort()
+    return [{
+        "key": key, "user_id": user_id, "stock_kod": stock_kod, "news_url": news_url,
+        "phone_number": phone_number, "payload": json.loads(payload), "created_at": created_at
+    } for _, key, user_id, stock_kod, news_url, phone_number, payload, created_at in rows]
+
+
+def _pending_counts(conn, phones):
+    for chunk, placeholders in parameter_chunks(phones):
+        yield from conn.execute(f"""
+            SELECT phone_number, COUNT(*) FROM outbox
+            WHERE state = ? AND phone_number IN ({placeholders}) GROUP BY phone_number
+        """, [PENDING] + chunk)
+
+
+def mark_attempt(conn, keys):
+    """Count a send attempt for claimed deliveries, right before the request goes out"""
+    with conn:
+        conn.executemany("UPDATE outbox SET attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                         [(time.time(), key) for key in keys])
+
+
+def mark_result(conn, keys, message_id, error):
+    """Record the outcome of the message that carried the given claimed deliveries"""
+    with conn:
+        conn.executemany("""
+            UPDATE outbox SET state = ?, message_id = ?, error = ?, updated_at = ?
+            WHERE key = ?
+        """, [(SENT if error is None else FAILED, message_id, error, time.time(), key) for key in keys])
+
+
+def claim_unrecorded(conn, limit):
+    """Claim finished deliveries not yet written to sent_notifications and return (key, record) pairs
+
+    Claimed rows are hidden from other workers until mark_recorded or
+    release_unrecorded, so a record is written once.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("""
+            SELECT key, user_id, stock_kod, news_url, state, message_id FROM outbox
+            WHERE recorded = 0 AND state IN (?, ?)
+            ORDER BY id LIMIT ?
+        """, (SENT, FAILED, limit)).fetchall()
+        _set_recorded(conn, [row[0] for row in rows], _RECORDING, now)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [(key, {
+        "user_id": user_id, "stock_kod": stock_kod, "news_url": news_url,
+        "status": state, "whatsapp_message_id": message_id
+    }) for key, user_id, stock_kod, news_url, state, message_id in rows]
+
+
+def mark_recorded(conn, keys):
+    """Mark claimed deliveries as written to sent_notifications"""
+    with conn:
+        _set_recorded(conn, keys, 1, time.time())
+
+
+def release_unrecorded(conn, keys):
+    """Return claimed deliveries whose write failed, so a later sync retries them"""
+    with conn:
+        _set_recorded(conn, keys, 0, time.time())
+
+
+def _set_recorded(conn, keys, recorded, now):
+    for chunk, placeholders in parameter_chunks(keys):
+        conn.execute(f"""
+            UPDATE outbox SET recorded = ?, updated_at = ? WHERE key IN ({placeholders})
+        """, [recorded, now] + chunk)
+
+
+def purge(conn, before):
+    """Delete recorded deliveries finished before a unix time; returns the number removed"""
+    with conn:
+        return conn.execute("""
+            DELETE FROM outbox WHERE recorded = 1 AND state IN (?, ?) AND updated_at < ?
+        """, (SENT, FAILED, before)).rowcount
+
+
+def get_cursor(conn, name):
+    """Return the stored value of a named cursor, or None if it was never set"""
+    row = conn.execute("SELECT value FROM cursors WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def set_cursor(conn, name, value):
+    """Store the value of a named cursor"""
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO cursors (name, value) VALUES (?, ?)", (name, value))
+
+
+def state_counts(conn):
+    """Return {state: number of deliveries}"""
+    return dict(conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
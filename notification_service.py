@@ -1,20 +1,61 @@
 import json
 import os
-import requests
-from datetime import datetime, timedelta
+import socket
+import sys
+import threading
 import time
-from supabase import create_client
+from datetime import datetime
 
-# Initialize Supabase client
+import metrics
+import notification_outbox as outbox
+from rate_limit import TokenBucket
+from whatsapp_dispatch import TEMPLATE_ERROR_CODES, WhatsAppError, create_session, dispatch_messages, post_message
+
+# Supabase credentials; the client is created when a run first needs it
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+_supabase = None
+_supabase_lock = threading.Lock()
 
 # WhatsApp Business API credentials
 WHATSAPP_API_URL = os.environ.get("WHATSAPP_API_URL")
 WHATSAPP_API_TOKEN = os.environ.get("WHATSAPP_API_TOKEN")
 WHATSAPP_PHONE_NUMBER_ID = os.environ.get("WHATSAPP_PHONE_NUMBER_ID")
 WHATSAPP_TEMPLATE_NAME = os.environ.get("WHATSAPP_TEMPLATE_NAME", "stock_news_alert")
+WHATSAPP_DIGEST_TEMPLATE_NAME = os.environ.get("WHATSAPP_DIGEST_TEMPLATE_NAME", "stock_news_digest")
+
+# Sending: stay under the messaging tier's throughput with a token bucket
+WHATSAPP_MESSAGES_PER_SECOND = float(os.environ.get("WHATSAPP_MESSAGES_PER_SECOND", "10"))
+WHATSAPP_BURST = int(os.environ.get("WHATSAPP_BURST", "10"))
+WHATSAPP_MAX_CONCURRENCY = int(os.environ.get("WHATSAPP_MAX_CONCURRENCY", "8"))
+WHATSAPP_MAX_RETRIES = int(os.environ.get("WHATSAPP_MAX_RETRIES", "4"))
+WHATSAPP_TIMEOUT = (5, 20)  # (connect, read) seconds
+
+_whatsapp_session = None
+_whatsapp_session_lock = threading.Lock()
+
+# Bulk Supabase access: PostgREST caps rows per response, long in() filters hit URL limits
+SUPABASE_PAGE_SIZE = 1000
+SUPABASE_FILTER_CHUNK_SIZE = 50
+SENT_INSERT_BATCH_SIZE = 500
+
+# Durable outbox: deliveries are queued locally before sending and drained in claimed batches
+OUTBOX_DB = os.environ.get("OUTBOX_DB", outbox.OUTBOX_DB)
+OUTBOX_CLAIM_SIZE = 100
+OUTBOX_LEASE_SECONDS = 15 * 60  # in-flight rows older than this belong to a dead worker
+OUTBOX_RETENTION_DAYS = 7
+MAPPING_CURSOR = "stock_news_mapping"  # timestamp of the last mapping whose news were all planned
+
+# Digests: a recipient's alerts queued within the window go out as one message (off until the
+# digest template is approved; set DIGEST_MAX_ITEMS above 1 to enable)
+DIGEST_WINDOW_SECONDS = int(os.environ.get("DIGEST_WINDOW_SECONDS", "900"))
+DIGEST_MAX_ITEMS = int(os.environ.get("DIGEST_MAX_ITEMS", "1"))
+DIGEST_MAX_CHARS = 900  # template body parameters must stay well under 1024 characters
+DIGEST_SEPARATOR = " | "  # template parameters may not contain newlines
+
+class PlanningError(Exception):
+    """Deliveries could not be planned because Supabase could not be read"""
 
 def load_stock_news_mapping():
     """Load the stock news mapping from the JSON file"""
@@ -23,50 +64,107 @@ def load_stock_news_mapping():
             return json.load(f)
     except Exception as e:
         print(f"Error loading stock news mapping: {e}")
-        return {"timestamp": "", "updated": False, "stock_news": {}}
+        return {"timestamp": "", "updated": False, "delta": {}, "stock_news": {}}
+
+def get_supabase():
+    """Return the Supabase client, creating it on first use"""
+    global _supabase
+    with _supabase_lock:
+        if _supabase is None:
+            from supabase import create_client
+            _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return _supabase
+
+def fetch_all_rows(table, build_query):
+    """Run a select on table page by page so PostgREST's row limit does not truncate the result
+
+    build_query(table_query) adds the select, filters and order to a fresh query on the table.
+    """
+    rows = []
+    while True:
+        with metrics.span("supabase_query", table=table):
+            query = build_query(get_supabase().table(table))
+            page = query.range(len(rows), len(rows) + SUPABASE_PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < SUPABASE_PAGE_SIZE:
+            return rows
 
-def get_users_for_stock(stock_kod):
-    """Get all users subscribed to a specific stock"""
+def chunked(items, size):
+    """Split a list into consecutive chunks of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def get_subscribers(stock_kods):
+    """Get the users subscribed to each of the given stocks as {stock_kod: [user]}, in bulk
+
+    Returns None if the subscriptions could not be read.
+    """
+    subscribers = {}
     try:
-        response = supabase.table("user_stock_subscriptions")\
-            .select("users(id, phone_number)")\
-            .eq("stock_kod", stock_kod)\
-            .execute()
-        
-        users = []
-        for item in response.data:
-            if item.get("users"):
-                users.append({
-                    "id": item["users"]["id"],
-                    "phone_number": item["users"]["phone_number"]
-                })
-        return users
+        for chunk in chunked(sorted(stock_kods), SUPABASE_FILTER_CHUNK_SIZE):
+            rows = fetch_all_rows("user_stock_subscriptions",
+                                  lambda query: query.select("stock_kod, user_id, users(id, phone_number)")
+                                  .in_("stock_kod", chunk)
+                                  .order("stock_kod")
+                                  .order("user_id"))
+            for item in rows:
+                if item.get("users"):
+                    subscribers.setdefault(item["stock_kod"], []).append({
+                        "id": item["users"]["id"],
+                        "phone_number": item["users"]["phone_number"]
+                    })
+        return subscribers
     except Exception as e:
-        print(f"Error getting users for stock {stock_kod}: {e}")
-        return []
+        print(f"Error getting subscribers: {e}")
+        return None
 
-def is_news_already_sent(user_id, stock_kod, news_url):
-    """Check if this news has already been sent to this user"""
+def get_sent_keys(news_urls):
+    """Get the (user_id, stock_kod, news_url) keys already sent for the given news URLs
+
+    Returns None if the history could not be read.
+    """
+    sent = set()
     try:
-        response = supabase.table("sent_notifications")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .eq("stock_kod", stock_kod)\
-            .eq("news_url", news_url)\
-            .execute()
-        
-        return len(response.data) > 0
+        for chunk in chunked(sorted(news_urls), SUPABASE_FILTER_CHUNK_SIZE):
+            rows = fetch_all_rows("sent_notifications",
+                                  lambda query: query.select("id, user_id, stock_kod, news_url")
+                                  .in_("news_url", chunk)
+                                  .order("id"))
+            sent.update((row["user_id"], row["stock_kod"], row["news_url"]) for row in rows)
+        return sent
     except Exception as e:
-        print(f"Error checking if news was already sent: {e}")
-        return True  # Assume already sent to prevent duplicate notifications
-
-def send_whatsapp_message(to_phone, stock_kod, stock_name, news_url):
-    """Send a WhatsApp message using the WhatsApp Business API"""
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
+        print(f"Error getting sent notifications: {e}")
+        return None
+
+def plan_deliveries(stock_news, subscribers, sent_keys):
+    """List the (user, stock, news) deliveries that have not been sent yet"""
+    deliveries = []
+    planned = set(sent_keys)
+    for stock_kod, stock_data in stock_news.items():
+        stock_name = stock_data.get("sirket_adi", stock_kod)
+        for news_url in stock_data.get("haberler", []):
+            for user in subscribers.get(stock_kod, []):
+                key = (user["id"], stock_kod, news_url)
+                if key in planned:
+                    continue
+                planned.add(key)
+                deliveries.append({
+                    "user": user,
+                    "stock_kod": stock_kod,
+                    "stock_name": stock_name,
+                    "news_url": news_url
+                })
+    return deliveries
+
+def get_whatsapp_session():
+    """Return the shared session used for WhatsApp API calls"""
+    global _whatsapp_session
+    with _whatsapp_session_lock:
+        if _whatsapp_session is None:
+            _whatsapp_session = create_session(WHATSAPP_MAX_CONCURRENCY)
+        return _whatsapp_session
+
+def build_whatsapp_payload(to_phone, stock_kod, stock_name, news_url):
+    """Build the template message payload for one news alert"""
     # Format the message using a template
     payload = {
         "messaging_product": "whatsapp",
@@ -98,105 +196,294 @@ def send_whatsapp_message(to_phone, stock_kod, stock_name, news_url):
             ]
         }
     }
-    
-    try:
-        response = requests.post(
+    return payload
+
+def digest_line(stock_kod, news_url):
+    """Format one news alert as an item of a digest message"""
+    return f"{stock_kod}: {news_url}"
+
+def build_digest_payload(to_phone, items):
+    """Build the digest template payload carrying several (stock_kod, news_url) alerts"""
+    return {
+        "messaging_product": "whatsapp",
+        "to": to_phone,
+        "type": "template",
+        "template": {
+            "name": WHATSAPP_DIGEST_TEMPLATE_NAME,
+            "language": {
+                "code": "tr"
+            },
+            "components": [
+                {
+                    "type": "body",
+                    "parameters": [
+                        {
+                            "type": "text",
+                            "text": str(len(items))
+                        },
+                        {
+                            "type": "text",
+                            "text": DIGEST_SEPARATOR.join(digest_line(kod, url) for kod, url in items)
+                        }
+                    ]
+                }
+            ]
+        }
+    }
+
+def coalesce_deliveries(jobs, window_seconds=None, max_items=None):
+    """Group each recipient's claimed deliveries queued within the window into digest messages
+
+    Returns messages in the order of their first delivery, each with the
+    "jobs" it carries and its "payload"; a single delivery keeps its own payload.
+    """
+    window_seconds = DIGEST_WINDOW_SECONDS if window_seconds is None else window_seconds
+    max_items = DIGEST_MAX_ITEMS if max_items is None else max_items
+    messages = []
+    current = {}  # phone number -> message still accepting deliveries
+    for job in jobs:
+        message = current.get(job["phone_number"])
+        line = len(digest_line(job["stock_kod"], job["news_url"]))
+        if (message is None or len(message["jobs"]) >= max_items
+                or job["created_at"] - message["jobs"][0]["created_at"] > window_seconds
+                or message["chars"] + len(DIGEST_SEPARATOR) + line > DIGEST_MAX_CHARS):
+            message = {"to": job["phone_number"], "jobs": [], "chars": -len(DIGEST_SEPARATOR)}
+            current[job["phone_number"]] = message
+            messages.append(message)
+        message["jobs"].append(job)
+        message["chars"] += len(DIGEST_SEPARATOR) + line
+
+    for message in messages:
+        if len(message["jobs"]) == 1:
+            message["payload"] = message["jobs"][0]["payload"]
+        else:
+            items = [(job["stock_kod"], job["news_url"]) for job in message["jobs"]]
+            message["payload"] = build_digest_payload(message["to"], items)
+    return messages
+
+def post_whatsapp_payload(payload):
+    """Send one payload through the shared session and return its message id; raises on failure"""
+    with metrics.span("whatsapp_send"):
+        return post_message(
+            get_whatsapp_session(),
             f"{WHATSAPP_API_URL}/{WHATSAPP_PHONE_NUMBER_ID}/messages",
-            headers=headers,
-            json=payload
+            WHATSAPP_API_TOKEN,
+            payload,
+            WHATSAPP_TIMEOUT
         )
-        response.raise_for_status()
-        result = response.json()
-        return {
-            "success": True,
-            "message_id": result.get("messages", [{}])[0].get("id", "unknown"),
-            "error": None
-        }
-    except requests.exceptions.RequestException as e:
-        return {
-            "success": False,
-            "message_id": None,
-            "error": str(e)
-        }
 
-def record_sent_notification(user_id, stock_kod, news_url, status, message_id=None):
-    """Record the sent notification in the database"""
-    try:
-        data = {
-            "user_id": user_id,
-            "stock_kod": stock_kod,
-            "news_url": news_url,
-            "status": status,
-            "whatsapp_message_id": message_id
-        }
-        
-        response = supabase.table("sent_notifications").insert(data).execute()
+def record_sent_notifications(records):
+    """Record sent notifications in the database with batched inserts; returns the number written"""
+    written = 0
+    for chunk in chunked(records, SENT_INSERT_BATCH_SIZE):
+        try:
+            with metrics.span("supabase_insert", table="sent_notifications"):
+                get_supabase().table("sent_notifications").insert(chunk).execute()
+            written += len(chunk)
+        except Exception as e:
+            metrics.inc("sent_records_failed", len(chunk))
+            print(f"Error recording {len(chunk)} sent notifications: {e}")
+    return written
+
+def sync_sent_records(conn):
+    """Write finished outbox deliveries to sent_notifications; unwritten ones are retried next run"""
+    while True:
+        rows = outbox.claim_unrecorded(conn, SENT_INSERT_BATCH_SIZE)
+        if not rows:
+            return
+        keys = [key for key, _ in rows]
+        if record_sent_notifications([record for _, record in rows]) < len(rows):
+            outbox.release_unrecorded(conn, keys)
+            return
+        outbox.mark_recorded(conn, keys)
+
+def news_since(stock_news, cursor, fallback):
+    """Return the stock news first seen after the cursor timestamp (all of them without a cursor)
+
+    News without a first-seen time (older mappings) count as seen at fallback.
+    """
+    newer = {}
+    for kod, data in stock_news.items():
+        first_seen = data.get("first_seen", {})
+        urls = [url for url in data.get("haberler", []) if cursor is None or first_seen.get(url, fallback) > cursor]
+        if urls:
+            newer[kod] = dict(data, haberler=urls)
+    return newer
+
+def enqueue_new_deliveries(conn):
+    """Plan the deliveries for the stock news not planned yet and queue them in the outbox
+
+    The outbox's cursor holds the timestamp of the last mapping that was
+    planned in full. If it is at least the run the current delta was built
+    on, the delta is all that is new; otherwise (a notifier run failed or was
+    skipped, or two scraper runs landed in between) every history entry
+    first seen after the cursor is planned. The cursor only moves once
+    planning succeeded. Returns True if the mapping is now planned in full.
+    """
+    mapping_data = load_stock_news_mapping()
+    timestamp = mapping_data.get("timestamp")
+    if not timestamp:
+        print("No stock news mapping, skipping notification planning")
+        return False
+    cursor = outbox.get_cursor(conn, MAPPING_CURSOR)
+    if cursor is not None and cursor >= timestamp:
+        print("Stock news mapping already planned, skipping notification planning")
         return True
-    except Exception as e:
-        print(f"Error recording sent notification: {e}")
+
+    previous = mapping_data.get("previous_timestamp")
+    if cursor is not None and previous and cursor >= previous and "delta" in mapping_data:
+        stock_news = mapping_data["delta"]
+    else:
+        stock_news = news_since(mapping_data["stock_news"], cursor, timestamp)
+        print(f"Planning the stock news first seen after {cursor or 'the start of the history'}")
+    try:
+        enqueue_deliveries(conn, stock_news)
+    except PlanningError as e:
+        print(f"{e}, skipping notification planning")
         return False
+    outbox.set_cursor(conn, MAPPING_CURSOR, timestamp)
+    return True
 
-def process_notifications():
-    """Process stock news and send notifications to subscribed users"""
-    # Load stock news mapping
-    mapping_data = load_stock_news_mapping()
-    
-    # Check if there are any updates
-    if not mapping_data["updated"]:
-        print("No updates in stock news mapping, skipping notification processing")
-        return
-    
-    # Process each stock with news
-    for stock_kod, stock_data in mapping_data["stock_news"].items():
-        # Skip if no news
-        if not stock_data.get("haberler"):
-            continue
-            
-        # Get all users subscribed to this stock
-        users = get_users_for_stock(stock_kod)
-        if not users:
-            print(f"No users subscribed to {stock_kod}, skipping")
-            continue
-            
-        stock_name = stock_data.get("sirket_adi", stock_kod)
-        
-        # Process each news article for this stock
-        for news_url in stock_data["haberler"]:
-            # Send notification to each subscribed user
-            for user in users:
-                # Skip if already sent to this user
-                if is_news_already_sent(user["id"], stock_kod, news_url):
-                    continue
-                    
-                # Send WhatsApp message
-                result = send_whatsapp_message(
-                    user["phone_number"], 
-                    stock_kod, 
-                    stock_name, 
-                    news_url
-                )
-                
-                # Record the notification
-                record_sent_notification(
-                    user["id"],
-                    stock_kod,
-                    news_url,
-                    "sent" if result["success"] else "failed",
-                    result.get("message_id")
-                )
-                
-                if result["success"]:
-                    print(f"Notification sent to {user['phone_number']} for {stock_kod}")
-                else:
-                    print(f"Failed to send notification to {user['phone_number']} for {stock_kod}: {result['error']}")
-                
-                # Rate limiting to avoid API limits
-                time.sleep(1)
+def enqueue_deliveries(conn, stock_news):
+    """Plan the deliveries of {stock_kod: {"sirket_adi", "haberler"}} news and queue them in the outbox
+
+    Returns the number of deliveries added. Raises PlanningError if the
+    subscriptions or the sent history could not be read, as nothing was queued.
+    """
+    stock_news = {kod: data for kod, data in stock_news.items() if data.get("haberler")}
+    if not stock_news:
+        return 0
+
+    # Plan every delivery up front: one bulk read for subscriptions, one for the sent history
+    subscribers = get_subscribers(stock_news)
+    if subscribers is None:
+        raise PlanningError("Could not read subscriptions")
+    for stock_kod in sorted(set(stock_news) - set(subscribers)):
+        print(f"No users subscribed to {stock_kod}, skipping")
+    news_urls = {url for kod in subscribers for url in stock_news[kod]["haberler"]}
+    sent_keys = get_sent_keys(news_urls)
+    if sent_keys is None:
+        # Without the history every send could be a duplicate
+        raise PlanningError("Could not read sent notifications")
+    deliveries = plan_deliveries(stock_news, subscribers, sent_keys)
+
+    added = outbox.enqueue(conn, [{
+        "user_id": delivery["user"]["id"],
+        "stock_kod": delivery["stock_kod"],
+        "news_url": delivery["news_url"],
+        "phone_number": delivery["user"]["phone_number"],
+        "payload": build_whatsapp_payload(
+            delivery["user"]["phone_number"],
+            delivery["stock_kod"],
+            delivery["stock_name"],
+            delivery["news_url"]
+        )
+    } for delivery in deliveries])
+    metrics.inc("notifications_queued", added)
+    print(f"Queued {added} new notifications ({len(deliveries) - added} already queued, {len(sent_keys)} already sent)")
+    return added
+
+def drain_outbox(conn, worker_id=None):
+    """Claim and send pending outbox deliveries batch by batch until none are left; returns the number sent
+
+    Each claimed batch is coalesced into per-recipient digests before sending.
+    If WhatsApp rejects the digest template, the digest's alerts are sent one
+    by one and digests stay off for the rest of the drain.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    limiter = TokenBucket(WHATSAPP_MESSAGES_PER_SECOND, WHATSAPP_BURST)
+    conn_lock = threading.Lock()
+    digests_rejected = threading.Event()
+    sent = 0
+
+    def on_result(message, outcome):
+        nonlocal sent
+        if message.get("split"):
+            return  # its alerts were recorded one by one
+        keys = [job["key"] for job in message["jobs"]]
+        with conn_lock:
+            outbox.mark_result(conn, keys, outcome["message_id"], outcome["error"])
+            if outcome["error"] is None:
+                sent += len(keys)
+        stocks = ", ".join(sorted({job["stock_kod"] for job in message["jobs"]}))
+        outcome_label = "sent" if outcome["error"] is None else "failed"
+        metrics.inc("whatsapp_messages", outcome=outcome_label)
+        metrics.inc("notifications", len(keys), outcome=outcome_label)
+        if outcome["error"] is None:
+            print(f"Notification sent to {message['to']} for {stocks} ({len(keys)} news)")
+        else:
+            print(f"Failed to send notification to {message['to']} for {stocks}: {outcome['error']}")
+
+    def send(message):
+        with conn_lock:
+            outbox.mark_attempt(conn, [job["key"] for job in message["jobs"]])
+        try:
+            return post_whatsapp_payload(message["payload"])
+        except WhatsAppError as e:
+            if len(message["jobs"]) == 1 or e.error_code not in TEMPLATE_ERROR_CODES:
+                raise
+            if not digests_rejected.is_set():
+                print(f"Digest template rejected ({e}), sending alerts one by one")
+                digests_rejected.set()
+        # Nothing was delivered; send the alerts on their own, in order, on this recipient's thread
+        message["split"] = True
+        dispatch_messages(
+            coalesce_deliveries(message["jobs"], max_items=1),
+            send,
+            max_concurrency=1,
+            limiter=limiter,
+            max_retries=WHATSAPP_MAX_RETRIES,
+            on_result=on_result
+        )
+        return None
+
+    while True:
+        with conn_lock:
+            jobs = outbox.claim_batch(conn, worker_id, OUTBOX_CLAIM_SIZE)
+        if not jobs:
+            return sent
+        dispatch_messages(
+            coalesce_deliveries(jobs, max_items=1 if digests_rejected.is_set() else None),
+            send,
+            max_concurrency=WHATSAPP_MAX_CONCURRENCY,
+            limiter=limiter,
+            max_retries=WHATSAPP_MAX_RETRIES,
+            on_result=on_result
+        )
+        with conn_lock:
+            sync_sent_records(conn)
+
+def process_notifications(plan=True):
+    """Queue notifications for new stock news, then deliver everything pending in the outbox
+
+    With plan=False only the existing outbox is drained, so extra workers can
+    share a large backlog.
+    """
+    conn = outbox.open_outbox(OUTBOX_DB)
+    try:
+        requeued, failed = outbox.recover_stale(conn, OUTBOX_LEASE_SECONDS)
+        if requeued or failed:
+            print(f"Recovered interrupted notifications: {requeued} requeued, {failed} failed")
+        if plan:
+            with metrics.span("plan"):
+                enqueue_new_deliveries(conn)
+        with metrics.span("drain"):
+            sent = drain_outbox(conn)
+        with metrics.span("sync"):
+            sync_sent_records(conn)
+        outbox.purge(conn, time.time() - OUTBOX_RETENTION_DAYS * 86400)
+        print(f"Sent {sent} notifications; outbox: {outbox.state_counts(conn)}")
+    finally:
+        conn.close()
 
 def main():
     """Main function to run the notification service"""
     print(f"Starting notification service at {datetime.utcnow().isoformat()}")
-    process_notifications()
+    try:
+        with metrics.profiled(), metrics.span("run"):
+            process_notifications(plan="--drain-only" not in sys.argv[1:])
+    finally:
+        metrics.flush("notifier")
     print(f"Notification processing completed at {datetime.utcnow().isoformat()}")
 
 if __name__ == "__main__":
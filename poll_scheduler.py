@@ -0,0 +1,102 @@
+"""Adaptive per-source polling intervals driven by observed publish rates
+
+Each source keeps a smoothed rate of new links per hour and a profile of
+that rate by hour of day (UTC), persisted in poll_schedule.json. After a
+poll, its next interval is set so that about POLL_TARGET_NEW_LINKS new links
+are expected per poll, using the higher of the recent rate and the usual
+rate for the coming hour, bounded by the minimum and maximum interval. Busy
+sources are polled often during market hours; quiet ones back off at night
+and ramp up again before the morning's news starts.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+from state_file import write_json
+
+POLL_SCHEDULE_FILE = "poll_schedule.json"
+POLL_MIN_INTERVAL_SECONDS = float(os.environ.get("POLL_MIN_INTERVAL_SECONDS", "60"))
+POLL_MAX_INTERVAL_SECONDS = float(os.environ.get("POLL_MAX_INTERVAL_SECONDS", "1800"))
+POLL_TARGET_NEW_LINKS = float(os.environ.get("POLL_TARGET_NEW_LINKS", "0.5"))
+
+RATE_SMOOTHING = 0.5  # weight of the latest poll in the recent rate
+HOURLY_SMOOTHING = 0.2  # weight of the latest poll in its hour-of-day rate
+
+
+def load_schedule(path=POLL_SCHEDULE_FILE):
+    """Load per-source polling stats"""
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except:
+            return {}
+    return {}
+
+
+def save_schedule(schedule, path=POLL_SCHEDULE_FILE):
+    """Save per-source polling stats"""
+    write_json(path, schedule)
+
+
+def is_due(schedule, source, now, slack=0):
+    """Check whether a source should be polled now (or within slack seconds); new sources are always due"""
+    state = schedule.get(source)
+    if not state or "next_poll" not in state:
+        return True
+    return (now + timedelta(seconds=slack)).isoformat() >= state["next_poll"]
+
+
+def due_sources(schedule, sources, now, slack=0):
+    """Return the sources that are due for a poll"""
+    return [source for source in sources if is_due(schedule, source, now, slack)]
+
+
+def next_poll_time(schedule, sources):
+    """Return the earliest next poll time of the sources, or None if one was never polled"""
+    times = []
+    for source in sources:
+        state = schedule.get(source)
+        if not state or "next_poll" not in state:
+            return None
+        times.append(datetime.fromisoformat(state["next_poll"]))
+    return min(times) if times else None
+
+
+def poll_interval(state, when):
+    """Return the seconds until the next poll of a source, given its stats and the time of this poll"""
+    expected = max(state.get("rate", 0.0), state.get("hourly", [0.0] * 24)[(when.hour + 1) % 24])
+    if expected <= 0:
+        return POLL_MAX_INTERVAL_SECONDS
+    interval = POLL_TARGET_NEW_LINKS / expected * 3600
+    return min(max(interval, POLL_MIN_INTERVAL_SECONDS), POLL_MAX_INTERVAL_SECONDS)
+
+
+def record_poll(schedule, source, new_links, now):
+    """Fold a successful poll's new link count into the source's rates and schedule its next poll
+
+    The first poll only sets the baseline, since everything on the page looks
+    new, and the source is polled again after the minimum interval.
+    """
+    state = schedule.setdefault(source, {"polls": 0, "new_links": 0, "rate": 0.0, "hourly": [0.0] * 24})
+    first_poll = "last_polled" not in state
+    if not first_poll:
+        elapsed = (now - datetime.fromisoformat(state["last_polled"])).total_seconds()
+        # A listing page only shows its latest links, so a long gap says little about the rate
+        if 0 < elapsed <= 2 * POLL_MAX_INTERVAL_SECONDS:
+            observed = new_links / max(elapsed, POLL_MIN_INTERVAL_SECONDS) * 3600
+            state["rate"] = (1 - RATE_SMOOTHING) * state["rate"] + RATE_SMOOTHING * observed
+            hourly = state["hourly"]
+            hourly[now.hour] = (1 - HOURLY_SMOOTHING) * hourly[now.hour] + HOURLY_SMOOTHING * observed
+        state["new_links"] += new_links
+    state["polls"] += 1
+    state["last_polled"] = now.isoformat()
+    state["interval"] = POLL_MIN_INTERVAL_SECONDS if first_poll else round(poll_interval(state, now), 1)
+    state["next_poll"] = (now + timedelta(seconds=state["interval"])).isoformat()
+
+
+def defer_poll(schedule, source, now):
+    """Reschedule a source whose poll failed without touching its rates"""
+    state = schedule.setdefault(source, {"polls": 0, "new_links": 0, "rate": 0.0, "hourly": [0.0] * 24})
+    interval = state.get("interval", POLL_MIN_INTERVAL_SECONDS)
+    state["next_poll"] = (now + timedelta(seconds=interval)).isoformat()
@@ -0,0 +1,32 @@
+"""Thread-safe token bucket shared by the LLM and WhatsApp dispatchers"""
+import threading
+import time
+
+
+class TokenBucket:
+    """Bucket of up to capacity tokens that refills at rate tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1, timeout=None):
+        """Wait until the tokens are available and take them; returns False if that would exceed timeout"""
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return True
+                delay = (tokens - self.available) / self.rate
+            if timeout is not None and waited + delay > timeout:
+                return False
+            time.sleep(delay)
+            waited += delay
@@ -0,0 +1,295 @@
+"""Learned gate that drops articles unlikely to be about a listed company before analysis
+
+Most scraped articles are macro news (inflation, rents, pensions) that no
+LLM batch ever links to a stock. A logistic regression over hashed TF-IDF
+features of the URL slug (folded words, word bigrams, the outlet, and
+whether the stock matcher finds a company alias in it) is trained on past
+LLM verdicts: the articles logged as judged in the results log, labeled by
+whether they produced a hit, plus the archived runs in news_archive.json
+labeled by the recorded hits. Scoring an article takes tens of
+microseconds and needs nothing beyond the standard library.
+
+    python relevance_gate.py train [--target-recall 0.95] [--holdout 0.25]
+    python relevance_gate.py evaluate [--threshold 0.2]
+
+train holds out the most recent articles, picks the threshold that keeps
+the target recall on them, reports precision/recall and the share of
+articles dropped, and saves that model with its threshold to
+relevance_model.json (a refit on everything would need another threshold).
+The scraper only gates articles once that file exists; RELEVANCE_THRESHOLD
+overrides the saved threshold and RELEVANCE_GATE=0 turns the gate off.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from state_file import write_json
+from stock_matcher import archived_runs, recorded_hits, url_slug_text
+from url_canonical import article_key
+
+RELEVANCE_MODEL_FILE = "relevance_model.json"
+RELEVANCE_THRESHOLD = os.environ.get("RELEVANCE_THRESHOLD")
+
+FEATURE_BUCKETS = 1 << 18
+EPOCHS = 30
+LEARNING_RATE = 0.5
+L2_PENALTY = 1e-4
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def article_tokens(url, matcher):
+    """Return the slug words, word bigrams and outlet of an article, and a token for a company alias in it"""
+    text = url_slug_text(url)
+    words = text.split()
+    host = urlsplit(url).netloc.lower()
+    tokens = words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    tokens.append(f"host={host[4:] if host.startswith('www.') else host}")
+    if matcher.match_folded(text):
+        tokens.append("company_alias")
+    return tokens
+
+
+def get_matcher():
+    from stock_universe import load_stock_universe
+
+    return load_stock_universe().get_matcher()
+
+
+def hashed_counts(tokens):
+    """Map tokens to feature buckets: {bucket: count}"""
+    counts = {}
+    for token in tokens:
+        bucket = zlib.crc32(token.encode("utf-8")) % FEATURE_BUCKETS
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+class RelevanceModel:
+    """Hashed TF-IDF features and logistic regression weights"""
+
+    def __init__(self, idf, default_idf, weights, bias, threshold=0.5, info=None):
+        self.idf = idf
+        self.default_idf = default_idf
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.info = info or {}
+
+    def features(self, url, matcher=None):
+        """Return the L2-normalized TF-IDF vector of an article as {bucket: value}"""
+        matcher = matcher or get_matcher()
+        vector = {bucket: (1 + math.log(count)) * self.idf.get(bucket, self.default_idf)
+                  for bucket, count in hashed_counts(article_tokens(url, matcher)).items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {bucket: value / norm for bucket, value in vector.items()}
+
+    def score(self, url, matcher=None):
+        """Return the probability that the LLM would link the article to a stock"""
+        features = self.features(url, matcher)
+        z = self.bias + sum(self.weights.get(bucket, 0.0) * value for bucket, value in features.items())
+        return 1 / (1 + math.exp(-max(min(z, 30.0), -30.0)))
+
+    def keep(self, urls, threshold=None):
+        """Return the articles scoring at least the threshold, in order"""
+        threshold = self.threshold if threshold is None else threshold
+        matcher = get_matcher()
+        return [url for url in urls if self.score(url, matcher) >= threshold]
+
+    def to_dict(self):
+        return {
+            "feature_buckets": FEATURE_BUCKETS,
+            "idf": {str(bucket): round(value, 6) for bucket, value in sorted(self.idf.items())},
+            "default_idf": round(self.default_idf, 6),
+            "weights": {str(bucket): round(value, 6) for bucket, value in sorted(self.weights.items())
+                        if abs(value) >= 1e-6},
+            "bias": self.bias,
+            "threshold": self.threshold,
+            "info": self.info
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({int(bucket): value for bucket, value in data["idf"].items()}, data["default_idf"],
+                   {int(bucket): value for bucket, value in data["weights"].items()}, data["bias"],
+                   data["threshold"], data.get("info"))
+
+
+def train(examples, seed=1):
+    """Fit a model on [(url, label)], weighting the rare positives up to balance the classes"""
+    matcher = get_matcher()
+    documents = [hashed_counts(article_tokens(url, matcher)) for url, _ in examples]
+    document_frequency = {}
+    for counts in documents:
+        for bucket in counts:
+            document_frequency[bucket] = document_frequency.get(bucket, 0) + 1
+    n = len(documents)
+    idf = {bucket: math.log((1 + n) / (1 + df)) + 1 for bucket, df in document_frequency.items()}
+    model = RelevanceModel(idf, math.log(1 + n) + 1, {}, 0.0)
+
+    rows = [(model.features(url, matcher), label) for url, label in examples]
+    positives = sum(label for _, label in rows)
+    positive_weight = (n - positives) / positives if positives else 1.0
+    rng = random.Random(seed)
+    weights, bias = model.weights, 0.0
+    for epoch in range(EPOCHS):
+        rng.shuffle(rows)
+        rate = LEARNING_RATE / (1 + epoch)
+        for features, label in rows:
+            z = bias + sum(weights.get(bucket, 0.0) * value for bucket, value in features.items())
+            error = 1 / (1 + math.exp(-max(min(z, 30.0), -30.0))) - label
+            step = rate * error * (positive_weight if label else 1.0)
+            for bucket, value in features.items():
+                weight = weights.get(bucket, 0.0)
+                weights[bucket] = weight - step * value - rate * L2_PENALTY * weight
+            bias -= step
+    model.bias = bias
+    return model
+
+
+def labeled_articles(log_dir=None):
+    """Return [(url, label)] oldest first, one per article, from the archive and the results log"""
+    from results_log import judged_urls, query
+
+    examples, seen = [], set()
+
+    def add(url, label):
+        key = article_key(url)
+        if key not in seen:
+            seen.add(key)
+            examples.append((url, label))
+
+    hits = {article_key(url) for _, url in recorded_hits()}
+    for run in archived_runs():
+        for url in run:
+            add(url, article_key(url) in hits)
+
+    hit_records = {}
+    for record in query(log_dir=log_dir):
+        hit_records.setdefault(record["ts"], set()).add(article_key(record["url"]))
+    for record in query(record_type="run", log_dir=log_dir):
+        for url in judged_urls(record):
+            add(url, article_key(url) in hit_records.get(record["ts"], ()))
+    return [(url, int(label)) for url, label in examples]
+
+
+def precision_recall(model, examples, threshold):
+    """Return (precision, recall, share of articles dropped) on [(url, label)]"""
+    matcher = get_matcher()
+    kept = [label for url, label in examples if model.score(url, matcher) >= threshold]
+    positives = sum(label for _, label in examples)
+    true_positives = sum(kept)
+    precision = true_positives / len(kept) if kept else 0.0
+    recall = true_positives / positives if positives else 1.0
+    return precision, recall, 1 - len(kept) / len(examples) if examples else 0.0
+
+
+def pick_threshold(model, examples, target_recall):
+    """Return the highest threshold that keeps at least target_recall of the positives"""
+    matcher = get_matcher()
+    scores = sorted((model.score(url, matcher) for url, label in examples if label), reverse=True)
+    if not scores:
+        return 0.5
+    needed = max(1, math.ceil(target_recall * len(scores)))
+    return scores[needed - 1]
+
+
+def print_report(model, examples, threshold):
+    positives = sum(label for _, label in examples)
+    print(f"{len(examples)} articles, {positives} linked to a stock by the LLM")
+    for candidate in sorted({0.05, 0.1, 0.2, 0.3, 0.5, threshold}):
+        precision, recall, dropped = precision_recall(model, examples, candidate)
+        marker = "  <- threshold" if candidate == threshold else ""
+        print(f"  threshold {candidate:.3f}: precision {precision:.0%}, recall {recall:.0%}, "
+              f"{dropped:.0%} of articles dropped{marker}")
+    urls = [url for url, _ in examples] or ["https://example.com/"]
+    matcher = get_matcher()
+    start = time.perf_counter()
+    for url in urls:
+        model.score(url, matcher)
+    print(f"  {(time.perf_counter() - start) / len(urls) * 1e6:.0f} us per article")
+
+
+def load_relevance_model(path=RELEVANCE_MODEL_FILE):
+    """Return the trained model, reloaded when the file changes, or None if there is none"""
+    global _model
+    with _model_lock:
+        if not os.path.exists(path):
+            return None
+        version = (path, os.stat(path).st_mtime_ns)
+        if _model is None or _model[0] != version:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _model = (version, RelevanceModel.from_dict(json.load(f)))
+            except Exception as e:
+                print(f"Error loading relevance model {path}: {e}")
+                return None
+        return _model[1]
+
+
+def gate_articles(urls, path=RELEVANCE_MODEL_FILE):
+    """Split articles into (kept, dropped) with the saved model; everything is kept without one"""
+    model = load_relevance_model(path)
+    if model is None or not urls:
+        return list(urls), []
+    kept = set(model.keep(urls, float(RELEVANCE_THRESHOLD) if RELEVANCE_THRESHOLD else None))
+    return [url for url in urls if url in kept], [url for url in urls if url not in kept]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    train_parser = subcommands.add_parser("train", help="train on the labeled history and save the model")
+    train_parser.add_argument("--target-recall", type=float, default=0.95)
+    train_parser.add_argument("--holdout", type=float, default=0.25, help="share of the newest articles held out")
+    train_parser.add_argument("--output", default=RELEVANCE_MODEL_FILE)
+    evaluate_parser = subcommands.add_parser("evaluate", help="score the saved model on the labeled history")
+    evaluate_parser.add_argument("--threshold", type=float)
+    evaluate_parser.add_argument("--model", default=RELEVANCE_MODEL_FILE)
+    args = parser.parse_args()
+
+    examples = labeled_articles()
+    if args.command == "evaluate":
+        model = load_relevance_model(args.model)
+        if model is None:
+            print(f"No model at {args.model}; run `python relevance_gate.py train` first")
+            return
+        print("On the labeled history, mostly the model's training data (held-out figures are under "
+              "info.holdout in the model file):")
+        print_report(model, examples, model.threshold if args.threshold is None else args.threshold)
+        return
+
+    split = int(len(examples) * (1 - args.holdout))
+    train_set, holdout_set = examples[:split], examples[split:]
+    if not any(label for _, label in train_set) or not any(label for _, label in holdout_set):
+        print(f"Not enough linked articles to train and evaluate ({len(examples)} labeled articles)")
+        return
+    model = train(train_set)
+    threshold = pick_threshold(model, holdout_set, args.target_recall)
+    print(f"Held-out evaluation (newest {len(holdout_set)} articles, trained on {len(train_set)}):")
+    print_report(model, holdout_set, threshold)
+    precision, recall, dropped = precision_recall(model, holdout_set, threshold)
+
+    # The threshold is calibrated on this model's scores, so this model is the one saved
+    model.threshold = threshold
+    model.info = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "articles": len(train_set),
+        "positives": sum(label for _, label in train_set),
+        "holdout": {"articles": len(holdout_set), "precision": round(precision, 4),
+                    "recall": round(recall, 4), "dropped": round(dropped, 4)}
+    }
+    write_json(args.output, model.to_dict(), indent=None)
+    print(f"Saved model trained on {len(train_set)} articles to {args.output} (threshold {threshold:.3f})")
+
+
+if __name__ == "__main__":
+    main()
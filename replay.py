@@ -0,0 +1,342 @@
+"""Replay archived runs through dedup, the stock prefilter and the LLM to see how results change
+
+Each run's new articles (from the run records of the results log, which
+keeps every run; from news_archive.db, which only keeps the last
+ARCHIVE_RETENTION_HOURS, grouped by first-seen time; or rebuilt from the
+snapshots in a legacy news_archive.json) are deduplicated against the earlier runs by article key, optionally clustered,
+and then handed to a pool of worker processes. Each worker prefilters its
+run with the stock matcher, packs the candidate pairs into prompts and sends
+them with the batch dispatcher (at most --concurrency requests in flight per
+process, sharing LLM_TOKENS_PER_MINUTE). The verdict cache is neither read
+nor written, so every pair gets a fresh answer under the current prompt,
+model and stock list.
+
+Finished runs are appended to a checkpoint file as they complete; rerunning
+the same command resumes after the last finished run. The new hits are then
+diffed against the hits recorded by live runs (the stock news mapping and
+the results log) for the replayed articles.
+
+    python replay.py [--archive results_log] [--since 2025-03-01] [--until 2025-04-01] [--processes 4]
+                     [--model gpt-4o-mini] [--stocks-csv other.csv] [--checkpoint replay_checkpoint.jsonl]
+                     [--fake-llm 0.05]
+
+A window that starts before the oldest run the source holds in full is an
+error rather than a silently partial replay.
+
+--fake-llm starts the local fake OpenAI server from benchmarks/stubs.py, so
+the replay runs offline (for throughput testing; its verdicts are not real).
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from datetime import datetime
+from itertools import groupby
+
+import news_scraper
+import results_log
+from archive_store import ARCHIVE_DB, LEGACY_ARCHIVE_JSON
+from batch_planner import plan_batches
+from llm_dispatch import TokenRateLimiter, count_tokens, dispatch_batches
+from state_file import write_json
+from stock_matcher import recorded_hits
+from stock_universe import STOCKS_CSV, load_stock_universe
+from url_canonical import article_key
+
+REPLAY_CHECKPOINT_FILE = "replay_checkpoint.jsonl"
+
+_options = {}
+
+
+def retained_since(path):
+    """Return the timestamp from which the source holds every run in full, or None if it holds none
+
+    The results log holds every run logged with its articles. The SQLite
+    archive drops links by last_seen, so only runs from its oldest last_seen
+    on are complete.
+    """
+    if os.path.isdir(path):
+        for record in results_log.query(record_type="run", log_dir=path):
+            if "articles" in record:
+                return record["ts"]
+        return None
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return min((entry["timestamp"] for entry in json.load(f).get("entries", [])), default=None)
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT MIN(last_seen) FROM articles").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def iter_archived_runs(path, since=None, until=None):
+    """Yield (timestamp, new links) for each archived run with since <= timestamp < until, oldest first
+
+    A directory is read as the results log, a .json path as the legacy
+    snapshot archive, anything else as the SQLite archive, where a run's new
+    links share their first_seen time.
+    """
+    if os.path.isdir(path):
+        for record in results_log.query(since=since, until=until, record_type="run", log_dir=path):
+            if "articles" in record:
+                yield record["ts"], record["articles"]
+        return
+    for timestamp, links in _iter_archive_snapshots(path):
+        if (since is None or timestamp >= since) and (until is None or timestamp < until):
+            yield timestamp, links
+
+
+def _iter_archive_snapshots(path):
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            entries = sorted(json.load(f).get("entries", []), key=lambda entry: entry["timestamp"])
+        seen = set()
+        for entry in entries:
+            yield entry["timestamp"], [link for link in entry["news_links"] if link not in seen]
+            seen.update(entry["news_links"])
+        return
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT first_seen, url FROM articles ORDER BY first_seen, url")
+        for timestamp, group in groupby(rows, key=lambda row: row[0]):
+            yield timestamp, [url for _, url in group]
+    finally:
+        conn.close()
+
+
+def replay_runs(path, cluster=False, stocks_csv=STOCKS_CSV, since=None, until=None):
+    """Yield (timestamp, articles, siblings) per archived run, dropping articles already seen in an earlier run
+
+    Runs are deduplicated (and clustered) in order every time, so a resumed
+    replay sends exactly the articles the interrupted one would have. With
+    cluster, siblings maps each representative to the rest of its story.
+    """
+    seen = set()
+    clusters = None
+    if cluster:
+        from story_clusters import assign_clusters, move_representatives, open_clusters
+        clusters = open_clusters(":memory:")
+    for timestamp, links in iter_archived_runs(path, since, until):
+        articles = []
+        for link in links:
+            key = article_key(link)
+            if key not in seen:
+                seen.add(key)
+                articles.append(link)
+        siblings = {}
+        if clusters is not None and articles:
+            articles, siblings, _ = assign_clusters(clusters, articles, now=datetime.fromisoformat(timestamp).timestamp())
+            if news_scraper.STOCK_PREFILTER and siblings:
+                articles, siblings, moved = news_scraper.prefer_matched_representatives(
+                    load_stock_universe(stocks_csv).get_matcher(), articles, siblings)
+                move_representatives(clusters, moved)
+        yield timestamp, articles, siblings
+
+
+def config_fingerprint(stocks_csv):
+    """Identify the prompt, model and stock list a replay runs with"""
+    with open(stocks_csv, "rb") as f:
+        stocks = hashlib.sha256(f.read()).hexdigest()[:16]
+    return {"prompt": news_scraper.get_prompt_fingerprint()[:16], "model": news_scraper.LLM_MODEL, "stocks": stocks}
+
+
+def init_worker(options):
+    """Apply the replay's settings in a worker process"""
+    _options.update(options)
+    news_scraper.LLM_MODEL = options["model"]
+
+
+def analyze_run(job):
+    """Prefilter one run's articles, ask the LLM about the candidate pairs and return the run's result"""
+    timestamp, articles, siblings = job
+    universe = load_stock_universe(_options["stocks_csv"])
+    stocks = universe.stocks
+    if news_scraper.STOCK_PREFILTER:
+        candidates = news_scraper.story_candidates(universe.get_matcher(), articles, siblings)
+    else:
+        candidates = {stock["kod"]: list(articles) for stock in stocks}
+
+    overhead_tokens = count_tokens(news_scraper.LLM_SYSTEM_PROMPT) + count_tokens(news_scraper.build_llm_prompt([], []))
+    _, jobs = plan_batches(
+        candidates, stocks, count_tokens, overhead_tokens, news_scraper.LLM_PROMPT_TOKEN_BUDGET,
+        news_scraper.LLM_MAX_STOCKS_PER_BATCH, news_scraper.LLM_MAX_ARTICLES_PER_BATCH
+    )
+    for job in jobs:
+        job["prompt"] = news_scraper.build_llm_prompt(job["stocks"], job["articles"])
+    start = time.perf_counter()
+    outcomes = dispatch_batches(
+        jobs,
+        lambda job: news_scraper.parse_llm_result(news_scraper.call_llm(job["prompt"])),
+        max_concurrency=_options["concurrency"],
+        limiter=TokenRateLimiter(_options["tokens_per_minute"]),
+        max_retries=news_scraper.LLM_MAX_RETRIES
+    )
+    hits = sorted({
+        (item["hisse_kodu"], item["haber_url"])
+        for outcome in outcomes if outcome["error"] is None
+        for item in news_scraper.confirmed_hits(outcome["result"])
+    })
+    return {
+        "type": "run",
+        "run": timestamp,
+        "articles": len(articles),
+        "candidate_pairs": sum(len(urls) for urls in candidates.values()),
+        "batches": len(jobs),
+        "failed_batches": sum(1 for outcome in outcomes if outcome["error"] is not None),
+        "llm_seconds": round(time.perf_counter() - start, 3),
+        "hits": [list(hit) for hit in hits]
+    }
+
+
+def load_checkpoint(path):
+    """Return (config, {run timestamp: result}) from a checkpoint file, skipping a torn last line"""
+    config, results = None, {}
+    if not os.path.exists(path):
+        return config, results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("type") == "config":
+                config = record["config"]
+            elif record.get("type") == "run":
+                results[record["run"]] = record
+    return config, results
+
+
+def append_checkpoint(f, record):
+    """Append one record to the open checkpoint file and flush it to disk"""
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def diff_hits(results, articles):
+    """Compare replayed hits with the recorded ones for the replayed articles; returns (added, removed, kept)"""
+    replayed_keys = {article_key(url) for url in articles}
+    recorded = {(code, article_key(url)): url for code, url in recorded_hits() if article_key(url) in replayed_keys}
+    replayed = {(code, article_key(url)): url for result in results for code, url in result["hits"]}
+    added = sorted((code, replayed[(code, key)]) for code, key in set(replayed) - set(recorded))
+    removed = sorted((code, recorded[(code, key)]) for code, key in set(recorded) - set(replayed))
+    kept = sorted((code, replayed[(code, key)]) for code, key in set(replayed) & set(recorded))
+    return added, removed, kept
+
+
+def start_fake_llm(latency):
+    """Start the local fake OpenAI server and point the OpenAI client (in this and child processes) at it"""
+    from benchmarks.stubs import serve_fake_openai
+
+    server, base_url = serve_fake_openai(latency=latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "offline-replay")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archive", help=f"the results log directory (default, if it has runs), {ARCHIVE_DB} "
+                                          f"(the last day only) or a legacy {LEGACY_ARCHIVE_JSON}")
+    parser.add_argument("--since", help="earliest run to replay, inclusive (default: the oldest one held in full)")
+    parser.add_argument("--until", help="latest run to replay, exclusive")
+    parser.add_argument("--processes", type=int, default=4, help="worker processes")
+    parser.add_argument("--concurrency", type=int, default=news_scraper.LLM_MAX_CONCURRENCY,
+                        help="LLM requests in flight per process")
+    parser.add_argument("--model", default=news_scraper.LLM_MODEL)
+    parser.add_argument("--stocks-csv", default=STOCKS_CSV)
+    parser.add_argument("--cluster", action="store_true", help="analyze one article per near-duplicate story")
+    parser.add_argument("--checkpoint", default=REPLAY_CHECKPOINT_FILE)
+    parser.add_argument("--fresh", action="store_true", help="discard the checkpoint and start over")
+    parser.add_argument("--diff-output", help="also write the hit diff to this JSON file")
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY",
+                        help="answer from a local fake OpenAI server with this latency in seconds")
+    args = parser.parse_args()
+    archive = args.archive
+    if archive is None:
+        has_runs = os.path.isdir(results_log.RESULTS_LOG_DIR) and retained_since(results_log.RESULTS_LOG_DIR)
+        archive = (results_log.RESULTS_LOG_DIR if has_runs
+                   else ARCHIVE_DB if os.path.exists(ARCHIVE_DB) else LEGACY_ARCHIVE_JSON)
+    oldest = retained_since(archive)
+    if oldest is None:
+        raise SystemExit(f"{archive} holds no runs to replay")
+    if args.since is not None and args.since < oldest:
+        raise SystemExit(f"{archive} only holds complete runs since {oldest}; it cannot replay from {args.since}")
+    since = args.since or oldest
+    print(f"Replaying the runs in {archive} from {since}" + (f" until {args.until}" if args.until else ""))
+
+    if args.fake_llm is not None:
+        start_fake_llm(args.fake_llm)
+    load_stock_universe(args.stocks_csv)  # downloads the default list if needed, once, before the workers start
+    news_scraper.LLM_MODEL = args.model
+    config = dict(config_fingerprint(args.stocks_csv), archive=archive, cluster=args.cluster,
+                  since=since, until=args.until)
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint_config, done = load_checkpoint(args.checkpoint)
+    if checkpoint_config is not None and checkpoint_config != config:
+        print(f"{args.checkpoint} was written with {checkpoint_config}, not {config}; "
+              f"pass --fresh or another --checkpoint")
+        return
+    if done:
+        print(f"Resuming after {len(done)} finished runs in {args.checkpoint}")
+
+    pending, articles = [], []
+    for timestamp, run_articles, siblings in replay_runs(archive, args.cluster, args.stocks_csv, since, args.until):
+        articles.extend(run_articles)
+        if timestamp not in done:
+            pending.append((timestamp, run_articles, siblings))
+    total = len(done) + len(pending)
+
+    options = {
+        "model": args.model,
+        "stocks_csv": args.stocks_csv,
+        "concurrency": args.concurrency,
+        "tokens_per_minute": news_scraper.LLM_TOKENS_PER_MINUTE / args.processes
+    }
+    results = list(done.values())
+    start = time.perf_counter()
+    with open(args.checkpoint, "a", encoding="utf-8") as checkpoint:
+        if checkpoint_config is None:
+            append_checkpoint(checkpoint, {"type": "config", "config": config})
+        with multiprocessing.Pool(args.processes, initializer=init_worker, initargs=(options,)) as pool:
+            for result in pool.imap_unordered(analyze_run, pending):
+                append_checkpoint(checkpoint, result)
+                results.append(result)
+                print(f"[{len(results)}/{total}] run {result['run']}: {result['articles']} articles, "
+                      f"{result['batches']} LLM calls, {len(result['hits'])} hits"
+                      + (f", {result['failed_batches']} failed batches" if result["failed_batches"] else ""))
+    elapsed = time.perf_counter() - start
+
+    analyzed = sum(result["articles"] for result in results if result["run"] not in done)
+    calls = sum(result["batches"] for result in results if result["run"] not in done)
+    seconds = max(elapsed, 1e-9)
+    print(f"Replayed {len(pending)} runs, {analyzed} articles and {calls} LLM calls in {elapsed:.1f}s "
+          f"({len(pending) / seconds:.1f} runs/s, {analyzed / seconds:.1f} articles/s, {calls / seconds:.1f} calls/s)")
+
+    added, removed, kept = diff_hits(results, articles)
+    print(f"Hits against the recorded results for these {len(articles)} articles: "
+          f"{len(kept)} unchanged, {len(added)} new, {len(removed)} no longer found")
+    for label, pairs in (("+", added), ("-", removed)):
+        for code, url in pairs[:20]:
+            print(f"  {label} {code} {url}")
+        if len(pairs) > 20:
+            print(f"  {label} ... {len(pairs) - 20} more")
+    if args.diff_output:
+        write_json(args.diff_output, {
+            "config": config,
+            "archive": archive,
+            "runs": total,
+            "articles": len(articles),
+            "unchanged": [list(pair) for pair in kept],
+            "added": [list(pair) for pair in added],
+            "removed": [list(pair) for pair in removed]
+        })
+
+
+if __name__ == "__main__":
+    main()
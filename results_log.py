@@ -0,0 +1,197 @@
+"""Append-only log of analysis results, one compact JSON line per run and per hit
+
+Each scraper run appends a "run" record (article and batch counts, failed
+batches with their stock codes, the run's new articles and the indexes of
+the ones the LLM gave a verdict on) and one "hit" record per stock/news pair the
+LLM confirmed, referencing the stock by its code (with the URLs of the
+same story on other outlets, if any). Copies of a story published after its
+hit was logged add a "siblings" record for that hit. The active file,
+results_log/analysis.jsonl, only grows by those few lines per run; once it
+reaches RESULTS_LOG_MAX_BYTES it is gzipped into a segment named after the
+first and last timestamps it holds, which never changes again. Queries
+stream the records and skip segments outside the requested time range.
+
+Usage: python results_log.py [--stock THYAO ...] [--since 2025-03-01] [--until 2025-03-04T12:00] [--runs | --siblings]
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+
+from state_file import atomic_open
+
+RESULTS_LOG_DIR = os.environ.get("RESULTS_LOG_DIR", "results_log")
+RESULTS_LOG_MAX_BYTES = int(os.environ.get("RESULTS_LOG_MAX_BYTES", str(1024 * 1024)))
+
+ACTIVE_FILE = "analysis.jsonl"
+SEGMENT_PATTERN = re.compile(r"^analysis-(\d{8}T\d{6})-(\d{8}T\d{6})(?:-\d+)?\.jsonl\.gz$")
+
+
+def run_records(timestamp, analysis_results, new_articles, degraded_sources, duplicates=0, gated=0, articles=None):
+    """Build the run record and the hit records of one scraper run; articles lists the run's new article URLs
+
+    With articles, the judged articles are logged as indexes into them.
+    """
+    failed = [
+        {"batch": batch["batch"], "stocks": batch["stocks"], "error": batch["error"]}
+        for batch in analysis_results.get("batch_results", []) if batch.get("error")
+    ]
+    records = [{
+        "type": "run",
+        "ts": timestamp,
+        "new_articles": new_articles,
+        "duplicates": duplicates,
+        "gated": gated,
+        "degraded_sources": degraded_sources,
+        "batches": analysis_results.get("total_batches", 0),
+        "batch_strategy": analysis_results.get("batch_strategy"),
+        "estimated_prompt_tokens": analysis_results.get("estimated_prompt_tokens", 0),
+        "cached_verdicts": analysis_results.get("cached_verdicts", 0),
+        "failed_batches": failed,
+        "hits": len(analysis_results["direct_news"]),
+        "judged": analysis_results.get("judged_articles", [])
+    }]
+    if articles is not None:
+        records[0]["articles"] = list(articles)
+        positions = {url: i for i, url in enumerate(records[0]["articles"])}
+        records[0]["judged"] = [positions[url] for url in records[0]["judged"]]
+    for news in analysis_results["direct_news"]:
+        record = {"type": "hit", "ts": timestamp, "stock": news["hisse_kodu"], "url": news["haber_url"]}
+        if news.get("sibling_urls"):
+            record["siblings"] = news["sibling_urls"]
+        records.append(record)
+    return records
+
+
+def judged_urls(record):
+    """Return the URLs of the articles a run record's LLM verdicts cover"""
+    articles = record.get("articles", [])
+    return [articles[judged] if isinstance(judged, int) else judged for judged in record.get("judged", [])]
+
+
+def sibling_records(timestamp, late_siblings):
+    """Build the records that attach {(stock code, hit URL): [URLs]} late copies of a story to its earlier hits"""
+    return [{"type": "siblings", "ts": timestamp, "stock": code, "url": url, "siblings": urls}
+            for (code, url), urls in sorted(late_siblings.items())]
+
+
+def append(records, log_dir=None, max_bytes=None):
+    """Append records to the active file, rotating it once it is large enough"""
+    log_dir = log_dir or RESULTS_LOG_DIR
+    max_bytes = max_bytes or RESULTS_LOG_MAX_BYTES
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, ACTIVE_FILE)
+    data = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+    with open(path, "a+b") as f:
+        # Start on a fresh line if an interrupted append left half a record behind
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = "\n" + data
+        f.write(data.encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.getsize(path) >= max_bytes:
+        rotate(log_dir)
+
+
+def _stamp(timestamp):
+    return re.sub(r"[-:]", "", timestamp)[:15]
+
+
+def _unstamp(stamp):
+    return f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:8]}T{stamp[9:11]}:{stamp[11:13]}:{stamp[13:15]}"
+
+
+def rotate(log_dir=None):
+    """Compress the active file into a segment named after the time range it covers; returns its path"""
+    log_dir = log_dir or RESULTS_LOG_DIR
+    path = os.path.join(log_dir, ACTIVE_FILE)
+    timestamps = [record["ts"] for record in read_records(path)]
+    if not timestamps:
+        return None
+    name = f"analysis-{_stamp(min(timestamps))}-{_stamp(max(timestamps))}"
+    segment = os.path.join(log_dir, f"{name}.jsonl.gz")
+    suffix = 1
+    while os.path.exists(segment):
+        suffix += 1
+        segment = os.path.join(log_dir, f"{name}-{suffix}.jsonl.gz")
+    with open(path, "rb") as src, atomic_open(segment, "wb") as dst:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=dst, mtime=0) as gz:
+            shutil.copyfileobj(src, gz)
+    os.remove(path)
+    return segment
+
+
+def log_files(log_dir=None):
+    """List [(first timestamp, last timestamp, path)] oldest first; the active file has no range"""
+    log_dir = log_dir or RESULTS_LOG_DIR
+    if not os.path.isdir(log_dir):
+        return []
+    files = []
+    for name in os.listdir(log_dir):
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            files.append((_unstamp(match.group(1)), _unstamp(match.group(2)), os.path.join(log_dir, name)))
+    files.sort()
+    active = os.path.join(log_dir, ACTIVE_FILE)
+    if os.path.exists(active):
+        files.append((None, None, active))
+    return files
+
+
+def read_records(path):
+    """Yield the records of one log file, skipping a line cut short by an interrupted append"""
+    if not os.path.exists(path):
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def query(stocks=None, since=None, until=None, record_type="hit", log_dir=None):
+    """Yield records of one type, oldest first, for the given stock codes with since <= ts < until
+
+    since and until are ISO timestamps or prefixes of one ("2025-03-04").
+    """
+    stocks = set(stocks) if stocks else None
+    for first, last, path in log_files(log_dir):
+        # Segment names are truncated to the second
+        if since and last is not None and last < since[:19]:
+            continue
+        if until and first is not None and first >= until:
+            continue
+        for record in read_records(path):
+            if record.get("type") != record_type:
+                continue
+            if (since and record["ts"] < since) or (until and record["ts"] >= until):
+                continue
+            if stocks is not None and record.get("stock") not in stocks:
+                continue
+            yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print logged analysis results as JSON lines")
+    parser.add_argument("--stock", nargs="*", help="stock codes to print hits for (default all)")
+    parser.add_argument("--since", help="earliest run timestamp, inclusive (e.g. 2025-03-01)")
+    parser.add_argument("--until", help="latest run timestamp, exclusive")
+    parser.add_argument("--runs", action="store_true", help="print run records instead of hits")
+    parser.add_argument("--siblings", action="store_true", help="print late copies attached to earlier hits")
+    parser.add_argument("--dir", default=RESULTS_LOG_DIR, help="log directory")
+    args = parser.parse_args()
+
+    record_type = "run" if args.runs else "siblings" if args.siblings else "hit"
+    for record in query(args.stock, args.since, args.until, record_type, args.dir):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
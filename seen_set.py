@@ -0,0 +1,101 @@
+"""Compact, persisted set of article keys seen over a long horizon
+
+Each article key is stored as a 64-bit hash next to the day it was last seen
+(12 bytes per article), kept sorted for binary-search lookups. A year of
+articles from all sources fits in a few MB.
+"""
+import hashlib
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import date
+
+from state_file import atomic_open
+
+SEEN_SET_FILE = "seen_articles.bin"
+
+_MAGIC = b"SEEN1"
+_HEADER = struct.Struct("<5sQ")
+
+
+def key_hash(key):
+    """Return the 64-bit hash of an article key"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def day_number(day=None):
+    """Return the number of days since 1970-01-01 for a date (today by default)"""
+    return ((day or date.today()) - date(1970, 1, 1)).days
+
+
+class SeenSet:
+    """Sorted 64-bit key hashes with the day each key was last seen"""
+
+    def __init__(self, hashes=None, days=None):
+        self.hashes = hashes if hashes is not None else array("Q")
+        self.days = days if days is not None else array("H")
+        self.pending = {}  # additions not merged into the sorted arrays yet
+
+    def __len__(self):
+        return len(self.hashes) + len(self.pending)
+
+    def __contains__(self, key):
+        h = key_hash(key)
+        if h in self.pending:
+            return True
+        i = bisect_left(self.hashes, h)
+        return i < len(self.hashes) and self.hashes[i] == h
+
+    def add(self, key, day=None):
+        """Mark a key as seen on the given day number (today by default)"""
+        h = key_hash(key)
+        day = day_number() if day is None else day
+        i = bisect_left(self.hashes, h)
+        if i < len(self.hashes) and self.hashes[i] == h:
+            self.days[i] = max(self.days[i], day)
+        else:
+            self.pending[h] = max(self.pending.get(h, 0), day)
+
+    def prune(self, min_day):
+        """Merge pending additions and drop keys not seen since min_day"""
+        merged = {h: d for h, d in zip(self.hashes, self.days) if d >= min_day}
+        merged.update((h, d) for h, d in self.pending.items() if d >= min_day)
+        ordered = sorted(merged)
+        self.hashes = array("Q", ordered)
+        self.days = array("H", (merged[h] for h in ordered))
+        self.pending = {}
+
+    @classmethod
+    def load(cls, path=SEEN_SET_FILE):
+        """Load a seen-set file; returns None if it does not exist or is unreadable"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                magic, count = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC:
+                    raise ValueError("not a seen-set file")
+                hashes, days = array("Q"), array("H")
+                hashes.fromfile(f, count)
+                days.fromfile(f, count)
+        except Exception as e:
+            print(f"Error loading seen-set {path}: {e}")
+            return None
+        if sys.byteorder == "big":
+            hashes.byteswap()
+            days.byteswap()
+        return cls(hashes, days)
+
+    def save(self, path=SEEN_SET_FILE, min_day=0):
+        """Prune keys older than min_day and write the set to disk (little-endian)"""
+        self.prune(min_day)
+        hashes, days = array("Q", self.hashes), array("H", self.days)
+        if sys.byteorder == "big":
+            hashes.byteswap()
+            days.byteswap()
+        with atomic_open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(hashes)))
+            hashes.tofile(f)
+            days.tofile(f)
@@ -0,0 +1,16 @@
+"""Split long value lists for SQLite IN (...) clauses
+
+SQLite's default limit on host parameters in one statement is 999, so
+lookups over many keys run one statement per chunk, leaving room for the
+statement's other parameters.
+"""
+
+CHUNK_SIZE = 500
+
+
+def parameter_chunks(values, size=CHUNK_SIZE):
+    """Yield (chunk, placeholders) for consecutive chunks of values, with one "?" per value in placeholders"""
+    values = list(values)
+    for i in range(0, len(values), size):
+        chunk = values[i : i + size]
+        yield chunk, ",".join("?" * len(chunk))
@@ -0,0 +1,33 @@
+"""Atomic writes for the state files the workflows commit and the next run reads
+
+A run killed mid-write (job timeout, cancelled workflow, daemon restart)
+would otherwise leave a truncated file behind. Files are written to a
+temporary file next to the target, synced and renamed over it, so readers
+see either the old or the new content.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path, mode="w"):
+    """Open a temporary file that replaces path when the block finishes without an error"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json(path, data, indent=2):
+    """Write data as JSON to path atomically"""
+    with atomic_open(path) as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
@@ -0,0 +1,229 @@
+"""Local prefilter that finds BIST 100 company mentions before any LLM call
+
+Company names from bist_100_hisseleri.csv and the brand aliases in
+stock_aliases.json are folded to ASCII with Turkish case rules (I/ı, İ/i,
+ş, ğ, ...) and compiled into an Aho-Corasick automaton. Article URL slugs
+(and titles, when available) are folded the same way and scanned in one
+pass, producing candidate (article, stock) pairs for the LLM to confirm.
+
+Run `python stock_matcher.py` to check recall against past LLM results and
+estimate how many LLM calls the prefilter saves.
+"""
+import json
+import os
+import re
+from collections import deque
+from urllib.parse import urlsplit
+
+ALIASES_FILE = "stock_aliases.json"
+
+_TURKISH_UPPER = str.maketrans({"I": "ı", "İ": "i"})
+_TURKISH_ASCII = str.maketrans({
+    "ı": "i", "ş": "s", "ğ": "g", "ü": "u", "ö": "o", "ç": "c",
+    "â": "a", "î": "i", "û": "u", "\u0307": None
+})
+_apostrophes = re.compile(r"['’`]")
+_non_alnum = re.compile(r"[^a-z0-9]+")
+_article_id = re.compile(r"(?:_id)?\d{5,}")
+
+# Words that say nothing about which company a name refers to
+GENERIC_WORDS = {
+    "ve", "as", "sanayi", "sanayii", "ticaret", "holding", "yatirim", "yatirimlar", "yatirimlari",
+    "ortakligi", "fabrikalari", "fabrikasi", "isletmeleri", "grubu", "grup"
+}
+# Leading name words too common in economy news to be used on their own
+AMBIGUOUS_WORDS = {
+    "turk", "turkiye", "anadolu", "ege", "enerji", "emlak", "konya", "kayseri", "smart", "galata",
+    "pasifik", "net", "hayal", "tab", "yayla", "bosch", "ford", "koza", "aksa", "akfen", "borusan",
+    "vestel", "eczacibasi", "europen", "europower", "oyak", "limak", "dogan"
+}
+# Turkish case and possessive suffixes allowed after a short alias ("thy'nin", "bim'den")
+SHORT_ALIAS_SUFFIXES = {
+    "", "in", "nin", "un", "nun", "a", "e", "ya", "ye", "i", "yi", "u", "yu", "da", "de", "ta", "te",
+    "dan", "den", "tan", "ten", "la", "le", "yla", "yle", "ca", "ce", "nda", "nde", "ndan", "nden"
+}
+SHORT_ALIAS_LENGTH = 4
+
+
+def turkish_fold(text):
+    """Lower-case with Turkish rules, fold to ASCII and reduce to space-separated words"""
+    text = text.translate(_TURKISH_UPPER).lower().translate(_TURKISH_ASCII)
+    text = _apostrophes.sub("", text)
+    return " ".join(_non_alnum.sub(" ", text).split())
+
+
+def url_slug_text(url):
+    """Return the folded words of a news URL's path, without numeric article IDs"""
+    path = urlsplit(url).path.lower()
+    if path.endswith(".html"):
+        path = path[:-5]
+    return turkish_fold(_article_id.sub(" ", path))
+
+
+def derive_aliases(code, name):
+    """Return the folded aliases a company is recognized by: its code and its distinctive name prefixes"""
+    aliases = set()
+    if turkish_fold(code) not in AMBIGUOUS_WORDS:
+        aliases.add(turkish_fold(code))
+    words = [word for word in turkish_fold(name).split() if word not in GENERIC_WORDS]
+    if len(words) >= 2:
+        aliases.add(" ".join(words[:2]))
+    if words and len(words[0]) >= 4 and words[0] not in AMBIGUOUS_WORDS and not words[0].isdigit():
+        aliases.add(words[0])
+    return aliases
+
+
+def stock_aliases(stocks, extra_aliases=None):
+    """Return {stock code: folded aliases} from the derived aliases and hand-curated extra ones"""
+    extra_aliases = extra_aliases or {}
+    aliases = {}
+    for stock in stocks:
+        folded = derive_aliases(stock["kod"], stock["adi"])
+        folded.update(turkish_fold(alias) for alias in extra_aliases.get(stock["kod"], []))
+        aliases[stock["kod"]] = sorted(alias for alias in folded if alias)
+    return aliases
+
+
+class StockMatcher:
+    """Aho-Corasick automaton over folded company aliases"""
+
+    def __init__(self, aliases_by_code):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # per state: list of (alias, stock code)
+        for code, aliases in aliases_by_code.items():
+            for alias in aliases:
+                self._add(" " + alias, code)
+        self._build_failure_links()
+
+    def _add(self, pattern, code):
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((pattern[1:], code))
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def match_folded(self, text):
+        """Return the stock codes mentioned in already-folded text"""
+        text = " " + text + " "
+        codes = set()
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for alias, code in self.output[state]:
+                if code in codes:
+                    continue
+                # The alias must end a word, or be followed only by a Turkish suffix if it is short
+                word_end = text.index(" ", i + 1)
+                if len(alias) > SHORT_ALIAS_LENGTH or text[i + 1 : word_end] in SHORT_ALIAS_SUFFIXES:
+                    codes.add(code)
+        return codes
+
+    def match(self, text):
+        """Return the stock codes mentioned in free text"""
+        return self.match_folded(turkish_fold(text))
+
+    def candidates(self, articles, titles=None):
+        """Map stock code -> article URLs that may mention it, from URL slugs and optional {url: title}"""
+        titles = titles or {}
+        pairs = {}
+        for url in articles:
+            text = url_slug_text(url)
+            if url in titles:
+                text += " " + turkish_fold(titles[url])
+            for code in self.match_folded(text):
+                pairs.setdefault(code, []).append(url)
+        return pairs
+
+
+def load_aliases(path=ALIASES_FILE):
+    """Load the hand-curated brand aliases per stock code"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_stock_matcher(stocks, alias_path=ALIASES_FILE):
+    """Build a matcher for the given stocks and the alias table"""
+    return StockMatcher(stock_aliases(stocks, load_aliases(alias_path)))
+
+
+def recorded_hits():
+    """Collect (stock code, URL) pairs confirmed by the LLM in past runs"""
+    hits = set()
+    if os.path.exists("stock_news_mapping.json"):
+        with open("stock_news_mapping.json", "r", encoding="utf-8") as f:
+            for code, data in json.load(f).get("stock_news", {}).items():
+                hits.update((code, url) for url in data.get("haberler", []))
+    from results_log import query
+
+    hits.update((record["stock"], record["url"]) for record in query())
+    return hits
+
+
+def archived_runs():
+    """Rebuild the new-article set of each archived run from news_archive.json"""
+    if not os.path.exists("news_archive.json"):
+        return []
+    with open("news_archive.json", "r", encoding="utf-8") as f:
+        entries = sorted(json.load(f).get("entries", []), key=lambda entry: entry["timestamp"])
+    seen = set()
+    runs = []
+    for entry in entries:
+        runs.append([link for link in entry["news_links"] if link not in seen])
+        seen.update(entry["news_links"])
+    return runs
+
+
+def evaluate():
+    """Print recall against past LLM hits and the LLM call/prompt reduction over archived runs"""
+    from stock_universe import load_stock_universe
+
+    universe = load_stock_universe()
+    stocks = universe.stocks
+    matcher = universe.get_matcher()
+
+    hits = recorded_hits()
+    found = [(code, url) for code, url in sorted(hits) if code in matcher.candidates([url])]
+    print(f"Recall on {len(hits)} recorded LLM hits: {len(found) / max(len(hits), 1):.0%}")
+    for code, url in sorted(hits - set(found)):
+        print(f"  missed {code}: {url}")
+
+    batch_size = 10
+    baseline_calls = prefilter_calls = baseline_urls = prefilter_urls = 0
+    for run in archived_runs():
+        if not run:
+            continue
+        full_batches = -(-len(stocks) // batch_size)
+        baseline_calls += full_batches
+        baseline_urls += full_batches * len(run)
+        candidates = matcher.candidates(run)
+        codes = sorted(candidates)
+        for i in range(0, len(codes), batch_size):
+            prefilter_calls += 1
+            prefilter_urls += len({url for code in codes[i : i + batch_size] for url in candidates[code]})
+    print(f"LLM calls over archived runs: {baseline_calls} -> {prefilter_calls}")
+    print(f"Article URLs embedded in prompts (proxy for prompt tokens): {baseline_urls} -> {prefilter_urls}")
+
+
+if __name__ == "__main__":
+    evaluate()
@@ -0,0 +1,69 @@
+"""BIST 100 stock universe, loaded once per process
+
+bist_100_hisseleri.csv is read with the csv module (and downloaded if
+missing) into an index of the stocks in file order, by code and by name,
+with each stock's folded aliases from stock_matcher and stock_aliases.json.
+The index and the matcher built from it are reused until either file
+changes, so a long-running process does not reread them every cycle.
+"""
+import csv
+import os
+import threading
+
+from stock_matcher import ALIASES_FILE, StockMatcher, load_aliases, stock_aliases
+
+STOCKS_CSV = "bist_100_hisseleri.csv"
+STOCKS_CSV_URL = "https://raw.githubusercontent.com/burakemretetik/news_signal/master/bist_100_hisseleri.csv"
+
+_universe = None
+_universe_lock = threading.Lock()
+
+
+class StockUniverse:
+    """Stocks with lookups by code and name, their folded aliases and a lazily built matcher"""
+
+    def __init__(self, stocks, extra_aliases=None):
+        self.stocks = stocks  # [{"kod", "adi"}] in file order
+        self.by_code = {stock["kod"]: stock for stock in stocks}
+        self.name_to_code = {stock["adi"]: stock["kod"] for stock in stocks}
+        self.aliases = stock_aliases(stocks, extra_aliases)
+        self._matcher = None
+
+    def get_matcher(self):
+        """Return the stock mention matcher, building it on first use"""
+        if self._matcher is None:
+            self._matcher = StockMatcher(self.aliases)
+        return self._matcher
+
+
+def _file_version(path):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def download_stocks_csv(csv_path=STOCKS_CSV):
+    """Download the BIST 100 stock list from the repository"""
+    import requests
+
+    print("Downloading BIST 100 stocks data...")
+    response = requests.get(STOCKS_CSV_URL, timeout=30)
+    response.raise_for_status()
+    with open(csv_path, "wb") as f:
+        f.write(response.content)
+
+
+def read_stocks_csv(csv_path=STOCKS_CSV):
+    """Read [{"kod", "adi"}] from the stock list CSV"""
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        return [{"kod": row["Hisse Kodu"], "adi": row["Hisse Adı"]} for row in csv.DictReader(f)]
+
+
+def load_stock_universe(csv_path=STOCKS_CSV, alias_path=ALIASES_FILE):
+    """Return the stock universe, rebuilding it only when the CSV or the alias file changed"""
+    global _universe
+    with _universe_lock:
+        if not os.path.exists(csv_path):
+            download_stocks_csv(csv_path)
+        version = (csv_path, _file_version(csv_path), alias_path, _file_version(alias_path))
+        if _universe is None or _universe[0] != version:
+            _universe = (version, StockUniverse(read_stocks_csv(csv_path), load_aliases(alias_path)))
+        return _universe[1]
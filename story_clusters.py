@@ -0,0 +1,205 @@
+"""Near-duplicate story clustering across outlets
+
+The same announcement usually shows up on several sources within minutes.
+Each new article's URL slug (and title, when available) is folded like the
+stock matcher does, stripped of stop words and section names and cut to
+five-character stems, which absorbs most Turkish suffixes. Stem sets get a
+MinHash signature whose bands form an LSH index; articles sharing a band are
+compared by their exact Jaccard similarity. An article joins the most
+similar cluster that has no article from its own outlet yet, or starts a
+cluster of its own. Only a cluster's representative (its first article, or
+the one whose slug names a stock) is analyzed, and its hits carry the
+sibling URLs.
+
+Clusters are kept in story_clusters.db for CLUSTER_WINDOW_HOURS, so a copy
+that arrives a run later is absorbed instead of analyzed again.
+"""
+import hashlib
+import os
+import random
+import sqlite3
+import time
+from array import array
+from urllib.parse import urlsplit
+
+from stock_matcher import turkish_fold, url_slug_text
+from url_canonical import article_key
+
+STORY_CLUSTERS_DB = "story_clusters.db"
+CLUSTER_SIMILARITY = float(os.environ.get("CLUSTER_SIMILARITY", "0.5"))
+CLUSTER_WINDOW_HOURS = float(os.environ.get("CLUSTER_WINDOW_HOURS", "6"))
+
+NUM_HASHES = 32
+BANDS = 16  # two rows per band: pairs at Jaccard 0.5 share a band with probability 0.99
+ROWS_PER_BAND = NUM_HASHES // BANDS
+STEM_LENGTH = 5
+MIN_STEMS = 3  # shorter slugs are too generic to cluster
+
+# Folded stop words and URL section names
+STOP_WORDS = {
+    "ve", "ile", "bir", "bu", "da", "de", "mi", "mu", "ne", "icin", "gibi", "daha", "en", "son", "ilk",
+    "olarak", "oldu", "olan", "yeni", "dakika", "haber", "haberler", "haberleri", "ekonomi", "galeri",
+    "teknoloji", "finans", "piyasa", "piyasalar", "gundem", "video", "foto", "www", "html", "id",
+}
+
+# One random 64-bit mask per hash function, XORed onto each stem's hash
+_rng = random.Random(7)
+_MASKS = [_rng.getrandbits(64) for _ in range(NUM_HASHES)]
+
+
+def slug_stems(url, title=None):
+    """Return the set of stems that describe an article's story"""
+    text = url_slug_text(url)
+    if title:
+        text += " " + turkish_fold(title)
+    return frozenset(word[:STEM_LENGTH] for word in text.split() if len(word) > 1 and word not in STOP_WORDS)
+
+
+def _stem_hash(stem):
+    return int.from_bytes(hashlib.blake2b(stem.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(stems):
+    """Return the MinHash signature of a non-empty stem set"""
+    hashes = [_stem_hash(stem) for stem in stems]
+    return [min(h ^ mask for h in hashes) for mask in _MASKS]
+
+
+def band_keys(signature):
+    """Split a signature into the LSH bucket keys of its bands"""
+    return [(band, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def source_of(url):
+    """Return the outlet (host without www.) an article comes from"""
+    host = urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class ClusterIndex:
+    """LSH index over the stems of recently clustered articles"""
+
+    def __init__(self):
+        self.stems = {}  # article key -> stems
+        self.cluster_of = {}  # article key -> representative's article key
+        self.sources = {}  # representative's article key -> outlets in the cluster
+        self.urls = {}  # article key -> URL
+        self.buckets = {}
+
+    def add(self, key, url, cluster, source, stems, signature):
+        """Index an article; signature is None for articles too short to cluster"""
+        self.cluster_of[key] = cluster
+        self.urls[key] = url
+        self.sources.setdefault(cluster, set()).add(source)
+        if signature is not None:
+            self.stems[key] = stems
+            for band_key in band_keys(signature):
+                self.buckets.setdefault(band_key, []).append(key)
+
+    def best_cluster(self, source, stems, signature, threshold):
+        """Return the cluster of the most similar article from another outlet, or None"""
+        if signature is None:
+            return None
+        candidates = {key for band_key in band_keys(signature) for key in self.buckets.get(band_key, ())}
+        best = None
+        for key in sorted(candidates):
+            cluster = self.cluster_of[key]
+            if source in self.sources[cluster]:
+                continue
+            similarity = jaccard(stems, self.stems[key])
+            if similarity >= threshold and (best is None or similarity > best[0]):
+                best = (similarity, cluster)
+        return best[1] if best else None
+
+
+def open_clusters(path=STORY_CLUSTERS_DB):
+    """Open (and create if needed) the story cluster database"""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS clustered_articles (
+            article_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            cluster TEXT NOT NULL,
+            source TEXT NOT NULL,
+            stems TEXT NOT NULL,
+            signature BLOB,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clustered_articles_created_at ON clustered_articles (created_at)")
+    conn.commit()
+    return conn
+
+
+def load_index(conn, min_created_at):
+    """Build the index from the articles clustered since min_created_at"""
+    index = ClusterIndex()
+    rows = conn.execute("""
+        SELECT article_key, url, cluster, source, stems, signature FROM clustered_articles
+        WHERE created_at >= ? ORDER BY created_at, article_key
+    """, (min_created_at,))
+    for key, url, cluster, source, stems, signature in rows:
+        if signature is not None:
+            signature = array("Q", signature).tolist()
+        index.add(key, url, cluster, source, frozenset(stems.split()), signature)
+    return index
+
+
+def assign_clusters(conn, articles, titles=None, now=None,
+                    threshold=CLUSTER_SIMILARITY, window_hours=CLUSTER_WINDOW_HOURS):
+    """Cluster new articles with each other and with the clusters of the last window_hours
+
+    Returns (representatives, siblings, absorbed): the articles to analyze in
+    their original order, {representative: [sibling URLs]} for clusters
+    started in this call, and {URL: representative URL} for the articles that
+    joined a cluster from an earlier run.
+    """
+    titles = titles or {}
+    now = now or time.time()
+    min_created_at = now - window_hours * 3600
+    with conn:
+        conn.execute("DELETE FROM clustered_articles WHERE created_at < ?", (min_created_at,))
+    index = load_index(conn, min_created_at)
+
+    representatives, siblings, absorbed, rows = [], {}, {}, []
+    started = {}  # representative's article key -> its URL, for clusters started in this call
+    for url in articles:
+        key = article_key(url)
+        if key in index.cluster_of:
+            # Clustered by a run that stopped before analyzing it
+            cluster = index.cluster_of[key]
+            if cluster == key:
+                representatives.append(url)
+            else:
+                absorbed[url] = index.urls[cluster]
+            continue
+        stems = slug_stems(url, titles.get(url))
+        source = source_of(url)
+        signature = minhash(stems) if len(stems) >= MIN_STEMS else None
+        cluster = index.best_cluster(source, stems, signature, threshold)
+        if cluster is None:
+            cluster = key
+            started[key] = url
+            representatives.append(url)
+        elif cluster in started:
+            siblings.setdefault(started[cluster], []).append(url)
+        else:
+            absorbed[url] = index.urls[cluster]
+        index.add(key, url, cluster, source, stems, signature)
+        rows.append((key, url, cluster, source, " ".join(sorted(stems)),
+                     array("Q", signature).tobytes() if signature is not None else None, now))
+
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO clustered_articles VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return representatives, siblings, absorbed
+
+
+def move_representatives(conn, moved):
+    """Make another article of each cluster its representative, from {old representative URL: new URL}"""
+    with conn:
+        conn.executemany("UPDATE clustered_articles SET cluster = ? WHERE cluster = ?",
+                         [(article_key(new), article_key(old)) for old, new in moved.items()])
@@ -0,0 +1,67 @@
+"""URL canonicalization and article keys used for deduplication
+
+canonicalize_url() normalizes the parts of a link that do not change the
+page (scheme, host case, default ports, tracking parameters, fragments).
+article_key() goes further and reduces a link to the numeric article ID the
+news sites embed in their URLs, so that variants of the same story (CNN
+Türk /galeri/ pages, trailing slashes, http/https) share one key.
+"""
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "yclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "_ga"}
+TRACKING_PREFIXES = ("utm_",)
+
+# Host (without "www.") -> (source name, pattern capturing the article ID in the path)
+SOURCE_ID_PATTERNS = {
+    "haberturk.com": ("haberturk", re.compile(r"-(\d{6,})(?:-[a-z-]+)?$")),
+    "trthaber.com": ("trthaber", re.compile(r"-(\d{5,})\.html$")),
+    "cnnturk.com": ("cnnhaber", re.compile(r"-(\d{6,})$")),
+    "bloomberght.com": ("bloomberght", re.compile(r"-(\d{6,})$")),
+    "bigpara.hurriyet.com.tr": ("bigpara", re.compile(r"_ID(\d+)$")),
+}
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_repeated_slashes = re.compile(r"/{2,}")
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """Return the canonical form of a news URL"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme in ("", "http"):
+        scheme = "https"
+
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = _repeated_slashes.sub("/", parts.path) or "/"
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def article_key(url):
+    """Return a dedup key for a news URL: 'source:article_id' when the ID is known, else the canonical URL"""
+    canonical = canonicalize_url(url)
+    parts = urlsplit(canonical)
+    host = parts.hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+
+    rule = SOURCE_ID_PATTERNS.get(host)
+    if rule:
+        source, pattern = rule
+        match = pattern.search(path)
+        if match:
+            return f"{source}:{match.group(1)}"
+    return urlunsplit((parts.scheme, parts.netloc, path or "/", parts.query, ""))
@@ -0,0 +1,138 @@
+"""Concurrent WhatsApp Cloud API sender with rate limiting and selective retries
+
+Messages share one pooled HTTP session and a messages-per-second token
+bucket. Each recipient's messages go out in order on a single worker, while
+different recipients are served in parallel. A message that hits a 429, a
+5xx, a Graph API throughput error or a failure to connect is retried with
+jittered exponential backoff (or after the server's Retry-After). A read
+timeout or a dropped connection is not retried: the Graph API may already
+have accepted the message, and a duplicate alert is worse than a missed one.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+# Graph API error codes for throughput and per-recipient ("pair") rate limits
+RATE_LIMIT_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
+# Graph API error codes for a template (or its parameters) that was rejected before delivery
+TEMPLATE_ERROR_CODES = {132000, 132001, 132005, 132007, 132012, 132015, 132016}
+
+
+class WhatsAppError(Exception):
+    """Error response from the Graph API"""
+
+    def __init__(self, message, status_code=None, error_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+def create_session(pool_size):
+    """Return a requests session with a keep-alive pool sized for the sender threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def post_message(session, url, token, payload, timeout):
+    """Post one message and return its WhatsApp message id; raises WhatsAppError on an error response"""
+    response = session.post(url, headers={"Authorization": f"Bearer {token}"}, json=payload, timeout=timeout)
+    if response.ok:
+        return response.json().get("messages", [{}])[0].get("id", "unknown")
+
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        error = {}
+    try:
+        retry_after = float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        retry_after = None
+    raise WhatsAppError(
+        f"{response.status_code} {error.get('message') or response.reason}",
+        status_code=response.status_code,
+        error_code=error.get("code"),
+        retry_after=retry_after
+    )
+
+
+def failed_before_sending(error):
+    """Check whether a requests error happened before the request could reach the server"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or isinstance(error, requests.Timeout):
+        return False
+    # requests wraps urllib3's MaxRetryError, whose reason says what went wrong
+    reason = getattr(error.args[0], "reason", error.args[0]) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def retry_delay(error, attempt, backoff_base=1.0, backoff_max=30.0):
+    """Return the seconds to wait before retrying after an error, or None if it is not retryable"""
+    if isinstance(error, WhatsAppError):
+        retryable = (error.status_code == 429 or (error.status_code or 0) >= 500
+                     or error.error_code in RATE_LIMIT_ERROR_CODES)
+        if not retryable:
+            return None
+        retry_after = error.retry_after
+    elif failed_before_sending(error):
+        retry_after = None
+    else:
+        return None
+
+    jitter = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+    return jitter if retry_after is None else retry_after + jitter
+
+
+def dispatch_messages(messages, send, max_concurrency=8, limiter=None, max_retries=4,
+                      backoff_base=1.0, backoff_max=30.0, on_result=None):
+    """Run send(message) for every message and return one outcome dict per message, in order
+
+    Messages with the same "to" are sent one after another in list order. An
+    outcome holds the "message_id" returned by send, or an "error" message,
+    plus the "attempts" made. on_result(message, outcome), if given, is called
+    from the worker thread as soon as a message is done.
+    """
+    def deliver(message):
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            attempt += 1
+            try:
+                return {"message_id": send(message), "error": None, "attempts": attempt}
+            except Exception as e:
+                delay = retry_delay(e, attempt - 1, backoff_base, backoff_max)
+                if delay is None or attempt > max_retries:
+                    return {"message_id": None, "error": f"{type(e).__name__}: {e}", "attempts": attempt}
+                metrics.inc("whatsapp_retries", error=type(e).__name__)
+                time.sleep(delay)
+
+    def run(indexes):
+        for i in indexes:
+            outcomes[i] = deliver(messages[i])
+            if on_result is not None:
+                on_result(messages[i], outcomes[i])
+
+    outcomes = [None] * len(messages)
+    by_recipient = {}
+    for i, message in enumerate(messages):
+        by_recipient.setdefault(message["to"], []).append(i)
+    queues = list(by_recipient.values())
+
+    if max_concurrency <= 1 or len(queues) <= 1:
+        for indexes in queues:
+            run(indexes)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(queues))) as executor:
+            list(executor.map(run, queues))
+    return outcomes